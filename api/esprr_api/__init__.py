@@ -36,6 +36,39 @@ class Settings(BaseSettings):
         "NSRDB_2022": Path("/d4/uaren/nsrdb/nsrdb_2022.zarr"),
     }
     sync_jobs_period: int = 15
+    # every this many sync_jobs passes checks all of the system data, to
+    # repair jobs lost from Redis, instead of only the modified system data
+    sync_jobs_full_pass_every: int = 40
+    # number of locations to keep the solar position of in each worker
+    solar_position_cache_size: int = 128
+    # degrees, locations closer than this may share a solar position. 0 only
+    # shares the position of identical locations, matching pvlib exactly.
+    # Deployments may opt in to e.g. 0.05, which moves a location by at most
+    # about 2.5 km and the solar position by about 0.025 degrees, changing the
+    # power by up to about 0.1% of its peak
+    solar_position_tolerance: float = 0.0
+    # directory to store the result timeseries and statistics in, or an S3
+    # compatible bucket (endpoint_url None for AWS), stored in MySQL if neither
+    result_store_path: Optional[Path] = None
+    result_store_s3_bucket: Optional[str] = None
+    result_store_s3_endpoint_url: Optional[str] = None
+    # seconds between sweeps of the results no longer referenced from MySQL
+    # out of the result store by sync_jobs, and the seconds a result is kept
+    # after it was stored, before the job storing it has saved the reference
+    result_store_sweep_period: int = 3600
+    result_store_sweep_grace: int = 3600
+    # threads to run the request handlers and their blocking database and
+    # result store calls in, off of the event loop
+    threadpool_size: int = 40
+    # bytes of decoded result tables to keep in memory in each API process
+    table_cache_max_bytes: int = 2**29
+    # bulk jobs of each user go to one of this many queues that workers take
+    # jobs from in turn, so one user's bulk runs do not hold up the others.
+    # This is not a limit per user: users hashed to the same queue share its
+    # turn, and any idle worker runs the next bulk job
+    bulk_queue_count: int = 8
+    # port for PreloadedGridWorker to serve prometheus metrics on
+    worker_metrics_port: Optional[int] = None
 
     class Config:
         env_prefix = "esprr_"
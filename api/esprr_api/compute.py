@@ -1,21 +1,44 @@
 import calendar
+from collections import OrderedDict
+from io import BytesIO
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
 from uuid import UUID
 
 
 from dask.base import tokenize  # type: ignore
 from fastapi import HTTPException
 import pandas as pd
+from pvlib import atmosphere, iam, inverter, irradiance  # type: ignore
+from pvlib import pvsystem as pvlib_pvsystem  # type: ignore
+from pvlib import spa, temperature, tracking  # type: ignore
 from pvlib.location import Location  # type: ignore
 from pvlib.pvsystem import PVSystem  # type: ignore
 from pvlib.tracking import SingleAxisTracker  # type: ignore
-from pvlib.modelchain import ModelChain  # type: ignore
+from pvlib.modelchain import (  # type: ignore
+    PVWATTS_CONFIG,
+    ModelChain,
+    ModelChainResult,
+)
 from pvlib.solarposition import get_solarposition  # type: ignore
+from prometheus_client import Counter  # type: ignore
 import numpy as np
 from shapely import geometry  # type: ignore
 
 
-from . import models, storage, utils
-from .data.nsrdb import NSRDBDataset, find_dataset_path
+from . import models, settings, storage, utils
+from .data.nsrdb import NSRDBDataset, SpatialIndexPoint, find_dataset_path
+
+
+logger = logging.getLogger(__name__)
+SOLAR_POSITION_CACHE_HITS = Counter(
+    "esprr_solar_position_cache_hits",
+    "Number of locations with solar position found in the cache",
+)
+SOLAR_POSITION_CACHE_MISSES = Counter(
+    "esprr_solar_position_cache_misses",
+    "Number of locations with solar position computed and added to the cache",
+)
 
 
 class CachedLocation(Location):
@@ -34,6 +57,60 @@ class CachedLocation(Location):
         return self._stored_solpos[1].copy()
 
 
+class SharedGeometryModelChain(ModelChain):
+    """
+    ModelChain that can take the solar position, airmass, and the
+    orientation and angle of incidence of the modules from the results of
+    another run over the same times, location, and system instead of
+    computing them again, since they do not depend on the irradiance.
+    The temperature used for the solar position is also taken from the other
+    run, so it should use the same temp_air.
+    """
+
+    _geometry: Optional[ModelChainResult] = None
+
+    @classmethod
+    def with_pvwatts(cls, system, location, **kwargs):
+        config = PVWATTS_CONFIG.copy()
+        config.update(kwargs)
+        return cls(system, location, **config)
+
+    def run_model_with_geometry(self, weather, geometry: ModelChainResult):
+        """Run the model with the geometry from the results of another run"""
+        if not weather.index.equals(geometry.times):
+            raise ValueError("Weather must have the same times as the geometry")
+        self._geometry = geometry
+        try:
+            return self.run_model(weather)
+        finally:
+            self._geometry = None
+
+    def _prep_inputs_solar_pos(self, weather):
+        if self._geometry is None:
+            return super()._prep_inputs_solar_pos(weather)
+        self.results.solar_position = self._geometry.solar_position
+        return self
+
+    def _prep_inputs_airmass(self):
+        if self._geometry is None:
+            return super()._prep_inputs_airmass()
+        self.results.airmass = self._geometry.airmass
+        return self
+
+    def _prep_inputs_tracking(self):
+        if self._geometry is None:
+            return super()._prep_inputs_tracking()
+        self.results.tracking = self._geometry.tracking
+        self.results.aoi = self._geometry.aoi
+        return self
+
+    def _prep_inputs_fixed(self):
+        if self._geometry is None:
+            return super()._prep_inputs_fixed()
+        self.results.aoi = self._geometry.aoi
+        return self
+
+
 def compute_single_location(
     system: models.PVSystem, data: models.SystemData
 ) -> pd.DataFrame:
@@ -73,13 +150,14 @@ def compute_single_location(
             surface_azimuth=system.tracking.azimuth,
         )
 
-    mc = ModelChain.with_pvwatts(system=pvsystem, location=location)
+    mc = SharedGeometryModelChain.with_pvwatts(system=pvsystem, location=location)
     mc.run_model(data.weather_data)
     ac: pd.Series = mc.results.ac
     dc: pd.Series = mc.results.dc
 
-    clr_mc = ModelChain.with_pvwatts(system=pvsystem, location=location)
-    clr_mc.run_model(data.clearsky_data)
+    # clearsky data has the same times and temp_air, so reuse the geometry
+    clr_mc = SharedGeometryModelChain.with_pvwatts(system=pvsystem, location=location)
+    clr_mc.run_model_with_geometry(data.clearsky_data, mc.results)
     clr_ac: pd.Series = clr_mc.results.ac
     clr_dc: pd.Series = clr_mc.results.dc
 
@@ -95,23 +173,370 @@ def compute_single_location(
     return out
 
 
-def compute_total_system_power(
-    system: models.PVSystem, dataset: NSRDBDataset
+# Parameters matching those pvlib uses in the ModelChain of compute_single_location
+DELTA_T = 67.0
+ATMOS_REFRACT = 0.5667
+TEMPERATURE_PARAMETERS = temperature.TEMPERATURE_MODEL_PARAMETERS["sapm"][
+    "open_rack_glass_polymer"
+]
+# limit the number of locations modeled at once to bound memory use
+LOCATION_BLOCK_SIZE = 16
+
+
+def _solar_time_terms(
+    times: pd.DatetimeIndex,
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """Compute the location independent terms of the NREL SPA algorithm,
+    which are the bulk of the work, as a column vector for each time.
+    Returns the apparent sidereal time, geocentric sun right ascension
+    and declination, and the equatorial horizontal parallax of the sun."""
+    unixtime = np.array(times.view(np.int64) / 10**9)
+    jd = spa.julian_day(unixtime)
+    jde = spa.julian_ephemeris_day(jd, DELTA_T)
+    jc = spa.julian_century(jd)
+    jce = spa.julian_ephemeris_century(jde)
+    jme = spa.julian_ephemeris_millennium(jce)
+    R = spa.heliocentric_radius_vector(jme)
+    L = spa.heliocentric_longitude(jme)
+    B = spa.heliocentric_latitude(jme)
+    Theta = spa.geocentric_longitude(L)
+    beta = spa.geocentric_latitude(B)
+    x0 = spa.mean_elongation(jce)
+    x1 = spa.mean_anomaly_sun(jce)
+    x2 = spa.mean_anomaly_moon(jce)
+    x3 = spa.moon_argument_latitude(jce)
+    x4 = spa.moon_ascending_longitude(jce)
+    delta_psi = spa.longitude_nutation(jce, x0, x1, x2, x3, x4)
+    delta_epsilon = spa.obliquity_nutation(jce, x0, x1, x2, x3, x4)
+    epsilon0 = spa.mean_ecliptic_obliquity(jme)
+    epsilon = spa.true_ecliptic_obliquity(epsilon0, delta_epsilon)
+    delta_tau = spa.aberration_correction(R)
+    lamd = spa.apparent_sun_longitude(Theta, delta_psi, delta_tau)
+    v0 = spa.mean_sidereal_time(jd, jc)
+    v = spa.apparent_sidereal_time(v0, delta_psi, epsilon)
+    alpha = spa.geocentric_sun_right_ascension(lamd, epsilon, beta)
+    delta = spa.geocentric_sun_declination(lamd, epsilon, beta)
+    xi = spa.equatorial_horizontal_parallax(R)
+    return (
+        v[:, np.newaxis],
+        alpha[:, np.newaxis],
+        delta[:, np.newaxis],
+        xi[:, np.newaxis],
+    )
+
+
+def _topocentric_position(
+    time_terms: Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray],
+    latitude: np.ndarray,
+    longitude: np.ndarray,
+    altitude: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Finish the SPA calculation for each location up to the atmospheric
+    refraction, returning the topocentric elevation angle without refraction
+    and the azimuth with shape (time, location)"""
+    v, alpha, delta, xi = time_terms
+    lat = latitude[np.newaxis, :]
+    lon = longitude[np.newaxis, :]
+    elev = altitude[np.newaxis, :]
+    H = spa.local_hour_angle(v, lon, alpha)
+    u = spa.uterm(lat)
+    x = spa.xterm(u, lat, elev)
+    y = spa.yterm(u, lat, elev)
+    delta_alpha = spa.parallax_sun_right_ascension(x, xi, H, delta)
+    delta_prime = spa.topocentric_sun_declination(delta, x, y, xi, delta_alpha, H)
+    H_prime = spa.topocentric_local_hour_angle(H, delta_alpha)
+    e0 = spa.topocentric_elevation_angle_without_atmosphere(lat, delta_prime, H_prime)
+    gamma = spa.topocentric_astronomers_azimuth(H_prime, delta_prime, lat)
+    azimuth = spa.topocentric_azimuth_angle(gamma)
+    return e0, azimuth
+
+
+def _apparent_zenith(
+    e0: np.ndarray, altitude: np.ndarray, temp_air: np.ndarray
+) -> np.ndarray:
+    """Apply the atmospheric refraction correction to the topocentric
+    elevation angle and return the apparent zenith"""
+    # millibars
+    pressure = atmosphere.alt2pres(altitude[np.newaxis, :]) / 100
+    delta_e = spa.atmospheric_refraction_correction(
+        pressure, temp_air, e0, ATMOS_REFRACT
+    )
+    e = spa.topocentric_elevation_angle(e0, delta_e)
+    apparent_zenith: np.ndarray = spa.topocentric_zenith_angle(e)
+    return apparent_zenith
+
+
+# (times token, latitude, longitude, altitude)
+_PositionKey = Tuple[str, float, float, float]
+# (topocentric elevation angle without refraction, azimuth)
+_Position = Tuple[np.ndarray, np.ndarray]
+
+
+class SolarPositionCache:
+    """
+    Least recently used cache of the solar position of each location, before
+    the atmospheric refraction correction that depends on the weather.
+
+    The position only depends on the times and the location, so it is shared
+    by every system and dataset of a job. With the default tolerance of 0,
+    only identical locations share a position, so the results match pvlib at
+    each location. With a tolerance above 0, latitude and longitude are
+    rounded to multiples of tolerance degrees and altitude to kilometers,
+    and the position of the rounded location is used for all locations that
+    round to it, so nearby grid points share a position. This approximation
+    changes the power by up to about 0.1% of its peak for a tolerance of
+    0.05, and may turn a zero at sunrise into NaN. The atmospheric refraction
+    still uses the altitude of each location. Cached arrays are read-only.
+
+    The location independent terms, the bulk of the work, are kept for the
+    last times_size time indexes. preload_datasets computes them for every
+    dataset in the worker before it forks, so they carry over to every job.
+    """
+
+    def __init__(self, maxsize: int, tolerance: float = 0.0, times_size: int = 8):
+        self.maxsize = maxsize
+        self.tolerance = tolerance
+        self.times_size = times_size
+        self.hits = 0
+        self.misses = 0
+        self._time_terms: "OrderedDict[str, Tuple[np.ndarray, ...]]" = OrderedDict()
+        self._positions: "OrderedDict[_PositionKey, _Position]" = OrderedDict()
+
+    def _key(
+        self, times_key: str, latitude: float, longitude: float, altitude: float
+    ) -> _PositionKey:
+        if self.tolerance > 0:
+            latitude = round(latitude / self.tolerance) * self.tolerance
+            longitude = round(longitude / self.tolerance) * self.tolerance
+            # altitude only changes the parallax, by less than a thousandth
+            # of an arcsecond per kilometer
+            altitude = round(altitude, -3)
+        return (times_key, latitude, longitude, float(round(altitude)))
+
+    def time_terms(
+        self, times: pd.DatetimeIndex
+    ) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+        """Location independent terms of the SPA algorithm for times, computed
+        if times is not one of the last times_size time indexes"""
+        times_key = tokenize(times)
+        if times_key in self._time_terms:
+            self._time_terms.move_to_end(times_key)
+        else:
+            self._time_terms[times_key] = _solar_time_terms(times)
+            while len(self._time_terms) > self.times_size:
+                self._time_terms.popitem(last=False)
+        return self._time_terms[times_key]  # type: ignore
+
+    def get(
+        self,
+        times: pd.DatetimeIndex,
+        latitude: np.ndarray,
+        longitude: np.ndarray,
+        altitude: np.ndarray,
+    ) -> List[_Position]:
+        """Get the topocentric elevation angle without atmospheric refraction and
+        the azimuth of each location, computing those not in the cache"""
+        times_key = tokenize(times)
+        keys = [
+            self._key(times_key, *loc)
+            for loc in zip(latitude.tolist(), longitude.tolist(), altitude.tolist())
+        ]
+        found = {k: self._positions[k] for k in keys if k in self._positions}
+        missing = [k for k in dict.fromkeys(keys) if k not in found]
+        if missing:
+            e0, azimuth = _topocentric_position(
+                self.time_terms(times), *np.array([k[1:] for k in missing]).T
+            )
+            for i, key in enumerate(missing):
+                found[key] = (e0[:, i].copy(), azimuth[:, i].copy())
+                for arr in found[key]:
+                    arr.flags.writeable = False
+                self._positions[key] = found[key]
+        for key in keys:
+            if key in self._positions:
+                self._positions.move_to_end(key)
+        while len(self._positions) > self.maxsize:
+            self._positions.popitem(last=False)
+
+        nhits = len(keys) - len(missing)
+        self.hits += nhits
+        self.misses += len(missing)
+        SOLAR_POSITION_CACHE_HITS.inc(nhits)
+        SOLAR_POSITION_CACHE_MISSES.inc(len(missing))
+        return [found[k] for k in keys]
+
+    def clear(self) -> None:
+        self._time_terms.clear()
+        self._positions.clear()
+
+
+solar_position_cache = SolarPositionCache(
+    settings.solar_position_cache_size, settings.solar_position_tolerance
+)
+
+
+def _gridded_orientation(
+    system: models.PVSystem, apparent_zenith: np.ndarray, azimuth: np.ndarray
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Surface tilt, surface azimuth, and angle of incidence of the modules"""
+    if isinstance(system.tracking, models.SingleAxisTracking):
+        # singleaxis only accepts 1D input
+        track = tracking.singleaxis(
+            apparent_zenith.ravel(),
+            azimuth.ravel(),
+            axis_tilt=system.tracking.axis_tilt,
+            axis_azimuth=system.tracking.axis_azimuth,
+            max_angle=50.0,
+            backtrack=system.tracking.backtracking,
+            gcr=system.tracking.gcr,
+        )
+        shape = apparent_zenith.shape
+        # nighttime orientation as in the ModelChain
+        surface_tilt = np.where(
+            np.isnan(track["surface_tilt"]),
+            system.tracking.axis_tilt,
+            track["surface_tilt"],
+        ).reshape(shape)
+        surface_azimuth = np.where(
+            np.isnan(track["surface_azimuth"]),
+            system.tracking.axis_azimuth,
+            track["surface_azimuth"],
+        ).reshape(shape)
+        aoi = track["aoi"].reshape(shape)
+    else:
+        surface_tilt = np.full(apparent_zenith.shape, system.tracking.tilt)
+        surface_azimuth = np.full(apparent_zenith.shape, system.tracking.azimuth)
+        aoi = irradiance.aoi(surface_tilt, surface_azimuth, apparent_zenith, azimuth)
+    return surface_tilt, surface_azimuth, aoi
+
+
+def _gridded_geometry(
+    system: models.PVSystem, data: models.GriddedSystemData, block: slice
+) -> Dict[str, np.ndarray]:
+    """Solar position, orientation of the modules, and airmass at the
+    locations in block"""
+    positions = solar_position_cache.get(
+        data.times, data.latitude[block], data.longitude[block], data.altitude[block]
+    )
+    azimuth = np.stack([az for _, az in positions], axis=1)
+    # solar position is only computed using the temperature of the
+    # actual weather, like in compute_single_location
+    apparent_zenith = _apparent_zenith(
+        np.stack([e0 for e0, _ in positions], axis=1),
+        data.altitude[block],
+        data.weather_data["temp_air"][:, block],
+    )
+    surface_tilt, surface_azimuth, aoi = _gridded_orientation(
+        system, apparent_zenith, azimuth
+    )
+    return {
+        "apparent_zenith": apparent_zenith,
+        "azimuth": azimuth,
+        "surface_tilt": surface_tilt,
+        "surface_azimuth": surface_azimuth,
+        "aoi": aoi,
+        "airmass": atmosphere.get_relative_airmass(apparent_zenith),
+    }
+
+
+def _gridded_pvwatts(
+    system: models.PVSystem,
+    weather: Dict[str, np.ndarray],
+    geometry: Dict[str, np.ndarray],
+    dni_extra: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Run the PVWatts model of the whole system at each location
+    with the same steps as ModelChain.with_pvwatts, returning AC and DC power"""
+    eta = 0.96
+    poa = irradiance.get_total_irradiance(
+        geometry["surface_tilt"],
+        geometry["surface_azimuth"],
+        geometry["apparent_zenith"],
+        geometry["azimuth"],
+        weather["dni"],
+        weather["ghi"],
+        weather["dhi"],
+        dni_extra=dni_extra,
+        airmass=geometry["airmass"],
+        albedo=system.albedo,
+        model="perez",
+    )
+    effective_irradiance = (
+        poa["poa_direct"] * iam.physical(geometry["aoi"]) + poa["poa_diffuse"]
+    )
+    cell_temperature = temperature.sapm_cell(
+        poa["poa_global"],
+        weather["temp_air"],
+        weather["wind_speed"],
+        **TEMPERATURE_PARAMETERS,
+    )
+    dc = pvlib_pvsystem.pvwatts_dc(
+        effective_irradiance,
+        cell_temperature,
+        system.ac_capacity * system.dc_ac_ratio,
+        -0.004,
+    )
+    dc *= (100 - pvlib_pvsystem.pvwatts_losses()) / 100
+    ac = inverter.pvwatts(dc, system.ac_capacity / eta, eta_inv_nom=eta)
+    ac = np.where(np.isnan(ac), 0, ac)
+    return ac, dc
+
+
+def compute_gridded_system_power(
+    system: models.PVSystem, data: models.GriddedSystemData
 ) -> pd.DataFrame:
-    """Compute the total AC power from the weather data and fractional capacity
-    of each grid box the system contains"""
-    out: pd.DataFrame = pd.DataFrame(
-        [],
+    """Compute the AC and DC power, for both actual and clearsky weather,
+    of every location at once with (time, location) arrays and sum
+    each location weighted by its fraction of the total.
+
+    Gives the same result as summing compute_single_location over each
+    location, but the location independent parts of the solar position,
+    the orientation of the modules, and the airmass are only computed once
+    for the actual and clearsky weather, and the solar position of each
+    location is shared through solar_position_cache.
+    """
+    dni_extra = irradiance.get_extra_radiation(data.times).to_numpy()[:, np.newaxis]
+    fraction = np.asarray(data.fraction_of_total)
+
+    out = np.zeros((len(data.times), 4))
+    for start in range(0, len(data.locations), LOCATION_BLOCK_SIZE):
+        block = slice(start, start + LOCATION_BLOCK_SIZE)
+        geometry = _gridded_geometry(system, data, block)
+        for i, weather in enumerate((data.weather_data, data.clearsky_data)):
+            ac, dc = _gridded_pvwatts(
+                system,
+                {k: v[:, block] for k, v in weather.items()},
+                geometry,
+                dni_extra,
+            )
+            out[:, 2 * i] += ac @ fraction[block]
+            out[:, 2 * i + 1] += dc @ fraction[block]
+    return pd.DataFrame(
+        out,
         columns=["ac_power", "dc_power", "clearsky_ac_power", "clearsky_dc_power"],
-        index=pd.DatetimeIndex([], name="time"),  # type: ignore
-        dtype="float64",
+        index=pd.DatetimeIndex(data.times, name="time"),
     )
-    for data in dataset.generate_data(system):
-        part = compute_single_location(system, data)
-        if out.empty:  # type: ignore
-            out = part
-        else:
-            out += part  # type: ignore
+
+
+def compute_total_system_power(
+    system: models.PVSystem,
+    dataset: NSRDBDataset,
+    points: Optional[List[SpatialIndexPoint]] = None,
+) -> pd.DataFrame:
+    """Compute the total AC power from the weather data and fractional capacity
+    of each grid box the system contains. The grid boxes from
+    dataset.find_system_locations are found here unless given as points."""
+    if points is None:
+        points = dataset.find_system_locations(system)
+    if len(points) == 0:
+        out: pd.DataFrame = pd.DataFrame(
+            [],
+            columns=["ac_power", "dc_power", "clearsky_ac_power", "clearsky_dc_power"],
+            index=pd.DatetimeIndex([], name="time"),  # type: ignore
+            dtype="float64",
+        )
+    else:
+        out = compute_gridded_system_power(system, dataset.load_gridded_data(points))
 
     if system.apply_variability_multiplier:
         # hack to make output more consistent with actuals in not-clear conditions
@@ -133,6 +558,31 @@ def compute_total_system_power(
     return out
 
 
+def capacity_scale_factor(
+    previous: models.PVSystem, system: models.PVSystem
+) -> Optional[float]:
+    """Factor that converts the power computed for the ``previous`` system
+    definition into the power of ``system``, or None if the definitions
+    differ in more than the name and AC capacity.
+
+    With the PVWatts models used here, the DC and inverter capacities of every
+    grid box are proportional to the AC capacity of the system (and the
+    variability multiplier is invariant to scale), so every power column
+    scales linearly with it when the DC/AC ratio is unchanged.
+    """
+    ignored = {"name", "ac_capacity"}
+    if previous.dict(exclude=ignored) != system.dict(exclude=ignored):
+        return None
+    return system.ac_capacity / previous.ac_capacity
+
+
+def scale_system_power(timeseries: bytes, factor: float) -> pd.DataFrame:
+    """Rescale the power columns of a stored Arrow timeseries by ``factor``"""
+    data = utils.read_arrow(BytesIO(timeseries)).set_index("time")
+    out: pd.DataFrame = data.astype("float64") * factor
+    return out
+
+
 def calculate_variable_multiplier(out):
     """
     Calculate a multiplier that varies given daily standard deviation of
@@ -173,38 +623,90 @@ def _daytime_limits(period: int, zenith: pd.Series) -> pd.Series:
     return keep
 
 
-def _largest_ramps(
-    period: int, series: pd.Series, quantile: float, zenith: pd.Series
-) -> pd.Series:
-    """Find the typical large ramps considering the whole month together"""
-    keep_diffs = _daytime_limits(period, zenith)
-    out: pd.Series = (
-        series.resample(f"{period}min")  # type: ignore
-        .mean()
-        .diff()[keep_diffs]
-        .dropna()
-        .groupby(lambda x: x.month)
-        .quantile(quantile)
+# quantiles of the period ramps within a month reported as statistics
+LARGEST_RAMP_QUANTILES = (
+    ("p95 daytime ramp", 0.95),
+    ("p05 daytime ramp", 0.05),
+    ("worst case ramp up", 0.9999),
+    ("worst case ramp down", 0.0001),
+)
+# quantiles of the clearsky ramps within a day, averaged over each month
+TYPICAL_SS_RAMP_QUANTILES = (
+    ("typical sunrise ramp", 0.95),
+    ("typical sunset ramp", 0.05),
+)
+RAMP_PERIODS = (5, 10, 15, 30, 60)
+
+
+def _grouped_quantiles(
+    codes: np.ndarray, values: np.ndarray, quantiles: Sequence[float]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Linearly interpolated quantiles of ``values`` within each group of
+    integer ``codes``, like ``groupby(codes).quantile``, with a single sort.
+
+    Returns the sorted unique codes and an array of shape
+    (len(quantiles), len(unique codes)).
+    """
+    order = np.lexsort((values, codes))
+    sorted_values = values[order]
+    groups, starts, counts = np.unique(
+        codes[order], return_index=True, return_counts=True
     )
-    return out
-
-
-def _typical_ss_ramps(
-    period: int, series: pd.Series, quantile: float, zenith: pd.Series
-) -> pd.Series:
-    """Apply to a clearsky power to estimate the sunrise/set ramps for each day
-    and take the mean over a month for the typical monthly sunrise/set ramp"""
-    keep_diffs = _daytime_limits(period, zenith)
-    out: pd.Series = (
-        series.resample(f"{period}min")  # type: ignore
-        .mean()
-        .diff()[keep_diffs]
-        .dropna()
-        .groupby(lambda x: x.date)
-        .quantile(quantile)
-        .groupby(lambda x: x.month)
+    pos = np.asarray(quantiles)[:, None] * (counts - 1)
+    lower = np.floor(pos)
+    frac = pos - lower
+    lo = sorted_values[starts + lower.astype(int)]
+    hi = sorted_values[starts + np.ceil(pos).astype(int)]
+    out: np.ndarray = lo + (hi - lo) * frac
+    return groups, out
+
+
+def _ramp_statistics(
+    period: int, data: pd.DataFrame, zenith: pd.Series
+) -> Dict[Tuple[str, str], pd.Series]:
+    """Compute the monthly ramp statistics for one period from a single
+    resample of the AC and clearsky AC power"""
+    keep = _daytime_limits(period, zenith).to_numpy()
+    diffs = (
+        data[["ac_power", "clearsky_ac_power"]]
+        .resample(f"{period}min")  # type: ignore
         .mean()
+        .diff()
+    )
+    index = diffs.index[keep]
+    month_codes = index.month.to_numpy()  # type: ignore
+    # year/month/day in one integer so the month is recoverable from the day
+    day_codes = (
+        index.year * 10000 + index.month * 100 + index.day  # type: ignore
+    ).to_numpy()
+    name = f"{period}-min"
+    out = {}
+
+    ramps = diffs["ac_power"].to_numpy()[keep]
+    valid = ~np.isnan(ramps)
+    months, quants = _grouped_quantiles(
+        month_codes[valid],
+        ramps[valid],
+        [q for _, q in LARGEST_RAMP_QUANTILES],
     )
+    for (stat, _), vals in zip(LARGEST_RAMP_QUANTILES, quants):
+        out[(name, stat)] = pd.Series(vals, index=months)
+
+    ramps = diffs["clearsky_ac_power"].to_numpy()[keep]
+    valid = ~np.isnan(ramps)
+    days, quants = _grouped_quantiles(
+        day_codes[valid],
+        ramps[valid],
+        [q for _, q in TYPICAL_SS_RAMP_QUANTILES],
+    )
+    months, day_month = np.unique(days // 100 % 100, return_inverse=True)
+    days_per_month = np.bincount(day_month, minlength=len(months))
+    for (stat, _), vals in zip(TYPICAL_SS_RAMP_QUANTILES, quants):
+        out[(name, stat)] = pd.Series(
+            np.bincount(day_month, weights=vals, minlength=len(months))
+            / days_per_month,
+            index=months,
+        )
     return out
 
 
@@ -239,69 +741,90 @@ def _compute_statistics(
 ) -> pd.DataFrame:
     data = data.tz_convert("Etc/GMT+7")  # type: ignore
     zenith = get_solarposition(data.index, system_center.y, system_center.x)["zenith"]
-    # remove most of nighttime but keep some to get the diff for morning/evening ramps
-    periods = (5, 10, 15, 30, 60)
-    out = pd.DataFrame(
-        {
-            k: v  # type: ignore
-            for p in periods
-            for k, v in (
-                (
-                    (f"{p}-min", "p95 daytime ramp"),
-                    _largest_ramps(p, data.ac_power, 0.95, zenith),
-                ),
-                (
-                    (f"{p}-min", "p05 daytime ramp"),
-                    _largest_ramps(p, data.ac_power, 0.05, zenith),
-                ),
-                (
-                    (f"{p}-min", "worst case ramp up"),
-                    _largest_ramps(p, data.ac_power, 0.9999, zenith),
-                ),
-                (
-                    (f"{p}-min", "worst case ramp down"),
-                    _largest_ramps(p, data.ac_power, 0.0001, zenith),
-                ),
-                (
-                    (f"{p}-min", "typical sunrise ramp"),
-                    _typical_ss_ramps(p, data.clearsky_ac_power, 0.95, zenith),
-                ),
-                (
-                    (f"{p}-min", "typical sunset ramp"),
-                    _typical_ss_ramps(p, data.clearsky_ac_power, 0.05, zenith),
-                ),
-            )
-        },
-    ).round(2)
+    stats: Dict[Tuple[str, str], pd.Series] = {}
+    for period in RAMP_PERIODS:
+        stats.update(_ramp_statistics(period, data, zenith))
+    out = pd.DataFrame(stats).round(2)
     out.index = pd.Index([calendar.month_name[i] for i in out.index], name="month")
     out.columns.names = ["interval", "statistic"]
     return out.melt(ignore_index=False).reset_index()  # type: ignore
 
 
+# datasets with grids already loaded, filled by preload_datasets in the
+# RQ worker before it forks so job processes share them copy-on-write
+_preloaded_datasets: Dict[str, NSRDBDataset] = {}
+
+
+def preload_datasets() -> None:
+    """Load the grid of every configured dataset that exists on disk and the
+    location independent solar position terms of its times. Datasets with
+    identical grids share a single copy of the grid."""
+    for name, dataset_path in settings.nsrdb_data_path.items():
+        if not dataset_path.exists():
+            logger.warning("Not preloading %s, %s does not exist", name, dataset_path)
+            continue
+        ds = NSRDBDataset(dataset_path)
+        ds.load_grid()
+        solar_position_cache.time_terms(ds.load_times())
+        for other in _preloaded_datasets.values():
+            if ds.share_grid(other):
+                break
+        _preloaded_datasets[name] = ds
+
+
 def _get_dataset(dataset_name: models.DatasetEnum) -> NSRDBDataset:
-    # will take about two seconds to load grid, could possibly preload
-    # before the RQ fork, but not worth it for now
+    if (ds := _preloaded_datasets.get(dataset_name)) is not None and (
+        ds.data_path == find_dataset_path(dataset_name)
+    ):
+        return ds
+    # will take about two seconds to load grid
     dataset_path = find_dataset_path(dataset_name)
     ds = NSRDBDataset(dataset_path)
     ds.load_grid()
     return ds
 
 
-def run_job(system_id: UUID, dataset_name: models.DatasetEnum, user: str):
-    si = storage.StorageInterface(user=user)
-    with si.start_transaction() as st:
-        try:
-            system = st.get_system(system_id)
-            syshash = st.get_system_hash(system_id)
-        except HTTPException as err:
-            if err.status_code == 404:
-                return
-            else:  # pragma: no cover
-                raise
+def _rescale_inputs(
+    st: storage.StorageInterface,
+    system_id: UUID,
+    dataset_name: models.DatasetEnum,
+    system: models.PVSystem,
+) -> Tuple[Optional[float], Optional[bytes]]:
+    """The factor to rescale the stored timeseries of the system by, and that
+    timeseries, if the system results can be rescaled instead of recomputed"""
+    previous = st.get_system_model_definition(system_id, dataset_name)
+    scale = capacity_scale_factor(previous, system) if previous is not None else None
+    if scale is None:
+        return None, None
+    return scale, st.get_system_model_timeseries(system_id, dataset_name)
+
+
+def _model_system(
+    si: storage.StorageInterface,
+    system_id: UUID,
+    dataset_name: models.DatasetEnum,
+    system: models.PVSystem,
+    syshash: str,
+    scale: Optional[float],
+    stored: Optional[bytes],
+    locations: Dict[int, List[SpatialIndexPoint]],
+):
+    """Compute, or rescale, and store the results of the system with the
+    dataset. The system locations in each grid are kept in locations, keyed by
+    the id of the grid, to be reused with other datasets sharing the grid. Any
+    error is stored as the error of the system data and raised."""
     try:
-        dataset = _get_dataset(dataset_name)
-        ac_power = compute_total_system_power(system.definition, dataset)
-        stats = compute_statistics(system.definition, ac_power)
+        if scale is not None:
+            # only the name/capacity changed, so rescale the stored results
+            # instead of recomputing from the NSRDB data
+            ac_power = scale_system_power(stored, scale)  # type: ignore
+        else:
+            dataset = _get_dataset(dataset_name)
+            grid_id = id(dataset.grid_points)
+            if grid_id not in locations:
+                locations[grid_id] = dataset.find_system_locations(system)
+            ac_power = compute_total_system_power(system, dataset, locations[grid_id])
+        stats = compute_statistics(system, ac_power)
     except Exception as err:
         error = {"message": str(err)}
         with si.start_transaction() as st:
@@ -316,5 +839,76 @@ def run_job(system_id: UUID, dataset_name: models.DatasetEnum, user: str):
     stats_bytes = utils.dump_arrow_bytes(utils.convert_to_arrow(stats))
     with si.start_transaction() as st:
         st.update_system_model_data(
-            system_id, dataset_name, syshash, ac_bytes, stats_bytes
+            system_id,
+            dataset_name,
+            syshash,
+            ac_bytes,
+            stats_bytes,
+            system_definition=system,
         )
+
+
+def run_job(system_id: UUID, dataset_name: models.DatasetEnum, user: str):
+    si = storage.StorageInterface(user=user)
+    with si.start_transaction() as st:
+        try:
+            system = st.get_system(system_id)
+            syshash = st.get_system_hash(system_id)
+            scale, stored = _rescale_inputs(
+                st, system_id, dataset_name, system.definition
+            )
+        except HTTPException as err:
+            if err.status_code == 404:
+                return
+            else:  # pragma: no cover
+                raise
+    _model_system(
+        si, system_id, dataset_name, system.definition, syshash, scale, stored, {}
+    )
+
+
+def run_datasets_job(
+    system_id: UUID, dataset_names: Sequence[models.DatasetEnum], user: str
+):
+    """Model the system with each of the datasets in a single job, e.g. every
+    year of the NSRDB. The system is loaded once and the locations of the
+    system in a grid are only found once for all datasets sharing that grid.
+    The results of each dataset are stored as soon as they are computed, and
+    an error with one dataset is stored without stopping the others."""
+    si = storage.StorageInterface(user=user)
+    with si.start_transaction() as st:
+        try:
+            system = st.get_system(system_id)
+            syshash = st.get_system_hash(system_id)
+        except HTTPException as err:
+            if err.status_code == 404:
+                return
+            else:  # pragma: no cover
+                raise
+    locations: Dict[int, List[SpatialIndexPoint]] = {}
+    for dataset_name in dataset_names:
+        with si.start_transaction() as st:
+            try:
+                scale, stored = _rescale_inputs(
+                    st, system_id, dataset_name, system.definition
+                )
+            except HTTPException as err:
+                if err.status_code == 404:
+                    return
+                else:  # pragma: no cover
+                    raise
+        try:
+            _model_system(
+                si,
+                system_id,
+                dataset_name,
+                system.definition,
+                syshash,
+                scale,
+                stored,
+                locations,
+            )
+        except Exception:
+            logger.exception(
+                "Modeling system %s with %s failed", system_id, dataset_name
+            )
@@ -19,6 +19,14 @@ from rq import Queue  # type: ignore
 from esprr_api.data import nsrdb
 from esprr_api.main import app
 from esprr_api import settings, models, storage, queuing
+from esprr_api.table_cache import table_cache
+
+
+@pytest.fixture(autouse=True)
+def clear_table_cache():
+    table_cache.clear()
+    yield
+    table_cache.clear()
 
 
 @pytest.fixture(scope="session")
@@ -98,10 +106,20 @@ def mock_redis(mocker):
 @pytest.fixture()
 def async_queue(mock_redis, mocker):
     q = Queue("jobs", connection=mock_redis)
-    mocker.patch.object(queuing, "_get_queue", return_value=q)
+    mocker.patch.object(
+        queuing,
+        "_get_queue",
+        side_effect=lambda name, conn: Queue(name, connection=mock_redis),
+    )
     return q
 
 
+@pytest.fixture()
+def async_bulk_queue(async_queue, auth0_id):
+    """The bulk queue of the jobs of the test user"""
+    return queuing.QueueManager().get_queue(queuing.JobPriority.bulk, auth0_id)
+
+
 @pytest.fixture(scope="module")
 def auth0_id():
     return "auth0|6061d0dfc96e2800685cb001"
@@ -1,10 +1,11 @@
 from contextlib import contextmanager
 from pathlib import Path
-from typing import ContextManager, Optional, List, NamedTuple, Generator
-import warnings
+from typing import ContextManager, Optional, List, NamedTuple, Generator, Tuple
 
 
 import geopandas  # type: ignore
+import numpy as np
+import pandas as pd
 from shapely import geometry  # type: ignore
 import xarray as xr
 
@@ -18,6 +19,78 @@ CRS = (
 )
 
 
+# parameters of CRS to project in numpy, following Snyder (1987) eqs. 15-1 to 15-10
+_WGS84_A = 6378.137  # km
+_WGS84_E = np.sqrt(2 / 298.257223563 - (1 / 298.257223563) ** 2)
+_LON_0 = np.radians(-110.5)
+_LAT_1, _LAT_2 = np.radians(31.0), np.radians(38.0)
+
+
+def _lcc_m(phi):
+    return np.cos(phi) / np.sqrt(1 - (_WGS84_E * np.sin(phi)) ** 2)
+
+
+def _lcc_t(phi):
+    esin = _WGS84_E * np.sin(phi)
+    return np.tan(np.pi / 4 - phi / 2) / ((1 - esin) / (1 + esin)) ** (_WGS84_E / 2)
+
+
+_LCC_N = (np.log(_lcc_m(_LAT_1)) - np.log(_lcc_m(_LAT_2))) / (
+    np.log(_lcc_t(_LAT_1)) - np.log(_lcc_t(_LAT_2))
+)
+_LCC_AF = _WGS84_A * _lcc_m(_LAT_1) / (_LCC_N * _lcc_t(_LAT_1) ** _LCC_N)
+
+
+def project_to_crs(lon: np.ndarray, lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Project longitude and latitude in degrees to x, y in km of CRS"""
+    rho = _LCC_AF * _lcc_t(np.radians(lat)) ** _LCC_N
+    theta = _LCC_N * (np.radians(lon) - _LON_0)
+    return rho * np.sin(theta), _LCC_AF - rho * np.cos(theta)
+
+
+def projected_box_area(
+    west: np.ndarray, south: np.ndarray, east: np.ndarray, north: np.ndarray
+) -> np.ndarray:
+    """Area in km^2 of the lat/lon boxes with straight edges between the corners
+    projected to CRS"""
+    sw = project_to_crs(west, south)
+    se = project_to_crs(east, south)
+    ne = project_to_crs(east, north)
+    nw = project_to_crs(west, north)
+    # half the cross product of the diagonals, avoids the loss of precision
+    # of the shoelace formula for thin boxes far from the origin
+    area: np.ndarray = 0.5 * np.abs(
+        (ne[0] - sw[0]) * (nw[1] - se[1]) - (ne[1] - sw[1]) * (nw[0] - se[0])
+    )
+    return area
+
+
+OTHER_COLS = ["wind_speed", "temp_air"]
+ALL_COLS = (
+    ["ghi", "dni", "dhi"]
+    + OTHER_COLS
+    + ["clearsky_ghi", "clearsky_dni", "clearsky_dhi"]
+)
+
+
+# precomputed grid stored next to each zarr dataset: the coordinates of each point,
+# the bounds of the box around each point, the area of the box in km^2 when
+# projected to CRS, and if the point is a vertex of the convex hull of the grid
+GRID_DTYPE = np.dtype(
+    [
+        ("spatial_idx", "i8"),
+        ("lat", "f8"),
+        ("lon", "f8"),
+        ("west", "f8"),
+        ("south", "f8"),
+        ("east", "f8"),
+        ("north", "f8"),
+        ("area", "f8"),
+        ("on_hull", "?"),
+    ]
+)
+
+
 class SpatialIndexPoint(NamedTuple):
     spatial_idx: int
     fractional_area: float
@@ -37,6 +110,12 @@ class NSRDBDataset:
         )
         self._grid: Optional[geopandas.GeoSeries] = None
         self._boundary: Optional[geometry.Polygon] = None
+        self._grid_points: Optional[np.ndarray] = None
+
+    @property
+    def grid_path(self) -> Path:
+        """Path of the precomputed grid file made by `build_grid`"""
+        return self.data_path.with_suffix(".grid.npy")
 
     def open_dataset(self) -> ContextManager[xr.Dataset]:
         """Contextmanager to open the zarr dataset"""
@@ -49,25 +128,84 @@ class NSRDBDataset:
 
         return opener()
 
-    def load_grid(self) -> None:
-        """Load the NSRDB lat/lon grid into a geopandas.GeoSeries"""
+    def load_times(self) -> pd.DatetimeIndex:
+        """The times of the data, as in the GriddedSystemData of any points"""
+        with self.open_dataset() as ds:
+            times = ds.times.values
+        return pd.DatetimeIndex(times, name="times").tz_localize("UTC")
+
+    def _make_grid_points(self) -> np.ndarray:
         with self.open_dataset() as ds:
             # must use single threaded scheduler or forked process in rq may hang
             sub = ds[["lat", "lon", "spatial_idx"]].compute(scheduler="single-threaded")
-            lats = sub.lat.values
-            lons = sub.lon.values
-            index = sub.spatial_idx.values
-        pts = geopandas.points_from_xy(lons, lats)
-        self._grid = geopandas.GeoSeries(pts, index=index, crs="EPSG:4326")
-        self._grid.sindex.query(geometry.Point(-110.1, 32.2))  # load the index tree
-        self._boundary = self._grid.unary_union.convex_hull.buffer(
+        out = np.zeros(len(sub.spatial_idx), dtype=GRID_DTYPE)
+        out["spatial_idx"] = sub.spatial_idx.values
+        out["lat"] = sub.lat.values
+        out["lon"] = sub.lon.values
+        out["west"] = out["lon"] - self.pt_buffer
+        out["south"] = out["lat"] - self.pt_buffer
+        out["east"] = out["lon"] + self.pt_buffer
+        out["north"] = out["lat"] + self.pt_buffer
+        out["area"] = projected_box_area(
+            out["west"], out["south"], out["east"], out["north"]
+        )
+        hull = geometry.MultiPoint(np.stack([out["lon"], out["lat"]], axis=1))
+        hull_coords = set(hull.convex_hull.boundary.coords)
+        out["on_hull"] = [(x, y) in hull_coords for x, y in zip(out["lon"], out["lat"])]
+        return out
+
+    def build_grid(self) -> None:
+        """Compute the box around each grid point, the projected area of the box,
+        and the convex hull of the grid and save them to `grid_path`"""
+        np.save(self.grid_path, self._make_grid_points())
+
+    def load_grid(self) -> None:
+        """Load the NSRDB lat/lon grid and the boundary of the grid. The
+        precomputed grid from `build_grid` is memory mapped if it exists"""
+        if self.grid_path.exists():
+            grid_points = np.load(self.grid_path, mmap_mode="r")
+        else:
+            grid_points = self._make_grid_points()
+        self._grid_points = grid_points
+        on_hull = grid_points[grid_points["on_hull"]]
+        self._boundary = geometry.MultiPoint(
+            np.stack([on_hull["lon"], on_hull["lat"]], axis=1)
+        ).convex_hull.buffer(
             self.pt_buffer + 1e-4  # extend a bit past outer box
         )
 
+    def share_grid(self, other: "NSRDBDataset") -> bool:
+        """Use the grid of other if it is identical to the grid of this
+        dataset, e.g. for different years of the NSRDB, so both datasets hold
+        the same grid object and the system locations found with one of
+        them are valid for the other. Returns if the grid is shared."""
+        if self.grid_points is other.grid_points:
+            return True
+        if self.grid_points.shape != other.grid_points.shape or not np.array_equal(
+            self.grid_points, other.grid_points
+        ):
+            return False
+        self._grid_points = other.grid_points
+        self._boundary = other.boundary
+        self._grid = other._grid
+        return True
+
+    @property
+    def grid_points(self) -> np.ndarray:
+        if self._grid_points is None:
+            raise AttributeError("Grid only available after `load_grid` call")
+        return self._grid_points
+
     @property
     def grid(self) -> geopandas.GeoSeries:
         if self._grid is None:
-            raise AttributeError("Grid only available after `load_grid` call")
+            self._grid = geopandas.GeoSeries(
+                geopandas.points_from_xy(
+                    self.grid_points["lon"], self.grid_points["lat"]
+                ),
+                index=self.grid_points["spatial_idx"],
+                crs="EPSG:4326",
+            )
         return self._grid
 
     @property
@@ -87,36 +225,100 @@ class NSRDBDataset:
         if not system_rect.within(self.boundary):
             raise ValueError("System is outside the boundary of the background dataset")
 
-        # find the nsrdb grid points in/near the system
-        # quicker than only finding the intersection on the entire grid
-        possible_points = self.grid.sindex.query(system_rect.buffer(self.pt_buffer))
-        # make polygons representing each grid point in/near the system
-        # resolution=1 uses one segement per qtr circle, so makes a rectangle
-        with warnings.catch_warnings():  # ignore buffer warnings
-            warnings.simplefilter("ignore", category=UserWarning)
-            possible_grid_boxes = (
-                (self.grid.iloc[possible_points])
-                .buffer(self.pt_buffer, resolution=1)
-                .envelope
-            )
-
-        # now take intersection of system rect and grid boxes
-        # has effect of cutting grid boxes overlapping edge of system rect
-        intersecting_grid_boxes = possible_grid_boxes.intersection(system_rect)
+        # find the nsrdb grid boxes that overlap the system
+        pts = self.grid_points
+        west, south, east, north = system_rect.bounds
+        boxes = pts[
+            (pts["east"] > west)
+            & (pts["west"] < east)
+            & (pts["north"] > south)
+            & (pts["south"] < north)
+        ]
+        if len(boxes) == 0:
+            return []
 
+        # cut the grid boxes overlapping the edge of the system rect
+        clipped = (
+            np.maximum(boxes["west"], west),
+            np.maximum(boxes["south"], south),
+            np.minimum(boxes["east"], east),
+            np.minimum(boxes["north"], north),
+        )
+        cut = (
+            (clipped[0] != boxes["west"])
+            | (clipped[1] != boxes["south"])
+            | (clipped[2] != boxes["east"])
+            | (clipped[3] != boxes["north"])
+        )
         # find the area of each grid box in the km^2 using appropriate projection
-        area_ser = intersecting_grid_boxes.to_crs(CRS).area.sort_index()
+        areas = np.where(cut, projected_box_area(*clipped), boxes["area"])
         # drop points that have insignificant areas
-        area_ser = area_ser[area_ser > area_ser.max() / 1000]
+        keep = areas > areas.max() / 1000
         # find fractional area
-        area_ser /= area_ser.sum()
+        fractions = areas[keep] / areas[keep].sum()
 
         points = [
             SpatialIndexPoint(spatial_idx=ind, fractional_area=area)
-            for ind, area in area_ser.items()
+            for ind, area in zip(
+                boxes["spatial_idx"][keep].tolist(), fractions.tolist()
+            )
         ]
         return points
 
+    def load_gridded_data(
+        self, points: List[SpatialIndexPoint]
+    ) -> models.GriddedSystemData:
+        """
+        Load the weather and clearsky data for all points at once. Points are
+        grouped by the zarr chunk that holds them so that each chunk is read and
+        decompressed only once, instead of once for every point in the chunk.
+        """
+        if len(points) == 0:
+            raise ValueError("No points to load data for")
+        spatial_idx = np.array([pt.spatial_idx for pt in points], dtype=int)
+        order = np.argsort(spatial_idx)
+        sorted_idx = spatial_idx[order]
+        parts = []
+        with self.open_dataset() as ds:
+            ds = ds.rename({"air_temperature": "temp_air"})[ALL_COLS]
+            bounds = np.cumsum((0,) + ds.chunks["spatial_idx"])
+            chunk_of = np.searchsorted(bounds, sorted_idx, side="right") - 1
+            for chunk in np.unique(chunk_of):
+                # must use single threaded scheduler or forked process in rq may hang
+                parts.append(
+                    ds.isel(spatial_idx=sorted_idx[chunk_of == chunk]).compute(
+                        scheduler="single-threaded"
+                    )
+                )
+        # back to the order of the points
+        data = xr.concat(parts, dim="spatial_idx").isel(spatial_idx=np.argsort(order))
+
+        irr = ["ghi", "dni", "dhi"]
+        return models.GriddedSystemData(
+            times=pd.DatetimeIndex(data.times.values, name="times").tz_localize("UTC"),
+            locations=[
+                models.Location(latitude=lat, longitude=lon, altitude=elev)
+                for lat, lon, elev in zip(
+                    data.lat.values.tolist(),
+                    data.lon.values.tolist(),
+                    data.elevation.values.tolist(),
+                )
+            ],
+            fraction_of_total=[pt.fractional_area for pt in points],
+            weather_data={
+                v: data[v].values.astype("float32") for v in irr + OTHER_COLS
+            },
+            clearsky_data={
+                **{v: data[f"clearsky_{v}"].values.astype("float32") for v in irr},
+                **{v: data[v].values.astype("float32") for v in OTHER_COLS},
+            },
+        )
+
+    def get_gridded_data(self, pvsystem: models.PVSystem) -> models.GriddedSystemData:
+        """Find the locations that make up the system and load all of their
+        data at once"""
+        return self.load_gridded_data(self.find_system_locations(pvsystem))
+
     def generate_data(
         self, pvsystem: models.PVSystem
     ) -> Generator[models.SystemData, None, None]:
@@ -124,41 +326,24 @@ class NSRDBDataset:
         Generator that produces models.SystemData objects holding the location, fraction
         of total, and weather data for each location that should be modeled.
         """
-        points = self.find_system_locations(pvsystem)
-        irr = ["ghi", "dni", "dhi"]
-        other = ["wind_speed", "temp_air"]
-        cols = irr + other
-        clrsky_cols = [f"clearsky_{v}" for v in irr]
-        all_cols = cols + clrsky_cols
-        with self.open_dataset() as ds:
-            for pt in points:
-                data = (
-                    ds.rename({"air_temperature": "temp_air"})[all_cols]
-                    .sel(spatial_idx=pt.spatial_idx)
-                    .compute(scheduler="single-threaded")
-                )
-                loc = models.Location(
-                    latitude=data.lat.item(),
-                    longitude=data.lon.item(),
-                    altitude=data.elevation.item(),
-                )
-                df = (
-                    data.to_dataframe()  # type: ignore
-                    .set_index("times")
-                    .tz_localize("UTC")
-                    .astype("float32")
-                )
-                weather_df = df[cols]
-                clrsky_df = df[clrsky_cols + other].rename(
-                    columns={f"clearsky_{v}": v for v in irr}
-                )
-                sysd = models.SystemData(
-                    location=loc,
-                    fraction_of_total=pt.fractional_area,
-                    weather_data=weather_df,
-                    clearsky_data=clrsky_df,
-                )
-                yield sysd
+        gridded = self.get_gridded_data(pvsystem)
+        for i, (loc, frac) in enumerate(
+            zip(gridded.locations, gridded.fraction_of_total)
+        ):
+            weather_df = pd.DataFrame(
+                {k: v[:, i] for k, v in gridded.weather_data.items()},
+                index=gridded.times,
+            )
+            clrsky_df = pd.DataFrame(
+                {k: v[:, i] for k, v in gridded.clearsky_data.items()},
+                index=gridded.times,
+            )
+            yield models.SystemData(
+                location=loc,
+                fraction_of_total=frac,
+                weather_data=weather_df,
+                clearsky_data=clrsky_df,
+            )
 
 
 def find_dataset_path(data_set_name: models.DatasetEnum) -> Path:
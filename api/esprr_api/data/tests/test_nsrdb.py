@@ -1,4 +1,9 @@
+from contextlib import contextmanager
+
+
 import geopandas  # type: ignore
+import numpy as np
+import pandas as pd
 import pytest
 from shapely import geometry  # type: ignore
 from types import GeneratorType
@@ -6,6 +11,7 @@ import xarray as xr
 
 
 from esprr_api import models
+from esprr_api.data import nsrdb
 
 
 def test_open_dataset(dataset):
@@ -64,3 +70,160 @@ def test_generate_data(system_def, ready_dataset):
     assert len(ol) == 12
     assert isinstance(ol[0], models.SystemData)
     assert len(ol[0].weather_data.index) == 17280
+
+
+@pytest.fixture()
+def built_dataset(ready_dataset, nsrdb_data):
+    # ready_dataset loads the grid before the precomputed grid exists
+    ds = nsrdb.NSRDBDataset(nsrdb_data)
+    ds.build_grid()
+    yield ds
+    ds.grid_path.unlink()
+
+
+def test_build_grid(built_dataset):
+    grid = np.load(built_dataset.grid_path)
+    assert grid.dtype == nsrdb.GRID_DTYPE
+    assert len(grid) == 12
+    assert (grid["east"] - grid["west"] > 0.0199).all()
+    assert (grid["area"] > 0).all()
+    assert 3 <= grid["on_hull"].sum() < 12
+
+
+def test_load_grid_precomputed(built_dataset, ready_dataset, mocker):
+    read = mocker.spy(built_dataset, "_make_grid_points")
+    built_dataset.load_grid()
+    assert read.call_count == 0
+    assert isinstance(built_dataset._grid_points, np.memmap)
+    assert built_dataset.boundary.equals(ready_dataset.boundary)
+    assert built_dataset.grid.geom_equals(ready_dataset.grid).all()
+
+
+def test_share_grid(built_dataset, ready_dataset):
+    built_dataset.load_grid()
+    assert built_dataset.grid_points is not ready_dataset.grid_points
+    assert built_dataset.share_grid(ready_dataset)
+    assert built_dataset.grid_points is ready_dataset.grid_points
+    assert built_dataset.boundary is ready_dataset.boundary
+    assert built_dataset.share_grid(ready_dataset)
+
+
+def test_share_grid_different(built_dataset, ready_dataset):
+    built_dataset._grid_points = ready_dataset.grid_points[:-1]
+    assert not built_dataset.share_grid(ready_dataset)
+    assert built_dataset.grid_points is not ready_dataset.grid_points
+
+
+@pytest.fixture(params=[True, False], ids=["precomputed", "computed"])
+def any_grid_dataset(request, dataset):
+    if request.param:
+        dataset.build_grid()
+    dataset.load_grid()
+    yield dataset
+    if request.param:
+        dataset.grid_path.unlink()
+
+
+def _geopandas_locations(dataset, system):
+    boxes = dataset.grid.buffer(dataset.pt_buffer, resolution=1).envelope
+    area = boxes.intersection(system.boundary._rect).to_crs(nsrdb.CRS).area
+    area = area[area > area.max() / 1000]
+    return area / area.sum()
+
+
+@pytest.mark.parametrize(
+    "bbox",
+    [
+        ((32.03, -110.9), (32.03 - 2e-6, -110.9 + 2e-6)),
+        ((32.03, -110.9), (32.03 - 2e-6, -110.85)),
+        ((32.04, -110.9), (32.01, -110.9 + 2e-6)),
+        ((32.037, -110.94), (32.022, -110.861)),
+        ((32.045, -110.955), (32.015, -110.845)),
+    ],
+)
+def test_find_system_locations_geopandas(bbox, system_def, any_grid_dataset):
+    dataset = any_grid_dataset
+    system_def.boundary = models.BoundingBox(
+        nw_corner={"latitude": bbox[0][0], "longitude": bbox[0][1]},
+        se_corner={"latitude": bbox[1][0], "longitude": bbox[1][1]},
+    )
+    expected = _geopandas_locations(dataset, system_def)
+    out = dataset.find_system_locations(system_def)
+    assert [pt.spatial_idx for pt in out] == expected.index.tolist()
+    np.testing.assert_allclose(
+        [pt.fractional_area for pt in out], expected.values, rtol=1e-7
+    )
+
+
+def test_projected_box_area():
+    lon = np.array([-117.5, -110.5, -104.2])
+    lat = np.array([31.3, 34.9, 37.8])
+    boxes = [
+        geometry.box(x - 0.01, y - 0.02, x + 0.01, y + 0.01) for x, y in zip(lon, lat)
+    ]
+    expected = geopandas.GeoSeries(boxes, crs="EPSG:4326").to_crs(nsrdb.CRS).area
+    out = nsrdb.projected_box_area(lon - 0.01, lat - 0.02, lon + 0.01, lat + 0.01)
+    np.testing.assert_allclose(out, expected.values, rtol=1e-9)
+
+
+def _legacy_point_data(ds, spatial_idx):
+    return (
+        ds.rename({"air_temperature": "temp_air"})
+        .isel(spatial_idx=spatial_idx)
+        .to_dataframe()
+        .set_index("times")
+        .tz_localize("UTC")
+        .astype("float32")
+    )
+
+
+def test_load_gridded_data(ready_dataset, mocker):
+    points = [
+        nsrdb.SpatialIndexPoint(spatial_idx=idx, fractional_area=0.25)
+        for idx in (7, 0, 11, 3)
+    ]
+    with ready_dataset.open_dataset() as ds:
+        chunked = ds.chunk({"spatial_idx": 5})
+        expected = [_legacy_point_data(ds, pt.spatial_idx) for pt in points]
+
+    @contextmanager
+    def _open():
+        yield chunked
+
+    mocker.patch.object(ready_dataset, "open_dataset", new=_open)
+    compute = mocker.spy(xr.Dataset, "compute")
+    out = ready_dataset.load_gridded_data(points)
+    # points lie in chunks 0 and 1 and 2, each read once
+    assert compute.call_count == 3
+    assert isinstance(out, models.GriddedSystemData)
+    assert out.fraction_of_total == [0.25] * 4
+    assert len(out.times) == 17280
+    assert str(out.times.tz) == "UTC"
+    for i, exp in enumerate(expected):
+        assert out.locations[i].latitude == exp.lat.iloc[0]
+        assert out.locations[i].longitude == exp.lon.iloc[0]
+        for k, v in out.weather_data.items():
+            assert v.dtype == np.float32
+            np.testing.assert_array_equal(v[:, i], exp[k].values)
+        for k in ("ghi", "dni", "dhi"):
+            np.testing.assert_array_equal(
+                out.clearsky_data[k][:, i], exp[f"clearsky_{k}"].values
+            )
+
+
+def test_load_times(system_def, ready_dataset):
+    times = ready_dataset.load_times()
+    data = ready_dataset.get_gridded_data(system_def)
+    pd.testing.assert_index_equal(times, data.times)
+
+
+def test_load_gridded_data_empty(ready_dataset):
+    with pytest.raises(ValueError):
+        ready_dataset.load_gridded_data([])
+
+
+def test_get_gridded_data(system_def, ready_dataset):
+    out = ready_dataset.get_gridded_data(system_def)
+    assert len(out.locations) == 12
+    assert out.weather_data["ghi"].shape == (17280, 12)
+    assert abs(sum(out.fraction_of_total) - 1) < 1e-6
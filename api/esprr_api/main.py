@@ -1,12 +1,14 @@
 import logging
 
 
+import anyio.to_thread
 from fastapi import FastAPI, Depends, Request
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.openapi.utils import get_openapi
 from fastapi.responses import JSONResponse
+from prometheus_client import REGISTRY  # type: ignore
 from prometheus_fastapi_instrumentator import Instrumentator  # type: ignore
 import sentry_sdk
 from sentry_sdk.integrations.asgi import SentryAsgiMiddleware
@@ -30,6 +32,7 @@ Instrumentator(
     env_var_name="ENABLE_METRICS",
     excluded_handlers=["/metrics", "/ping"],
 ).instrument(app).expose(app, include_in_schema=False, should_gzip=True)
+REGISTRY.register(queuing.QueueMetricsCollector())
 
 
 @app.get("/ping", include_in_schema=False)
@@ -45,8 +48,16 @@ class LogFilter(logging.Filter):
         return 1
 
 
+def set_threadpool_size(size: int) -> None:
+    """Limit the number of threads that the handlers of requests run in.
+    Handlers are plain functions that FastAPI runs in this threadpool, as the
+    storage calls block, so a slow query does not stall other requests."""
+    anyio.to_thread.current_default_thread_limiter().total_tokens = size
+
+
 @app.on_event("startup")
 async def startup_event():  # pragma: no cover
+    set_threadpool_size(settings.threadpool_size)
     storage.engine.connect()
     queuing.verify_redis_conn()
     await auth.get_auth_key()
@@ -3,6 +3,7 @@ from enum import Enum
 from typing import Any, Union, Optional, List, Dict
 
 
+import numpy as np
 import pandas as pd
 import pvlib  # type: ignore
 from pydantic import BaseModel, Field, root_validator, validator, PrivateAttr
@@ -273,6 +274,90 @@ class SystemData(ThisBase):
         return v
 
 
+WEATHER_VARIABLES = ("ghi", "dni", "dhi", "temp_air", "wind_speed")
+
+
+class GriddedSystemData(ThisBase):
+    """Weather data for every location of a system stacked into 2D arrays with
+    time along the first axis and location along the second"""
+
+    class Config:
+        arbitrary_types_allowed = True
+
+    times: pd.DatetimeIndex = Field(..., description="Times of each row of the data")
+    locations: List[Location] = Field(
+        ..., description="Location of each column of the data"
+    )
+    fraction_of_total: List[float] = Field(
+        ..., description="Fraction of total power for each location"
+    )
+    weather_data: Dict[str, np.ndarray] = Field(
+        ...,
+        description=(
+            "Has 'ghi', 'dni', 'dhi', 'temp_air', and 'wind_speed' arrays of "
+            "shape (times, locations)"
+        ),
+    )
+    clearsky_data: Dict[str, np.ndarray] = Field(
+        ...,
+        description=(
+            "Has 'ghi', 'dni', 'dhi', 'temp_air', and 'wind_speed' arrays of "
+            "shape (times, locations) in order to calculate expected clearsky power."
+        ),
+    )
+
+    @validator("weather_data", "clearsky_data")
+    def validate_arrays(cls, v):
+        if not set(v.keys()) == set(WEATHER_VARIABLES):
+            raise ValueError(
+                "Keys must be 'ghi', 'dni', 'dhi', 'temp_air' and 'wind_speed'"
+            )
+        return v
+
+    @root_validator(skip_on_failure=True)
+    def validate_shapes(cls, values):
+        shape = (len(values["times"]), len(values["locations"]))
+        if len(values["fraction_of_total"]) != shape[1]:
+            raise ValueError("Must have a fraction of total for each location")
+        for key in ("weather_data", "clearsky_data"):
+            if any(arr.shape != shape for arr in values[key].values()):
+                raise ValueError(f"All arrays must have shape {shape}")
+        return values
+
+    @classmethod
+    def from_system_data(cls, data: List[SystemData]) -> "GriddedSystemData":
+        """Stack the data of many single locations, which must share the
+        same times"""
+        if len(data) == 0:
+            raise ValueError("Must provide data for at least one location")
+        times = data[0].weather_data.index
+        return cls(
+            times=times,
+            locations=[d.location for d in data],
+            fraction_of_total=[d.fraction_of_total for d in data],
+            weather_data={
+                k: np.stack([d.weather_data[k].to_numpy() for d in data], axis=1)
+                for k in WEATHER_VARIABLES
+            },
+            clearsky_data={
+                k: np.stack([d.clearsky_data[k].to_numpy() for d in data], axis=1)
+                for k in WEATHER_VARIABLES
+            },
+        )
+
+    @property
+    def latitude(self) -> np.ndarray:
+        return np.array([loc.latitude for loc in self.locations])
+
+    @property
+    def longitude(self) -> np.ndarray:
+        return np.array([loc.longitude for loc in self.locations])
+
+    @property
+    def altitude(self) -> np.ndarray:
+        return np.array([loc.altitude for loc in self.locations])
+
+
 class DatasetEnum(str, Enum):
     nsrdb_2018 = "NSRDB_2018"
     nsrdb_2019 = "NSRDB_2019"
@@ -290,6 +375,21 @@ class DataStatusEnum(str, Enum):
     error = "error"
 
 
+class SystemDataset(ThisBase):
+    system_id: UUID = Field(..., description="ID of the system")
+    dataset: DatasetEnum = Field(
+        ..., description="Background dataset used to compute expected power"
+    )
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "system_id": "6b61d9ac-2e89-11eb-be2a-4dc7a6bcd0d9",
+                "dataset": "NSRDB_2019",
+            }
+        }
+
+
 class SystemDataMeta(ThisBase):
     system_id: UUID
     dataset: DatasetEnum
@@ -322,6 +422,7 @@ class ManagementSystemDataStatus(ThisBase):
     status: DataStatusEnum
     hash_changed: Optional[bool]
     user: str
+    modified_at: Optional[dt.datetime] = None
 
     def __hash__(self):
         return hash(
@@ -1,21 +1,39 @@
+import datetime as dt
+from enum import Enum
 import json
 import logging
 import time
-from typing import Union, Type, Tuple, List
+from typing import Dict, Iterable, Optional, Union, Type, Sequence, Tuple, List
 from uuid import UUID
+import zlib
 
 
-from redis import Redis, ConnectionPool
+from prometheus_client.core import GaugeMetricFamily  # type: ignore
+from redis import Redis, ConnectionPool, RedisError
 from rq import Queue  # type: ignore
-from rq.command import send_stop_job_command  # type: ignore
+from rq.command import send_command  # type: ignore
 from rq.exceptions import NoSuchJobError  # type: ignore
-from rq.job import Job  # type: ignore
+from rq.job import Job, JobStatus  # type: ignore
+from rq.utils import as_text, get_version, utcparse  # type: ignore
+from rq.worker_registration import WORKERS_BY_QUEUE_KEY  # type: ignore
 
 
 from . import settings, compute, models
+from .result_store import get_result_store, sweep_result_store
 
 
 logger = logging.getLogger(__name__)
+# separates the datasets in the key of a job modeling several datasets
+DATASETS_SEPARATOR = "+"
+# system data modified up to this long before the newest modification seen
+# by a sync pass is listed again by the next pass, in case it was modified
+# by a transaction that committed after that pass
+SYNC_JOBS_OVERLAP = dt.timedelta(minutes=1)
+UNSERVED_BULK_JOBS_MESSAGE = (
+    "%s bulk jobs are queued but no worker takes jobs from the bulk queues. "
+    "Start the workers with -w esprr_api.worker.PreloadedGridWorker, which "
+    "also takes jobs from the bulk queues of the queues it is given"
+)
 redis_pool = ConnectionPool(
     host=settings.redis_host,
     port=settings.redis_port,
@@ -40,6 +58,28 @@ def _get_queue(name, redis_conn):
     return Queue(name, connection=redis_conn)
 
 
+class JobPriority(str, Enum):
+    """Jobs a user is waiting on are interactive, while runs of many systems
+    and reruns by sync_jobs are bulk"""
+
+    interactive = "interactive"
+    bulk = "bulk"
+
+
+def bulk_queue_names(queue_name: str = "jobs") -> List[str]:
+    """Names of the bulk queues of queue_name. Each user's bulk jobs go to one
+    of these queues and workers take jobs from them in turn, so users sharing
+    the workers get similar shares of them (stochastic fair queuing)"""
+    return [f"{queue_name}-bulk-{i}" for i in range(settings.bulk_queue_count)]
+
+
+def queue_priority(queue_name: str) -> JobPriority:
+    """The priority of the jobs in the queue named queue_name"""
+    if "-bulk" in queue_name:
+        return JobPriority.bulk
+    return JobPriority.interactive
+
+
 class QueueManager:
     def __init__(
         self,
@@ -47,12 +87,22 @@ class QueueManager:
     ):
         self.redis_conn = _get_redis_conn()
         self.q = _get_queue(queue_name, self.redis_conn)
+        self.bulk_queues = [
+            _get_queue(name, self.redis_conn) for name in bulk_queue_names(queue_name)
+        ]
         self.job_func = compute.run_job
+        self.datasets_job_func = compute.run_datasets_job
+
+    @property
+    def queues(self) -> List[Queue]:
+        """The interactive queue followed by the bulk queues"""
+        return [self.q, *self.bulk_queues]
 
     @property
     def registries(self):
         return [
-            getattr(self.q, reg)
+            getattr(q, reg)
+            for q in self.queues
             for reg in (
                 "started_job_registry",
                 "deferred_job_registry",
@@ -62,42 +112,199 @@ class QueueManager:
             )
         ]
 
+    def get_queue(self, priority: JobPriority, user: str) -> Queue:
+        """The queue of the user's jobs with priority"""
+        if priority == JobPriority.interactive:
+            return self.q
+        # crc32 rather than hash so every process picks the same queue
+        return self.bulk_queues[zlib.crc32(user.encode()) % len(self.bulk_queues)]
+
+    def queued_job_ids(self) -> List[str]:
+        """The ids of the jobs in every queue, read in one round trip"""
+        with self.redis_conn.pipeline() as pipe:
+            for q in self.queues:
+                pipe.lrange(q.key, 0, -1)
+            return [as_text(job_id) for ids in pipe.execute() for job_id in ids]
+
+    def _registry_job_ids(self, registry_name: str) -> List[str]:
+        """The ids of the jobs in the registry of every queue in one round trip"""
+        with self.redis_conn.pipeline() as pipe:
+            for q in self.queues:
+                pipe.zrange(getattr(q, registry_name).key, 0, -1)
+            return [as_text(job_id) for ids in pipe.execute() for job_id in ids]
+
+    def worker_counts(self) -> Dict[JobPriority, int]:
+        """The number of workers taking jobs from the queues of each priority"""
+        with self.redis_conn.pipeline() as pipe:
+            for q in self.queues:
+                pipe.smembers(WORKERS_BY_QUEUE_KEY % q.name)
+            members = pipe.execute()
+        return _count_workers(self.queues, members)
+
+    def check_bulk_workers(self) -> bool:
+        """Log an error and return False if bulk jobs are queued but no worker
+        takes jobs from the bulk queues, as when the workers are started with
+        the default rq worker class and only the interactive queue"""
+        with self.redis_conn.pipeline() as pipe:
+            for q in self.bulk_queues:
+                pipe.llen(q.key)
+            queued = sum(pipe.execute())
+        if queued and self.worker_counts()[JobPriority.bulk] == 0:
+            logger.error(UNSERVED_BULK_JOBS_MESSAGE, queued)
+            return False
+        return True
+
+    def failed_job_ids(self) -> List[str]:
+        """The ids of the jobs in the failed job registry of every queue"""
+        return self._registry_job_ids("failed_job_registry")
+
     def generate_key(
         self, system_id: Union[UUID, str], dataset: Union[models.DatasetEnum, str]
     ) -> str:
         return f"{str(system_id)}:{dataset}"
 
-    def decompose_key(self, inp: str) -> Tuple[str, str]:
-        return tuple(inp.split(":"))  # type: ignore
+    def generate_datasets_key(
+        self,
+        system_id: Union[UUID, str],
+        datasets: Sequence[Union[models.DatasetEnum, str]],
+    ) -> str:
+        """Key of the job that models the system with all of the datasets"""
+        return self.generate_key(
+            system_id, DATASETS_SEPARATOR.join(f"{ds}" for ds in datasets)
+        )
+
+    def expand_key(self, inp: str) -> List[str]:
+        """The keys of each system and dataset modeled by the job with key inp"""
+        system_id, _, datasets = inp.partition(":")
+        return [
+            self.generate_key(system_id, ds)
+            for ds in datasets.split(DATASETS_SEPARATOR)
+        ]
+
+    def active_job_ids(self) -> Dict[str, str]:
+        """The id of the queued or started job modeling each system and
+        dataset, keyed by the key of the system and dataset, including the
+        jobs that model the system with several datasets. Read in one round
+        trip to Redis."""
+        with self.redis_conn.pipeline() as pipe:
+            for q in self.queues:
+                pipe.lrange(q.key, 0, -1)
+                pipe.zrange(q.started_job_registry.key, 0, -1)
+            job_ids = [as_text(job_id) for ids in pipe.execute() for job_id in ids]
+        return {key: job_id for job_id in job_ids for key in self.expand_key(job_id)}
 
     def enqueue_job(
         self,
         system_id: Union[UUID, str],
         dataset: Union[models.DatasetEnum, str],
         user: str,
+        priority: JobPriority = JobPriority.interactive,
     ) -> Type[Job]:
+        """Enqueue the job if it does not exist, and no queued or started job
+        models the system with several datasets including this one. An
+        interactive job that is still waiting in a bulk queue is moved to the
+        interactive queue, along with any other datasets of that job."""
         # check if job already exists
         key = self.generate_key(system_id, dataset)
+        job_id = self.active_job_ids().get(key, key)
+        queue = self.get_queue(priority, user)
         job: Type[Job]
         try:
-            job = Job.fetch(key, connection=self.redis_conn)
+            job = Job.fetch(job_id, connection=self.redis_conn)
         except NoSuchJobError:
-            job = Job.create(
-                self.job_func,
-                args=(system_id, dataset, user),
-                id=key,
-                result_ttl=0,
-                timeout="10m",
-                failure_ttl=3600 * 24 * 14,
-                connection=self.redis_conn,
-            )
-            self.q.enqueue_job(job)
+            job = self._create_job(system_id, dataset, user)
+            queue.enqueue_job(job)
+        else:
+            if (
+                priority == JobPriority.interactive
+                and job.origin != queue.name
+                and job.get_status() == JobStatus.QUEUED
+                # a worker may have just taken the job
+                and _get_queue(job.origin, self.redis_conn).remove(job)
+            ):
+                queue.enqueue_job(job)
+        return job
+
+    def _create_job(
+        self,
+        system_id: Union[UUID, str],
+        dataset: Union[models.DatasetEnum, str],
+        user: str,
+    ) -> Type[Job]:
+        job: Type[Job] = Job.create(
+            self.job_func,
+            args=(system_id, dataset, user),
+            id=self.generate_key(system_id, dataset),
+            result_ttl=0,
+            timeout="10m",
+            failure_ttl=3600 * 24 * 14,
+            connection=self.redis_conn,
+        )
         return job
 
+    def _create_datasets_job(
+        self,
+        system_id: Union[UUID, str],
+        datasets: Sequence[Union[models.DatasetEnum, str]],
+        user: str,
+    ) -> Type[Job]:
+        job: Type[Job] = Job.create(
+            self.datasets_job_func,
+            args=(system_id, list(datasets), user),
+            id=self.generate_datasets_key(system_id, datasets),
+            result_ttl=0,
+            timeout=f"{10 * len(datasets)}m",
+            failure_ttl=3600 * 24 * 14,
+            connection=self.redis_conn,
+        )
+        return job
+
+    def enqueue_jobs(
+        self,
+        items: Sequence[Tuple[Union[UUID, str], Union[models.DatasetEnum, str]]],
+        user: str,
+        priority: JobPriority = JobPriority.bulk,
+    ) -> List[Type[Job]]:
+        """Enqueue the jobs of many (system_id, dataset) pairs that are not
+        already in the queue, fetching the existing jobs and enqueuing the
+        new ones each in a single round trip to Redis. Pairs modeled by a
+        queued or started job of several datasets are also skipped. All new
+        datasets of a system are modeled by a single job. Returns the new
+        jobs."""
+        unique = {
+            self.generate_key(system_id, dataset): (system_id, dataset)
+            for system_id, dataset in items
+        }
+        existing = Job.fetch_many(list(unique), connection=self.redis_conn)
+        active = self.active_job_ids()
+        by_system: Dict[str, List[Union[models.DatasetEnum, str]]] = {}
+        for (key, (system_id, dataset)), job in zip(unique.items(), existing):
+            if job is None and key not in active:
+                by_system.setdefault(str(system_id), []).append(dataset)
+        new = [
+            self._create_job(system_id, datasets[0], user)
+            if len(datasets) == 1
+            else self._create_datasets_job(system_id, datasets, user)
+            for system_id, datasets in by_system.items()
+        ]
+        if new:
+            queue = self.get_queue(priority, user)
+            # synchronous queues run each job as it is enqueued
+            pipe = self.redis_conn.pipeline() if queue.is_async else None
+            # otherwise each job asks Redis for the server version when saved
+            version = get_version(self.redis_conn)
+            for job in new:
+                job.redis_server_version = version
+                queue.enqueue_job(job, pipeline=pipe)
+            if pipe is not None:
+                pipe.execute()
+        return new
+
     def job_is_running(
         self, system_id: UUID, dataset: Union[models.DatasetEnum, str]
     ) -> bool:
-        """Return if the job has been started"""
+        """Return if the job, or a job modeling the system with several
+        datasets including this one, has been started"""
         key = self.generate_key(system_id, dataset)
         try:
             job = Job.fetch(key, connection=self.redis_conn)
@@ -106,69 +313,112 @@ class QueueManager:
         else:
             if job.started_at is not None:
                 return True
-        return False
+        return any(
+            key in self.expand_key(job_id)
+            for job_id in self._registry_job_ids("started_job_registry")
+            if DATASETS_SEPARATOR in job_id
+        )
 
     def delete_job(
         self, system_id: Union[UUID, str], dataset: Union[models.DatasetEnum, str]
     ):
         """Try removing the job if present in any registries"""
-        key = self.generate_key(system_id, dataset)
-        try:
-            send_stop_job_command(self.redis_conn, key)
-        except Exception:
-            pass
-        for registry in self.registries:
-            try:
-                registry.remove(key, delete_job=True)
-            except Exception:
-                pass
+        self.delete_jobs([self.generate_key(system_id, dataset)])
+
+    def delete_jobs(self, job_ids: Sequence[str]):
+        """Stop the jobs that are running and remove the jobs from the queue
+        and every registry, fetching the jobs in one round trip to Redis and
+        removing them in another"""
+        if len(job_ids) == 0:
+            return
+        jobs = Job.fetch_many(list(job_ids), connection=self.redis_conn)
+        registries = self.registries
+        with self.redis_conn.pipeline() as pipe:
+            for job_id, job in zip(job_ids, jobs):
+                if job is None:
+                    # still remove the id from the queue and registries
+                    job = Job(job_id, connection=self.redis_conn)
+                elif job.worker_name:
+                    # like send_stop_job_command without fetching the job again
+                    send_command(pipe, job.worker_name, "stop-job", job_id=job_id)
+                for q in self.queues:
+                    q.remove(job_id, pipeline=pipe)
+                for registry in registries:
+                    registry.remove(job_id, pipeline=pipe)
+                pipe.delete(job.key, job.dependents_key, job.dependencies_key)
+            pipe.execute()
 
     def remove_invalid_jobs(
-        self, current_status: List[models.ManagementSystemDataStatus]
+        self,
+        current_status: List[models.ManagementSystemDataStatus],
+        job_ids: Optional[List[str]] = None,
     ):
         """Remove jobs from any queue that are complete or have been
-        deleted from the database"""
-        all_jobs = []
-        jobs_to_remove_if_present = []
+        deleted from the database. Jobs modeling several datasets are only
+        removed if this is true of every dataset. current_status must include
+        every system and dataset of the queued jobs, or of job_ids if given."""
+        all_jobs = set()
+        jobs_to_remove_if_present = set()
         for m in current_status:
             key = self.generate_key(m.system_id, m.dataset)
-            all_jobs.append(key)
+            all_jobs.add(key)
             if m.status == "complete" and not m.hash_changed:
-                jobs_to_remove_if_present.append(key)
-
-        i = 0
-        for job_id in self.q.job_ids:
-            if job_id not in all_jobs or job_id in jobs_to_remove_if_present:
-                self.delete_job(*self.decompose_key(job_id))
-                i += 1
-        if i:
+                jobs_to_remove_if_present.add(key)
+
+        invalid = [
+            job_id
+            for job_id in (self.queued_job_ids() if job_ids is None else job_ids)
+            if all(
+                key not in all_jobs or key in jobs_to_remove_if_present
+                for key in self.expand_key(job_id)
+            )
+        ]
+        self.delete_jobs(invalid)
+        if i := len(invalid):
             logger.info("Removed %s invalid jobs from the queues", i)
 
     def add_missing_jobs(self, current_status: List[models.ManagementSystemDataStatus]):
         """Add jobs to the queue that are missing but present in the database
-        and not complete"""
-        i = 0
+        and not complete, enqueuing the jobs of each user with enqueue_jobs"""
+        active = self.active_job_ids()
+        missing: Dict[str, List[Tuple[UUID, str]]] = {}
         for m in current_status:
             if (m.status == "queued" or m.hash_changed) and self.generate_key(
                 m.system_id, m.dataset
-            ) not in self.q.job_ids:
-                self.enqueue_job(m.system_id, m.dataset, m.user)
-                i += 1
+            ) not in active:
+                missing.setdefault(m.user, []).append((m.system_id, m.dataset))
+        i = sum(len(self.enqueue_jobs(items, user)) for user, items in missing.items())
         if i:
             logger.info("Enqueuing %s missing jobs", i)
 
     def evaluate_failed_jobs(
-        self, current_status: List[models.ManagementSystemDataStatus]
+        self,
+        current_status: List[models.ManagementSystemDataStatus],
+        failed_job_ids: Optional[List[str]] = None,
     ) -> List[Tuple[str, str, str]]:
         """If job has gotten to the failed job registry, some uncaught error
-        happened. Return the data needed to update errors in the db."""
+        happened. Return the data needed to update errors in the db. For jobs
+        modeling several datasets, datasets that were completed by the job
+        are not reported. Only failed_job_ids are evaluated, if given."""
 
         jobd = {self.generate_key(m.system_id, m.dataset): m for m in current_status}
-        out = []
-
-        for failed_job in self.q.failed_job_registry.get_job_ids():
-            if failed_job in jobd:
-                exc_info = Job.fetch(failed_job, connection=self.redis_conn).exc_info
+        out: List[Tuple[str, str, str]] = []
+        if failed_job_ids is None:
+            failed_job_ids = self.failed_job_ids()
+        failed_jobs = Job.fetch_many(failed_job_ids, connection=self.redis_conn)
+
+        for failed_job, job in zip(failed_job_ids, failed_jobs):
+            if DATASETS_SEPARATOR in failed_job:
+                keys = [
+                    key
+                    for key in self.expand_key(failed_job)
+                    if key in jobd
+                    and (jobd[key].status != "complete" or jobd[key].hash_changed)
+                ]
+            else:
+                keys = [failed_job] if failed_job in jobd else []
+            if keys:
+                exc_info = job.exc_info if job is not None else None
                 logger.error("Job %s failed with %s", failed_job, exc_info)
                 msg = json.dumps(
                     {
@@ -180,47 +430,185 @@ class QueueManager:
                         }
                     }
                 )
-                out.append(
-                    (str(jobd[failed_job].system_id), jobd[failed_job].dataset, msg)
+                out.extend(
+                    (str(jobd[key].system_id), jobd[key].dataset, msg) for key in keys
                 )
-            self.q.failed_job_registry.remove(failed_job, delete_job=True)
+        self.delete_jobs(failed_job_ids)
         if lo := len(out):
             logger.info("%s jobs processed from failed job registry", lo)
         return out
 
 
+class QueueMetricsCollector:
+    """Prometheus collector of the number of jobs waiting in the queues of
+    each priority, how long the oldest of them has waited and how many
+    workers take jobs from them, read from Redis in two round trips when the
+    metrics are scraped. Bulk jobs waiting with no bulk worker are also
+    logged as an error."""
+
+    def __init__(self, queue_name: str = "jobs"):
+        self.queue_name = queue_name
+
+    @staticmethod
+    def _families() -> Tuple[GaugeMetricFamily, GaugeMetricFamily, GaugeMetricFamily]:
+        depth = GaugeMetricFamily(
+            "esprr_queue_depth",
+            "Number of jobs waiting in the queues of each priority",
+            labels=["priority"],
+        )
+        wait = GaugeMetricFamily(
+            "esprr_queue_oldest_job_wait_seconds",
+            "Time the oldest job waiting in the queues of each priority has waited",
+            labels=["priority"],
+        )
+        workers = GaugeMetricFamily(
+            "esprr_queue_workers",
+            "Number of workers taking jobs from the queues of each priority",
+            labels=["priority"],
+        )
+        return depth, wait, workers
+
+    def describe(self):
+        # so registering the collector does not read the queues
+        return list(self._families())
+
+    def collect(self):
+        depth, wait, workers = self._families()
+        try:
+            depths, waits, worker_counts = self.read()
+        except RedisError:
+            logger.exception("Failed to read the queues for metrics")
+            return
+        if depths[JobPriority.bulk] and not worker_counts[JobPriority.bulk]:
+            logger.error(UNSERVED_BULK_JOBS_MESSAGE, depths[JobPriority.bulk])
+        for priority in JobPriority:
+            depth.add_metric([priority.value], depths[priority])
+            wait.add_metric([priority.value], waits[priority])
+            workers.add_metric([priority.value], worker_counts[priority])
+        yield depth
+        yield wait
+        yield workers
+
+    def read(
+        self,
+    ) -> Tuple[
+        Dict[JobPriority, int], Dict[JobPriority, float], Dict[JobPriority, int]
+    ]:
+        qm = QueueManager(self.queue_name)
+        with qm.redis_conn.pipeline() as pipe:
+            for q in qm.queues:
+                pipe.llen(q.key)
+                pipe.lindex(q.key, 0)
+                pipe.smembers(WORKERS_BY_QUEUE_KEY % q.name)
+            counts = pipe.execute()
+        with qm.redis_conn.pipeline() as pipe:
+            for first in counts[1::3]:
+                pipe.hget(Job.key_for(as_text(first or "")), "enqueued_at")
+            enqueued = pipe.execute()
+        now = dt.datetime.utcnow()
+        depths = {priority: 0 for priority in JobPriority}
+        waits = {priority: 0.0 for priority in JobPriority}
+        for q, length, enqueued_at in zip(qm.queues, counts[::3], enqueued):
+            priority = queue_priority(q.name)
+            depths[priority] += length
+            if enqueued_at:
+                waited = (now - utcparse(as_text(enqueued_at))).total_seconds()
+                waits[priority] = max(waits[priority], waited)
+        return depths, waits, _count_workers(qm.queues, counts[2::3])
+
+
+def _count_workers(queues: List[Queue], members: List[set]) -> Dict[JobPriority, int]:
+    """The number of unique workers in the worker sets of the queues of each
+    priority, as one worker may take jobs from several queues"""
+    workers: Dict[JobPriority, set] = {priority: set() for priority in JobPriority}
+    for q, names in zip(queues, members):
+        workers[queue_priority(q.name)].update(names)
+    return {priority: len(names) for priority, names in workers.items()}
+
+
 def _get_compute_management_interface():  # pragma: no cover
     from .storage import ComputeManagementInterface
 
     return ComputeManagementInterface()
 
 
+def _job_pairs(keys: Iterable[str]) -> List[Tuple[UUID, str]]:
+    """The (system_id, dataset) pairs of job keys, ignoring any other job ids"""
+    out = []
+    for key in keys:
+        system_id, _, dataset = key.partition(":")
+        try:
+            out.append((UUID(system_id), dataset))
+        except ValueError:
+            continue
+    return out
+
+
+def sync_jobs_pass(
+    cmi, qm: QueueManager, since: Optional[dt.datetime] = None
+) -> Optional[dt.datetime]:
+    """Enqueue the missing jobs of system data modified since ``since``, or of
+    all system data if None, then remove invalid jobs and report failed jobs
+    using the status of only the system data of jobs in the queue or the
+    failed job registry. Returns the ``since`` of the next pass."""
+    with cmi.start_transaction() as jst:
+        changed = jst.list_system_data_status_since(
+            since - SYNC_JOBS_OVERLAP if since is not None else None
+        )
+    qm.add_missing_jobs(changed)
+
+    job_ids = qm.queued_job_ids()
+    failed_job_ids = qm.failed_job_ids()
+    keys = {key for job_id in job_ids + failed_job_ids for key in qm.expand_key(job_id)}
+    with cmi.start_transaction() as jst:
+        current_status = jst.list_system_data_status_of(_job_pairs(sorted(keys)))
+        qm.remove_invalid_jobs(current_status, job_ids)
+        failed_jobs = qm.evaluate_failed_jobs(current_status, failed_job_ids)
+        for system_id, dataset, msg in failed_jobs:
+            jst.report_failure(system_id, dataset, msg)
+    qm.check_bulk_workers()
+    return max(
+        (m.modified_at for m in changed if m.modified_at is not None), default=since
+    )
+
+
 def sync_jobs():
-    """Keep jobs between the RQ queue and database in sync"""
+    """Keep jobs between the RQ queue and database in sync. The first pass,
+    and every sync_jobs_full_pass_every pass after it, checks all system data
+    so that jobs lost from Redis are added again. The other passes only check
+    the system data modified since the previous pass and the system data of
+    the queued and failed jobs.
+    Results no longer referenced are also swept out of the result store, if
+    one is configured, every result_store_sweep_period."""
     cmi = _get_compute_management_interface()
     qm = QueueManager()
+    store = get_result_store()
 
     logging.basicConfig(format="%(asctime)s %(levelname)s %(message)s", level="INFO")
+    since = None
+    last_sweep = None
+    passes = 0
     while True:
         try:
+            if store is not None and (
+                last_sweep is None
+                or time.monotonic() - last_sweep >= settings.result_store_sweep_period
+            ):
+                sweep_result_store(
+                    store,
+                    cmi.list_result_references,
+                    dt.timedelta(seconds=settings.result_store_sweep_grace),
+                )
+                last_sweep = time.monotonic()
+            if passes % settings.sync_jobs_full_pass_every == 0:
+                since = None
             logger.info(
-                "Adding missing jobs, removing invalid jobs, and "
-                "cleaning up failed jobs"
+                "Adding missing jobs of system data modified since %s, removing "
+                "invalid jobs, and cleaning up failed jobs",
+                since,
             )
-            # add missing jobs
-            with cmi.start_transaction() as jst:
-                current_status = jst.list_system_data_status()
-            qm.add_missing_jobs(current_status)
-            # remove invalid
-            with cmi.start_transaction() as jst:
-                current_status = jst.list_system_data_status()
-            qm.remove_invalid_jobs(current_status)
-            # cleanup failed job registry
-            with cmi.start_transaction() as jst:
-                most_current_status = jst.list_system_data_status()
-                failed_jobs = qm.evaluate_failed_jobs(most_current_status)
-                for system_id, dataset, msg in failed_jobs:
-                    jst.report_failure(system_id, dataset, msg)
+            since = sync_jobs_pass(cmi, qm, since)
+            passes += 1
             time.sleep(settings.sync_jobs_period)
         except KeyboardInterrupt:
             break
@@ -0,0 +1,200 @@
+"""Content addressed storage of the timeseries and statistics results outside
+of MySQL. When a result store is configured, MySQL only keeps a reference to
+the SHA-256 digest of each result in place of the result itself. Results
+are shared by every row with the same digest, so results that are no longer
+referenced are only removed by a periodic sweep (see sweep_result_store).
+"""
+from abc import ABC, abstractmethod
+import datetime as dt
+from functools import lru_cache
+import hashlib
+import logging
+import os
+from pathlib import Path
+import tempfile
+from typing import Any, Callable, Iterator, Optional, Set
+
+
+from . import settings
+
+
+logger = logging.getLogger(__name__)
+REFERENCE_PREFIX = b"esprr-result:sha256:"
+
+
+def is_reference(data: bytes) -> bool:
+    """If data is a reference to a result in a result store"""
+    return data.startswith(REFERENCE_PREFIX)
+
+
+def reference_digest(data: bytes) -> str:
+    """The digest of the result a reference points to"""
+    return data[len(REFERENCE_PREFIX) :].decode()
+
+
+class ResultStore(ABC):
+    """Base class of stores of result bytes addressed by their digest"""
+
+    @abstractmethod
+    def put(self, data: bytes) -> str:
+        """Store data if it is not already stored and return its digest.
+        Storing data again marks it as stored now, so that a sweep does not
+        remove it before the new reference to it is saved."""
+
+    @abstractmethod
+    def get(self, digest: str) -> bytes:
+        """Get the data with digest, raising a KeyError if it isn't stored"""
+
+    @abstractmethod
+    def digests(self, stored_before: dt.datetime) -> Iterator[str]:
+        """The digests of the data last stored before stored_before"""
+
+    @abstractmethod
+    def delete(self, digest: str) -> None:
+        """Remove the data with digest, if it is stored"""
+
+    def local_path(self, digest: str) -> Optional[Path]:
+        """A local file with the data that can be served directly, if any"""
+        return None
+
+    def store(self, data: Optional[bytes]) -> Optional[bytes]:
+        """Put data in the store and return the reference to keep in its place"""
+        if data is None:
+            return None
+        return REFERENCE_PREFIX + self.put(data).encode()
+
+    def load(self, data: bytes) -> bytes:
+        """Get the data a reference points to, or data itself if it is not a
+        reference, e.g. for results stored before the store was configured"""
+        if not is_reference(data):
+            return data
+        return self.get(reference_digest(data))
+
+
+class FileResultStore(ResultStore):
+    """Results stored in files under path named by their digest"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.path.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest: str) -> Path:
+        return self.path / digest[:2] / digest[2:]
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        try:
+            os.utime(path)
+            return digest
+        except FileNotFoundError:
+            pass
+        path.parent.mkdir(exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        try:
+            return self._path(digest).read_bytes()
+        except FileNotFoundError:
+            raise KeyError(digest)
+
+    def local_path(self, digest: str) -> Optional[Path]:
+        path = self._path(digest)
+        return path if path.exists() else None
+
+    def digests(self, stored_before: dt.datetime) -> Iterator[str]:
+        before = stored_before.timestamp()
+        for path in self.path.glob("??/*"):
+            if path.name.startswith(".tmp-"):
+                continue
+            try:
+                if path.stat().st_mtime < before:
+                    yield path.parent.name + path.name
+            except FileNotFoundError:
+                continue
+
+    def delete(self, digest: str) -> None:
+        self._path(digest).unlink(missing_ok=True)
+
+
+class S3ResultStore(ResultStore):
+    """Results stored as objects in an S3 compatible bucket, keyed by
+    their digest. A local S3 compatible server like MinIO can stand in for S3
+    by setting endpoint_url. Requires boto3 unless a client is given."""
+
+    def __init__(self, bucket: str, client: Any = None, **client_kwargs) -> None:
+        if client is None:
+            import boto3  # type: ignore
+
+            client = boto3.client("s3", **client_kwargs)
+        self.bucket = bucket
+        self.client = client
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        self.client.put_object(Bucket=self.bucket, Key=digest, Body=data)
+        return digest
+
+    def get(self, digest: str) -> bytes:
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=digest)
+        except self.client.exceptions.NoSuchKey:
+            raise KeyError(digest)
+        out: bytes = obj["Body"].read()
+        return out
+
+    def digests(self, stored_before: dt.datetime) -> Iterator[str]:
+        kwargs = {"Bucket": self.bucket}
+        while True:
+            resp = self.client.list_objects_v2(**kwargs)
+            for obj in resp.get("Contents", []):
+                if obj["LastModified"] < stored_before:
+                    yield obj["Key"]
+            if not resp.get("IsTruncated"):
+                break
+            kwargs["ContinuationToken"] = resp["NextContinuationToken"]
+
+    def delete(self, digest: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=digest)
+
+
+@lru_cache(maxsize=None)
+def get_result_store() -> Optional[ResultStore]:
+    """The result store configured in settings, or None if results are
+    stored in MySQL"""
+    if settings.result_store_path is not None:
+        return FileResultStore(settings.result_store_path)
+    if settings.result_store_s3_bucket is not None:
+        return S3ResultStore(
+            settings.result_store_s3_bucket,
+            endpoint_url=settings.result_store_s3_endpoint_url,
+        )
+    return None
+
+
+def sweep_result_store(
+    store: ResultStore,
+    list_references: Callable[[], Set[str]],
+    grace: dt.timedelta,
+) -> int:
+    """Remove the results that are not referenced, as listed by
+    list_references, and were stored longer than grace ago. The grace keeps
+    results that were just stored by a job that has not yet saved the
+    reference to them. Returns the number of results removed."""
+    stored_before = dt.datetime.now(dt.timezone.utc) - grace
+    referenced = list_references()
+    removed = 0
+    for digest in list(store.digests(stored_before)):
+        if digest not in referenced:
+            store.delete(digest)
+            removed += 1
+    logger.info("Removed %s unreferenced results from the result store", removed)
+    return removed
@@ -1,17 +1,32 @@
+from io import BytesIO
 import logging
 from typing import List, Optional, Union
 
 
-from fastapi import APIRouter, Header, Response, Request, Depends, Path, HTTPException
+from fastapi import (
+    APIRouter,
+    BackgroundTasks,
+    Header,
+    HTTPException,
+    Response,
+    Request,
+    Depends,
+    Path,
+)
+import numpy as np
 import pandas as pd
+import pyarrow as pa  # type: ignore
 from pydantic.types import UUID
 
 
 from . import default_get_responses
-from .. import models, utils
+from .systems import run_system_models
+from .. import models, utils, __version__
+from ..auth import get_user_id
 from ..storage import StorageInterface
 from ..queuing import QueueManager
 from ..compute import compute_group_statistics
+from ..table_cache import result_key, table_cache
 
 
 router = APIRouter()
@@ -21,7 +36,7 @@ logger = logging.getLogger(__name__)
 @router.get(
     "/", response_model=List[models.StoredSystemGroup], responses=default_get_responses
 )
-async def list_system_groups(
+def list_system_groups(
     storage: StorageInterface = Depends(StorageInterface),
 ) -> List[models.StoredSystemGroup]:
     """List available system groups"""
@@ -56,7 +71,7 @@ system_group_links = {
     },
     status_code=201,
 )
-async def create_system_group(
+def create_system_group(
     system_group: models.BaseSystemGroup,
     response: Response,
     request: Request,
@@ -84,7 +99,7 @@ syspath = Path(..., description="ID of a system", example=models.SYSTEM_ID)
         200: {"links": system_group_links},
     },
 )
-async def get_system_group(
+def get_system_group(
     group_id: UUID = grouppath,
     storage: StorageInterface = Depends(StorageInterface),
 ) -> models.StoredSystemGroup:
@@ -100,7 +115,7 @@ async def get_system_group(
     responses={**default_get_responses, 204: {}},
     status_code=204,
 )
-async def delete_system_group(
+def delete_system_group(
     group_id: UUID = grouppath,
     storage: StorageInterface = Depends(StorageInterface),
 ):
@@ -119,7 +134,7 @@ async def delete_system_group(
     },
     status_code=201,
 )
-async def update_system_group(
+def update_system_group(
     system_group: models.BaseSystemGroup,
     response: Response,
     request: Request,
@@ -146,7 +161,7 @@ async def update_system_group(
     },
     status_code=201,
 )
-async def add_system_to_group(
+def add_system_to_group(
     response: Response,
     request: Request,
     group_id: UUID = grouppath,
@@ -172,7 +187,7 @@ async def add_system_to_group(
     },
     status_code=201,
 )
-async def remove_system_from_group(
+def remove_system_from_group(
     response: Response,
     request: Request,
     group_id: UUID = grouppath,
@@ -200,7 +215,7 @@ datasetpath = Path(
     response_model=models.SystemGroupDataMeta,
     responses=default_get_responses,
 )
-async def get_group_model_status(
+def get_group_model_status(
     group_id: UUID = grouppath,
     dataset: models.DatasetEnum = datasetpath,
     storage: StorageInterface = Depends(StorageInterface),
@@ -209,21 +224,12 @@ async def get_group_model_status(
     """Get status of model data for each system in the group"""
     with storage.start_transaction() as st:
         group: models.StoredSystemGroup = st.get_system_group(group_id)
-    data_status = {}
-    for system in group.definition.systems:  # type: ignore
-        system_id = system.object_id
-        with storage.start_transaction() as st:
-            try:
-                out: models.SystemDataMeta = st.get_system_model_meta(
-                    system_id, dataset
-                )
-            except HTTPException:
-                continue
+        data_status = st.get_group_model_meta(group_id, dataset)
+    for system_id, out in data_status.items():
         if out.status == "queued":
             # if queued/prepared and job started by q, "running"
             if qm.job_is_running(system_id, dataset):
                 out.status = models.DataStatusEnum("running")
-        data_status[system_id] = out.dict()
     group_data_meta = models.SystemGroupDataMeta(
         modified_at=group.modified_at,
         created_at=group.created_at,
@@ -233,78 +239,160 @@ async def get_group_model_status(
     return group_data_meta
 
 
-def _get_group_timeseries_from_systems(
-    storage: StorageInterface, systems, dataset: models.DatasetEnum = datasetpath
+@router.post(
+    "/{group_id}/data/{dataset}",
+    status_code=202,
+    responses={**default_get_responses, 202: {}},
+)
+def run_group_models(
+    background_tasks: BackgroundTasks,
+    group_id: UUID = grouppath,
+    dataset: models.DatasetEnum = datasetpath,
+    storage: StorageInterface = Depends(StorageInterface),
+    user: str = Depends(get_user_id),
+    qm: QueueManager = Depends(QueueManager),
 ):
-    """Get a dataframe of dataset timeseries results given the systems of
-    a System Group.
+    """Run the model of every system in the group for the dataset"""
+    with storage.start_transaction() as st:
+        group: models.StoredSystemGroup = st.get_system_group(group_id)
+    systems = group.definition.systems  # type: ignore
+    run_system_models(
+        storage,
+        qm,
+        background_tasks,
+        [(system.object_id, dataset) for system in systems],
+        user,
+    )
+
+
+GROUP_POWER_COLUMNS = (
+    "ac_power",
+    "dc_power",
+    "clearsky_ac_power",
+    "clearsky_dc_power",
+)
+
+
+def _get_group_timeseries_from_systems(
+    storage: StorageInterface,
+    group: models.StoredSystemGroup,
+    dataset: models.DatasetEnum = datasetpath,
+    include_systems: bool = True,
+) -> pa.Table:
+    """Get an Arrow table of the summed dataset timeseries results of the
+    systems of a System Group.
 
     Parameters
     ----------
-    st
-    systems
+    storage
+    group
     dataset
+    include_systems
+        If True, also include the columns of each system prefixed by
+        the system name after the summed columns.
     """
-    group_data = []
-    for system in systems:
-        system_id = system.object_id
-        with storage.start_transaction() as st:
-            data = st.get_system_model_timeseries(system_id, dataset)
-            data = utils.read_arrow(data)
-            data = data.set_index("time")
-            csv_safe_name = system.definition.name.replace(",", "").replace(" ", "_")
-            data = data.rename(
-                columns={col: f"{csv_safe_name}_{col}" for col in data.columns}
-            )
-            group_data.append(data)
-    if len(group_data) > 0:
-        group_df = pd.concat(group_data, axis=1)
-
-        clearsky_ac_cols = [
-            col for col in group_df.columns if "_clearsky_ac_power" in col
-        ]
-        clearsky_dc_cols = [
-            col for col in group_df.columns if "_clearsky_dc_power" in col
-        ]
-        ac_power_cols = [
-            col
-            for col in group_df.columns
-            if "_ac_power" in col and "clearsky" not in col
+    systems = group.definition.systems  # type: ignore
+    with storage.start_transaction() as st:
+        tags = st.get_group_model_result_tags(group.object_id, dataset)
+        keys = [
+            result_key(system.object_id, dataset, "timeseries", tags[system.object_id])
+            if system.object_id in tags
+            else None
+            for system in systems
         ]
-        dc_power_cols = [
-            col
-            for col in group_df.columns
-            if "_dc_power" in col and "clearsky" not in col
+        cached = [table_cache.get(key) if key is not None else None for key in keys]
+        # only read the results of the systems missing from the cache
+        missing = [
+            system.object_id for system, table in zip(systems, cached) if table is None
         ]
-        all_cols = list(group_df.columns)
-        group_df["ac_power"] = group_df[ac_power_cols].sum(axis=1)
-        group_df["dc_power"] = group_df[dc_power_cols].sum(axis=1)
-        group_df["clearsky_ac_power"] = group_df[clearsky_ac_cols].sum(axis=1)
-        group_df["clearsky_dc_power"] = group_df[clearsky_dc_cols].sum(axis=1)
-
-        group_df["time"] = group_df.index.tz_convert("Etc/GMT+7")  # type: ignore
-
-        ordered_columns = [
-            "time",
-            "ac_power",
-            "dc_power",
-            "clearsky_ac_power",
-            "clearsky_dc_power",
-        ] + all_cols
-        group_df = group_df[ordered_columns]
-    else:
-        # No data, return an empty dataframe with the correct attributes
-        group_df = pd.DataFrame(
-            columns=[
-                "time",
-                "ac_power",
-                "dc_power",
-                "clearsky_ac_power",
-                "clearsky_dc_power",
-            ],
-            index=pd.DatetimeIndex([], tz="America/Phoenix"),  # type: ignore
+        if missing:
+            timeseries = st.get_group_model_timeseries(
+                group.object_id, dataset, missing
+            )
+    tables = []
+    for system, key, table in zip(systems, keys, cached):
+        if table is None:
+            # the system may have left the group or lost its data since the
+            # group was read
+            if system.object_id not in timeseries:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"No timeseries data available for {system.object_id}",
+                )
+            table = utils.read_arrow_table(BytesIO(timeseries[system.object_id]))
+            if key is not None:
+                table_cache.put(key, table)
+        tables.append(table)
+    if len(tables) == 0:
+        # No data, return an empty table with the correct attributes
+        return pa.table(
+            [pa.array([], type=pa.timestamp("s", tz="Etc/GMT+7"))]
+            + [pa.array([], type=pa.float32()) for _ in GROUP_POWER_COLUMNS],
+            names=["time", *GROUP_POWER_COLUMNS],
+        )
+
+    time = tables[0].column("time")
+    for table in tables[1:]:
+        if not table.column("time").equals(time):
+            raise HTTPException(
+                status_code=500,
+                detail="Timeseries of the systems in the group are not aligned",
+            )
+    columns = [time.cast(pa.timestamp("s", tz="Etc/GMT+7"))]
+    for col in GROUP_POWER_COLUMNS:
+        total = np.zeros(len(time), dtype="float32")
+        for table in tables:
+            if col in table.column_names:
+                vals = table.column(col).to_numpy()
+                np.add(total, vals, out=total, where=~np.isnan(vals))
+        columns.append(pa.array(total))
+    names = ["time", *GROUP_POWER_COLUMNS]
+
+    if include_systems:
+        for system, table in zip(systems, tables):
+            csv_safe_name = system.definition.name.replace(",", "").replace(" ", "_")
+            for col in table.column_names:
+                if col != "time":
+                    columns.append(table.column(col))
+                    names.append(f"{csv_safe_name}_{col}")
+    return pa.table(columns, names=names)
+
+
+def _get_stored_group_timeseries(
+    storage: StorageInterface,
+    group: models.StoredSystemGroup,
+    dataset: models.DatasetEnum,
+) -> bytes:
+    """Get the group timeseries as Arrow bytes from storage, aggregating the
+    member timeseries and storing the result first if the group members or
+    their results have changed since it was last stored"""
+    data: Optional[bytes]
+    with storage.start_transaction() as st:
+        data_key, data = st.get_group_model_data(group.object_id, dataset, "timeseries")
+    if data is None:
+        data = utils.dump_arrow_bytes(
+            _get_group_timeseries_from_systems(storage, group, dataset)
         )
-    return group_df
+        with storage.start_transaction() as st:
+            st.update_group_model_data(
+                group.object_id, dataset, "timeseries", data_key, data
+            )
+    return data
+
+
+def _group_result_etag(
+    storage: StorageInterface,
+    group_id: UUID,
+    dataset: models.DatasetEnum,
+    *parts,
+) -> str:
+    """The ETag of a group result, which changes with the group, the results
+    of its systems and the version of the API that computes the result"""
+    with storage.start_transaction() as st:
+        group: models.StoredSystemGroup = st.get_system_group(group_id)
+        data_key = st.get_group_model_data_key(group_id, dataset)
+    tag = f"{data_key}:{group.modified_at.isoformat()}:{__version__}"
+    return utils.result_etag(tag, *parts)
 
 
 @router.get(
@@ -323,9 +411,18 @@ def _get_group_timeseries_from_systems(
                 },
             },
             "description": (
-                "Return the timeseries data as an Apache Arrow file or a CSV."
+                "Return the timeseries data as an Apache Arrow file or a CSV. "
+                "The Arrow file is compressed if the Accept header lists "
+                "zstd or lz4 codecs, e.g. application/vnd.apache.arrow.file; "
+                'codecs="zstd"'
             ),
         },
+        304: {
+            "description": (
+                "The data is unchanged from the response with the ETag "
+                "given in the If-None-Match header"
+            )
+        },
     },
     response_model=None,
 )
@@ -334,21 +431,33 @@ def get_group_model_timeseries(
     dataset: models.DatasetEnum = datasetpath,
     storage: StorageInterface = Depends(StorageInterface),
     accept: Optional[str] = Header(None),
-) -> Union[utils.CSVResponse, utils.ArrowResponse]:
+    if_none_match: Optional[str] = Header(None),
+    selection: utils.TimeseriesSelection = Depends(utils.TimeseriesSelection),
+) -> Union[utils.CSVResponse, utils.ArrowResponse, Response]:
     resp, meta_type = utils._get_return_type(accept)
+    codecs = utils.accepted_arrow_codecs(accept)
+    etag = _group_result_etag(
+        storage, group_id, dataset, "timeseries", meta_type, codecs, selection.cache_key
+    )
+    if utils.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=utils.result_cache_headers(etag))
     with storage.start_transaction() as st:
         group: models.StoredSystemGroup = st.get_system_group(group_id)
-    group_df = _get_group_timeseries_from_systems(
-        storage, group.definition.systems, dataset  # type: ignore
-    )
-    # put time first for easier testing and csv display
-    group_df = group_df[["time"] + [col for col in group_df.columns if col != "time"]]
-    if meta_type == "application/vnd.apache.arrow.file":
-        resp_data = utils.dump_arrow_bytes(utils.convert_to_arrow(group_df))
-        return resp(resp_data)
+    data = _get_stored_group_timeseries(storage, group, dataset)
+    out: Union[utils.CSVResponse, utils.ArrowResponse]
+    if selection.selected:
+        table = selection.apply(data)
+        if meta_type == "application/vnd.apache.arrow.file":
+            compression = codecs[0] if codecs else None
+            out = resp(utils.dump_arrow_bytes(table, compression))  # type: ignore
+        else:
+            out = resp(utils.stream_csv(table))
+    elif meta_type == "application/vnd.apache.arrow.file":
+        out = resp(utils.arrow_bytes_for_codecs(data, codecs))  # type: ignore
     else:
-        csv = group_df.to_csv(None, index=False)
-        return resp(csv)
+        out = resp(utils.stream_csv(utils.read_arrow_table(BytesIO(data))))
+    out.headers.update(utils.result_cache_headers(etag))
+    return out
 
 
 @router.get(
@@ -362,9 +471,18 @@ def get_group_model_timeseries(
                 "text/csv": {},
             },
             "description": (
-                "Return the statistics of the data as an Apache Arrow file or a CSV."
+                "Return the statistics of the data as an Apache Arrow file or a CSV. "
+                "The Arrow file is compressed if the Accept header lists "
+                "zstd or lz4 codecs, e.g. application/vnd.apache.arrow.file; "
+                'codecs="zstd"'
             ),
         },
+        304: {
+            "description": (
+                "The data is unchanged from the response with the ETag "
+                "given in the If-None-Match header"
+            )
+        },
     },
     response_model=None,
 )
@@ -373,18 +491,39 @@ def get_group_model_statistics(
     dataset: models.DatasetEnum = datasetpath,
     storage: StorageInterface = Depends(StorageInterface),
     accept: Optional[str] = Header(None),
-) -> Union[utils.CSVResponse, utils.ArrowResponse]:
+    if_none_match: Optional[str] = Header(None),
+) -> Union[utils.CSVResponse, utils.ArrowResponse, Response]:
     resp, meta_type = utils._get_return_type(accept)
+    codecs = utils.accepted_arrow_codecs(accept)
+    etag = _group_result_etag(
+        storage, group_id, dataset, "statistics", meta_type, codecs
+    )
+    if utils.etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=utils.result_cache_headers(etag))
     with storage.start_transaction() as st:
         group: models.StoredSystemGroup = st.get_system_group(group_id)
-    group_df = _get_group_timeseries_from_systems(
-        storage, group.definition.systems, dataset  # type: ignore
-    )
-    stats = compute_group_statistics(group, group_df)
+        data_key, data = st.get_group_model_data(group_id, dataset, "statistics")
+    if data is None:
+        # the stored group timeseries is only read if the statistics are stale
+        with storage.start_transaction() as st:
+            _, timeseries = st.get_group_model_data(group_id, dataset, "timeseries")
+        if timeseries is not None:
+            group_df = utils.read_arrow(BytesIO(timeseries))
+        else:
+            # only the summed columns are needed for the statistics
+            group_df = _get_group_timeseries_from_systems(
+                storage, group, dataset, include_systems=False
+            ).to_pandas(split_blocks=True)
+        group_df.index = pd.to_datetime(group_df["time"], utc=True)
+        stats = compute_group_statistics(group, group_df)
+        data = utils.dump_arrow_bytes(utils.convert_to_arrow(stats))
+        with storage.start_transaction() as st:
+            st.update_group_model_data(group_id, dataset, "statistics", data_key, data)
 
+    out: Union[utils.CSVResponse, utils.ArrowResponse]
     if meta_type == "application/vnd.apache.arrow.file":
-        resp_data = utils.dump_arrow_bytes(utils.convert_to_arrow(stats))
-        return resp(resp_data)
+        out = resp(utils.arrow_bytes_for_codecs(data, codecs))  # type: ignore
     else:
-        csv = stats.to_csv(None, index=False)
-        return resp(csv)
+        out = resp(utils.stream_csv(utils.read_arrow_table(BytesIO(data))))
+    out.headers.update(utils.result_cache_headers(etag))
+    return out
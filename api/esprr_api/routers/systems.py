@@ -1,4 +1,6 @@
+from io import BytesIO
 import logging
+import pathlib
 from typing import List, Optional, Tuple, Type, Union
 
 
@@ -13,14 +15,18 @@ from fastapi import (
     HTTPException,
     BackgroundTasks,
 )
+from fastapi.responses import FileResponse, StreamingResponse
+import pyarrow as pa  # type: ignore
 from pydantic.types import UUID
 
 
 from . import default_get_responses
 from .. import models, utils
 from ..auth import get_user_id
+from ..compute import capacity_scale_factor
 from ..queuing import QueueManager
 from ..storage import StorageInterface
+from ..table_cache import result_key, table_cache
 
 
 router = APIRouter()
@@ -30,7 +36,7 @@ logger = logging.getLogger(__name__)
 @router.get(
     "/", response_model=List[models.StoredPVSystem], responses=default_get_responses
 )
-async def list_systems(
+def list_systems(
     storage: StorageInterface = Depends(StorageInterface),
 ) -> List[models.StoredPVSystem]:
     """List available PV systems"""
@@ -65,7 +71,7 @@ system_links = {
     },
     status_code=201,
 )
-async def create_system(
+def create_system(
     system: models.PVSystem,
     response: Response,
     request: Request,
@@ -85,13 +91,64 @@ async def create_system(
     responses={401: {}, 403: {}},
     status_code=200,
 )
-async def check_system(
+def check_system(
     system: models.PVSystem,
 ):
     """Check if the POSTed system is valid for modeling"""
     return
 
 
+def run_system_models(
+    storage: StorageInterface,
+    qm: QueueManager,
+    background_tasks: BackgroundTasks,
+    items: List[Tuple[UUID, models.DatasetEnum]],
+    user: str,
+):
+    """Prepare the system data of many (system_id, dataset) pairs and enqueue
+    their jobs, with one storage call to read the system data, up to two to
+    reset or queue it, and one Redis pipeline for the jobs"""
+    if not items:
+        return
+    with storage.start_transaction() as st:
+        definitions = st.get_system_model_definition_pairs(items)
+        reset = []
+        rescale = []
+        for system_id, dataset, current, previous in definitions:
+            # keep the stored results when the job can just rescale them
+            if previous is None or capacity_scale_factor(previous, current) is None:
+                reset.append((system_id, dataset))
+            else:
+                rescale.append((system_id, dataset))
+        if reset:
+            st.create_system_model_data_many(reset)
+        if rescale:
+            st.queue_system_model_data_many(rescale)
+    background_tasks.add_task(qm.enqueue_jobs, items, user)
+
+
+@router.post(
+    "/data",
+    status_code=202,
+    responses={**default_get_responses, 202: {}},
+)
+def run_many_system_models(
+    items: List[models.SystemDataset],
+    background_tasks: BackgroundTasks,
+    storage: StorageInterface = Depends(StorageInterface),
+    user: str = Depends(get_user_id),
+    qm: QueueManager = Depends(QueueManager),
+):
+    """Run the models of many systems for many datasets with one request"""
+    run_system_models(
+        storage,
+        qm,
+        background_tasks,
+        [(item.system_id, item.dataset) for item in items],
+        user,
+    )
+
+
 syspath = Path(..., description="ID of system to get", example=models.SYSTEM_ID)
 
 
@@ -103,7 +160,7 @@ syspath = Path(..., description="ID of system to get", example=models.SYSTEM_ID)
         200: {"links": system_links},
     },
 )
-async def get_system(
+def get_system(
     system_id: UUID = syspath,
     storage: StorageInterface = Depends(StorageInterface),
 ) -> models.StoredPVSystem:
@@ -119,7 +176,7 @@ async def get_system(
     responses={**default_get_responses, 204: {}},
     status_code=204,
 )
-async def delete_system(
+def delete_system(
     system_id: UUID = syspath,
     storage: StorageInterface = Depends(StorageInterface),
 ):
@@ -138,7 +195,7 @@ async def delete_system(
     },
     status_code=201,
 )
-async def update_system(
+def update_system(
     system: models.PVSystem,
     response: Response,
     request: Request,
@@ -166,7 +223,7 @@ datasetpath = Path(
     response_model=models.SystemDataMeta,
     responses=default_get_responses,
 )
-async def get_system_model_status(
+def get_system_model_status(
     system_id: UUID = syspath,
     dataset: models.DatasetEnum = datasetpath,
     storage: StorageInterface = Depends(StorageInterface),
@@ -186,7 +243,7 @@ async def get_system_model_status(
     status_code=202,
     responses={**default_get_responses, 202: {}},
 )
-async def run_system_model(
+def run_system_model(
     background_tasks: BackgroundTasks,
     system_id: UUID = syspath,
     dataset: models.DatasetEnum = datasetpath,
@@ -195,7 +252,16 @@ async def run_system_model(
     qm: QueueManager = Depends(QueueManager),
 ):
     with storage.start_transaction() as st:
-        st.create_system_model_data(system_id, dataset)
+        system = st.get_system(system_id)
+        previous = st.get_system_model_definition(system_id, dataset)
+        # keep the stored results when the job can just rescale them
+        if (
+            previous is None
+            or capacity_scale_factor(previous, system.definition) is None
+        ):
+            st.create_system_model_data(system_id, dataset)
+        else:
+            st.queue_system_model_data_many([(system_id, dataset)])
     background_tasks.add_task(qm.enqueue_job, system_id, dataset, user)
 
 
@@ -203,7 +269,7 @@ class ArrowResponse(Response):
     media_type = "application/vnd.apache.arrow.file"
 
 
-class CSVResponse(Response):
+class CSVResponse(StreamingResponse):
     media_type = "text/csv"
 
 
@@ -225,30 +291,80 @@ def _get_return_type(
         )
 
 
+def _read_result_table(data: Union[bytes, pathlib.Path]) -> pa.Table:
+    if isinstance(data, pathlib.Path):
+        data = data.read_bytes()
+    try:
+        return utils.read_arrow_table(BytesIO(data))
+    except HTTPException:
+        logger.exception("Read arrow failed")
+        raise HTTPException(
+            status_code=500,
+            detail=(
+                "Unable to convert data saved as Apache Arrow format, "
+                "try retrieving as application/vnd.apache.arrow.file and converting"
+            ),
+        )
+
+
+def _get_result(
+    st: StorageInterface,
+    system_id: UUID,
+    dataset: models.DatasetEnum,
+    artifact: str,
+    tag: str,
+    decode: bool,
+) -> Union[bytes, pathlib.Path, pa.Table]:
+    """Get the stored result, or the decoded table of the result from the
+    table cache if it has to be decoded to build the response anyway"""
+    if not decode:
+        return st.get_system_model_result(system_id, dataset, artifact)
+    return table_cache.get_or_load(
+        result_key(system_id, dataset, artifact, tag),
+        lambda: _read_result_table(
+            st.get_system_model_result(system_id, dataset, artifact)
+        ),
+    )
+
+
 def _convert_data(
-    data: bytes,
+    data: Union[bytes, pathlib.Path, pa.Table],
     requested_mimetype: str,
     response_class: Union[Type[ArrowResponse], Type[CSVResponse]],
-) -> Union[ArrowResponse, CSVResponse]:
+    selection: Optional[utils.TimeseriesSelection] = None,
+    codecs: Optional[List[str]] = None,
+) -> Union[ArrowResponse, CSVResponse, FileResponse]:
+    codecs = codecs or []
+    if isinstance(data, pathlib.Path):
+        # send files from the result store as they are if possible
+        if (
+            requested_mimetype == "application/vnd.apache.arrow.file"
+            and not (selection is not None and selection.selected)
+            and utils.arrow_compression(data) in (None, *codecs)
+        ):
+            return FileResponse(data, media_type=ArrowResponse.media_type)
+        data = data.read_bytes()
+    if selection is not None and selection.selected:
+        table = selection.apply(data)
+        if requested_mimetype == "application/vnd.apache.arrow.file":
+            compression = codecs[0] if codecs else None
+            return response_class(
+                utils.dump_arrow_bytes(table, compression)  # type: ignore
+            )
+        return response_class(utils.stream_csv(table))
     if requested_mimetype == "application/vnd.apache.arrow.file":
-        return response_class(data)
-    else:
-        try:
-            df = utils.read_arrow(data)  # type: ignore
-        except HTTPException:
-            logger.exception("Read arrow failed")
-            raise HTTPException(
-                status_code=500,
-                detail=(
-                    "Unable to convert data saved as Apache Arrow format, "
-                    "try retrieving as application/vnd.apache.arrow.file and converting"
-                ),
+        if isinstance(data, pa.Table):
+            compression = codecs[0] if codecs else None
+            return response_class(
+                utils.dump_arrow_bytes(data, compression)  # type: ignore
             )
-        if "time" in df.columns:
-            df["time"] = df["time"].dt.tz_convert("Etc/GMT+7")  # type: ignore
-        csv = df.to_csv(None, index=False)
-
-        return response_class(csv)
+        return response_class(
+            utils.arrow_bytes_for_codecs(data, codecs)  # type: ignore
+        )
+    else:
+        if not isinstance(data, pa.Table):
+            data = _read_result_table(data)
+        return response_class(utils.stream_csv(data))
 
 
 @router.get(
@@ -267,9 +383,18 @@ def _convert_data(
                 },
             },
             "description": (
-                "Return the timeseries data as an Apache Arrow file or a CSV."
+                "Return the timeseries data as an Apache Arrow file or a CSV. "
+                "The Arrow file is compressed if the Accept header lists "
+                "zstd or lz4 codecs, e.g. application/vnd.apache.arrow.file; "
+                'codecs="zstd"'
             ),
         },
+        304: {
+            "description": (
+                "The data is unchanged from the response with the ETag "
+                "given in the If-None-Match header"
+            )
+        },
     },
     response_model=None,
 )
@@ -278,11 +403,29 @@ def get_system_model_timeseries(
     dataset: models.DatasetEnum = datasetpath,
     storage: StorageInterface = Depends(StorageInterface),
     accept: Optional[str] = Header(None),
-) -> Union[CSVResponse, ArrowResponse, None]:
+    if_none_match: Optional[str] = Header(None),
+    selection: utils.TimeseriesSelection = Depends(utils.TimeseriesSelection),
+) -> Union[CSVResponse, ArrowResponse, FileResponse, Response]:
     resp, meta_type = _get_return_type(accept)
+    codecs = utils.accepted_arrow_codecs(accept)
     with storage.start_transaction() as st:
-        data = st.get_system_model_timeseries(system_id, dataset)
-    return _convert_data(data, meta_type, resp)
+        tag = st.get_system_model_result_tag(system_id, dataset)
+        etag = utils.result_etag(
+            tag, "timeseries", meta_type, codecs, selection.cache_key
+        )
+        if utils.etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=utils.result_cache_headers(etag))
+        data = _get_result(
+            st,
+            system_id,
+            dataset,
+            "timeseries",
+            tag,
+            meta_type != "application/vnd.apache.arrow.file" or selection.selected,
+        )
+    out = _convert_data(data, meta_type, resp, selection, codecs)
+    out.headers.update(utils.result_cache_headers(etag))
+    return out
 
 
 @router.get(
@@ -296,9 +439,18 @@ def get_system_model_timeseries(
                 "text/csv": {},
             },
             "description": (
-                "Return the statistics of the data as an Apache Arrow file or a CSV."
+                "Return the statistics of the data as an Apache Arrow file or a CSV. "
+                "The Arrow file is compressed if the Accept header lists "
+                "zstd or lz4 codecs, e.g. application/vnd.apache.arrow.file; "
+                'codecs="zstd"'
             ),
         },
+        304: {
+            "description": (
+                "The data is unchanged from the response with the ETag "
+                "given in the If-None-Match header"
+            )
+        },
     },
     response_model=None,
 )
@@ -307,8 +459,23 @@ def get_system_model_statistics(
     dataset: models.DatasetEnum = datasetpath,
     storage: StorageInterface = Depends(StorageInterface),
     accept: Optional[str] = Header(None),
-) -> Union[CSVResponse, ArrowResponse]:
+    if_none_match: Optional[str] = Header(None),
+) -> Union[CSVResponse, ArrowResponse, FileResponse, Response]:
     resp, meta_type = _get_return_type(accept)
+    codecs = utils.accepted_arrow_codecs(accept)
     with storage.start_transaction() as st:
-        data = st.get_system_model_statistics(system_id, dataset)
-    return _convert_data(data, meta_type, resp)
+        tag = st.get_system_model_result_tag(system_id, dataset)
+        etag = utils.result_etag(tag, "statistics", meta_type, codecs)
+        if utils.etag_matches(if_none_match, etag):
+            return Response(status_code=304, headers=utils.result_cache_headers(etag))
+        data = _get_result(
+            st,
+            system_id,
+            dataset,
+            "statistics",
+            tag,
+            meta_type != "application/vnd.apache.arrow.file",
+        )
+    out = _convert_data(data, meta_type, resp, codecs=codecs)
+    out.headers.update(utils.result_cache_headers(etag))
+    return out
@@ -2,13 +2,15 @@
 is done via schemathesis in ../../tests/test_app.py
 """
 from io import BytesIO
+from uuid import uuid1
 
 from fastapi import HTTPException
 import pandas as pd
 import pytest
 
 
-from esprr_api import models
+from esprr_api import models, storage, utils
+from esprr_api.routers import groups
 
 
 pytestmark = pytest.mark.usefixtures("add_example_db_data")
@@ -170,8 +172,8 @@ def test_get_group_model_status(client, group_id, system_id):
 
 def test_get_group_model_status_system_dne(client, group_id, system_id, mocker):
     mocker.patch(
-        "esprr_api.storage.StorageInterface.get_system_model_meta",
-        side_effect=HTTPException(404),
+        "esprr_api.storage.StorageInterface.get_group_model_meta",
+        return_value={},
     )
     status = client.get(
         f"/system_groups/{group_id}/data/NSRDB_2019", headers={"accept": "text/csv"}
@@ -193,7 +195,8 @@ def test_get_group_model_status_running(client, group_id, mocker, system_id):
         }
     )
     mocker.patch(
-        "esprr_api.storage.StorageInterface.get_system_model_meta", return_value=val
+        "esprr_api.storage.StorageInterface.get_group_model_meta",
+        return_value={val.system_id: val},
     )
     mocker.patch("esprr_api.queuing.QueueManager.job_is_running", return_value=True)
     status = client.get(
@@ -230,6 +233,15 @@ def test_get_group_timeseries_arrow(
     )
 
 
+def test_get_group_timeseries_selection(client, group_id):
+    csv = client.get(
+        f"/system_groups/{group_id}/data/NSRDB_2019/timeseries",
+        params={"start": "2019-01-15T00:00", "columns": ["ac_power", "dc_power"]},
+        headers={"accept": "text/csv"},
+    ).text
+    assert csv == "time,ac_power,dc_power\n2019-01-31 17:00:00-07:00,8.2,8.2\n"
+
+
 def test_get_group_timeseries_no_systems(
     client, group_id, system_id, nocommit_transaction
 ):
@@ -242,6 +254,130 @@ def test_get_group_timeseries_no_systems(
     assert csv == "time,ac_power,dc_power,clearsky_ac_power,clearsky_dc_power\n"
 
 
+@pytest.fixture()
+def two_system_group(stored_system_group, stored_system):
+    other = stored_system.copy(deep=True)
+    other.object_id = uuid1()
+    other.definition.name = "Other, System"
+    group = stored_system_group.copy(deep=True)
+    group.definition.systems = [stored_system, other]
+    return group
+
+
+def _mock_group_storage(mocker, group, timeseries):
+    storage = mocker.MagicMock()
+    st = storage.start_transaction.return_value.__enter__.return_value
+    st.get_group_model_timeseries.return_value = {
+        system.object_id: utils.dump_arrow_bytes(utils.convert_to_arrow(df))
+        for system, df in zip(group.definition.systems, timeseries)
+    }
+    return storage
+
+
+def test_get_group_timeseries_from_systems(mocker, two_system_group, timeseries_df):
+    other_df = timeseries_df.copy()
+    other_df.loc[0, "ac_power"] = None
+    storage = _mock_group_storage(mocker, two_system_group, [timeseries_df, other_df])
+    out = groups._get_group_timeseries_from_systems(
+        storage, two_system_group, "NSRDB_2019"
+    ).to_pandas()
+    assert list(out.columns) == [
+        "time",
+        "ac_power",
+        "dc_power",
+        "clearsky_ac_power",
+        "clearsky_dc_power",
+        "Test_PV_System_ac_power",
+        "Test_PV_System_dc_power",
+        "Test_PV_System_clearsky_ac_power",
+        "Test_PV_System_clearsky_dc_power",
+        "Other_System_ac_power",
+        "Other_System_dc_power",
+        "Other_System_clearsky_ac_power",
+        "Other_System_clearsky_dc_power",
+    ]
+    assert (out["time"] == timeseries_df["time"]).all()
+    assert str(out["time"].dt.tz) == "Etc/GMT+7"
+    pd.testing.assert_series_equal(
+        out["ac_power"], pd.Series([10.2, 16.4], name="ac_power", dtype="float32")
+    )
+    pd.testing.assert_series_equal(
+        out["dc_power"], pd.Series([20.4, 16.4], name="dc_power", dtype="float32")
+    )
+
+
+def test_get_group_timeseries_from_systems_table_cache(
+    mocker, two_system_group, timeseries_df
+):
+    storage = _mock_group_storage(
+        mocker, two_system_group, [timeseries_df, timeseries_df]
+    )
+    st = storage.start_transaction.return_value.__enter__.return_value
+    st.get_group_model_result_tags.return_value = {
+        system.object_id: "tag" for system in two_system_group.definition.systems
+    }
+    first = groups._get_group_timeseries_from_systems(
+        storage, two_system_group, "NSRDB_2019"
+    )
+    second = groups._get_group_timeseries_from_systems(
+        storage, two_system_group, "NSRDB_2019"
+    )
+    assert first.equals(second)
+    assert st.get_group_model_timeseries.call_count == 1
+    # a changed result of one system is read again, without the others
+    changed = two_system_group.definition.systems[0].object_id
+    st.get_group_model_result_tags.return_value[changed] = "new"
+    groups._get_group_timeseries_from_systems(storage, two_system_group, "NSRDB_2019")
+    assert st.get_group_model_timeseries.call_count == 2
+    st.get_group_model_timeseries.assert_called_with(
+        two_system_group.object_id, "NSRDB_2019", [changed]
+    )
+
+
+def test_get_group_timeseries_from_systems_summed_only(
+    mocker, two_system_group, timeseries_df
+):
+    storage = _mock_group_storage(
+        mocker, two_system_group, [timeseries_df, timeseries_df]
+    )
+    out = groups._get_group_timeseries_from_systems(
+        storage, two_system_group, "NSRDB_2019", include_systems=False
+    )
+    assert out.column_names == [
+        "time",
+        "ac_power",
+        "dc_power",
+        "clearsky_ac_power",
+        "clearsky_dc_power",
+    ]
+
+
+def test_get_group_timeseries_from_systems_not_aligned(
+    mocker, two_system_group, timeseries_df
+):
+    other_df = timeseries_df.copy()
+    other_df["time"] = other_df["time"] + pd.Timedelta("5min")
+    storage = _mock_group_storage(mocker, two_system_group, [timeseries_df, other_df])
+    with pytest.raises(HTTPException) as err:
+        groups._get_group_timeseries_from_systems(
+            storage, two_system_group, "NSRDB_2019"
+        )
+    assert err.value.status_code == 500
+
+
+def test_get_group_timeseries_from_systems_member_missing(
+    mocker, two_system_group, timeseries_df
+):
+    # the second system left the group after the group was read
+    storage = _mock_group_storage(mocker, two_system_group, [timeseries_df])
+    with pytest.raises(HTTPException) as err:
+        groups._get_group_timeseries_from_systems(
+            storage, two_system_group, "NSRDB_2019"
+        )
+    assert err.value.status_code == 404
+    assert str(two_system_group.definition.systems[1].object_id) in err.value.detail
+
+
 def test_get_group_timeseries_group_dne(client, system_id):
     bad = client.get(f"/system_groups/{system_id}/data/NSRDB_2019/timeseries")
     assert bad.status_code == 404
@@ -300,7 +436,7 @@ def test_get_group_statistics_csv(client, group_id, mocker):
     )
     mocker.patch(
         "esprr_api.routers.groups._get_group_timeseries_from_systems",
-        return_value=group_timeseries,
+        return_value=utils.convert_to_arrow(group_timeseries),
     )
 
     csv = client.get(
@@ -329,7 +465,7 @@ def test_get_group_statistics_arrow(client, group_id, mocker):
     )
     mocker.patch(
         "esprr_api.routers.groups._get_group_timeseries_from_systems",
-        return_value=group_timeseries,
+        return_value=utils.convert_to_arrow(group_timeseries),
     )
 
     resp = client.get(
@@ -348,3 +484,115 @@ def test_get_group_statistics_arrow(client, group_id, mocker):
 def test_get_group_statistics_group_dne(client, system_id):
     bad = client.get(f"/system_groups/{system_id}/data/NSRDB_2019/statistics")
     assert bad.status_code == 404
+
+
+def test_get_group_timeseries_stored(client, group_id, group_timeseries_df, mocker):
+    first = client.get(
+        f"/system_groups/{group_id}/data/NSRDB_2019/timeseries",
+        headers={"accept": "text/csv"},
+    ).text
+    agg = mocker.patch(
+        "esprr_api.routers.groups._get_group_timeseries_from_systems",
+        side_effect=ValueError("should be stored"),
+    )
+    second = client.get(
+        f"/system_groups/{group_id}/data/NSRDB_2019/timeseries",
+        headers={"accept": "text/csv"},
+    ).text
+    assert agg.call_count == 0
+    assert first == second
+
+
+def test_get_group_statistics_stored(client, group_id, mocker):
+    first = client.get(
+        f"/system_groups/{group_id}/data/NSRDB_2019/statistics",
+        headers={"accept": "text/csv"},
+    ).text
+    stats = mocker.patch(
+        "esprr_api.routers.groups.compute_group_statistics",
+        side_effect=ValueError("should be stored"),
+    )
+    get_data = mocker.spy(storage.StorageInterface, "get_group_model_data")
+    second = client.get(
+        f"/system_groups/{group_id}/data/NSRDB_2019/statistics",
+        headers={"accept": "text/csv"},
+    ).text
+    assert stats.call_count == 0
+    assert first == second
+    # the stored group timeseries is not read
+    assert [c.args[3] for c in get_data.call_args_list] == ["statistics"]
+
+
+@pytest.mark.parametrize("artifact", ["timeseries", "statistics"])
+def test_get_group_result_not_modified(client, group_id, artifact, mocker):
+    url = f"/system_groups/{group_id}/data/NSRDB_2019/{artifact}"
+    first = client.get(url, headers={"accept": "text/csv"})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == utils.RESULT_CACHE_CONTROL
+    get_data = mocker.spy(storage.StorageInterface, "get_group_model_data")
+    second = client.get(url, headers={"accept": "text/csv", "if-none-match": etag})
+    assert second.status_code == 304
+    assert second.headers["etag"] == etag
+    assert get_data.call_count == 0
+
+
+def test_get_group_result_etag_membership_change(
+    client, group_id, system_id, nocommit_transaction
+):
+    url = f"/system_groups/{group_id}/data/NSRDB_2019/timeseries"
+    first = client.get(url)
+    removal = client.delete(f"/system_groups/{group_id}/systems/{system_id}")
+    assert removal.status_code == 201
+    second = client.get(url, headers={"if-none-match": first.headers["etag"]})
+    assert second.status_code == 200
+    assert second.headers["etag"] != first.headers["etag"]
+
+
+def test_run_group_models(client, group_id, system_id, dataset_name, async_bulk_queue):
+    resp = client.post(f"/system_groups/{group_id}/data/{dataset_name}")
+    assert resp.status_code == 202
+    assert async_bulk_queue.job_ids == [f"{system_id}:{dataset_name}"]
+    status = client.get(f"/systems/{system_id}/data/{dataset_name}")
+    assert status.json()["status"] == "queued"
+
+
+def test_run_group_models_dne(client, system_id, dataset_name, async_bulk_queue):
+    resp = client.post(f"/system_groups/{system_id}/data/{dataset_name}")
+    assert resp.status_code == 404
+    assert len(async_bulk_queue.jobs) == 0
+
+
+def test_get_group_timeseries_membership_change(
+    client, group_id, system_id, nocommit_transaction
+):
+    first = client.get(
+        f"/system_groups/{group_id}/data/NSRDB_2019/timeseries",
+        headers={"accept": "text/csv"},
+    ).text
+    assert first != "time,ac_power,dc_power,clearsky_ac_power,clearsky_dc_power\n"
+    removal = client.delete(f"/system_groups/{group_id}/systems/{system_id}")
+    assert removal.status_code == 201
+    csv = client.get(
+        f"/system_groups/{group_id}/data/NSRDB_2019/timeseries",
+        headers={"accept": "text/csv"},
+    ).text
+    assert csv == "time,ac_power,dc_power,clearsky_ac_power,clearsky_dc_power\n"
+
+
+def test_get_group_timeseries_system_result_change(
+    client, group_id, system_id, dataset_name, nocommit_transaction, async_queue
+):
+    first = client.get(
+        f"/system_groups/{group_id}/data/{dataset_name}/timeseries",
+        headers={"accept": "text/csv"},
+    )
+    assert first.status_code == 200
+    # rerunning the system model resets its results
+    resp = client.post(f"/systems/{system_id}/data/{dataset_name}")
+    assert resp.status_code == 202
+    second = client.get(
+        f"/system_groups/{group_id}/data/{dataset_name}/timeseries",
+        headers={"accept": "text/csv"},
+    )
+    assert second.status_code == 404
@@ -10,12 +10,14 @@ import uuid
 
 
 from fastapi import HTTPException
+from fastapi.responses import FileResponse
 import pandas as pd
+import pyarrow as pa  # type: ignore
 import pytest
 from rq import SimpleWorker
 
 
-from esprr_api import models, storage
+from esprr_api import models, storage, utils
 from esprr_api.routers import systems
 
 
@@ -145,7 +147,53 @@ def test_convert_data(timeseries_bytes, timeseries_csv):
     )
     assert out == b"thisiswrong"
     out = systems._convert_data(timeseries_bytes, "text/csv", lambda x: x)
-    assert out == timeseries_csv
+    assert "".join(out) == timeseries_csv
+
+
+def test_convert_data_compressed(timeseries_df):
+    data = utils.dump_arrow_bytes(utils.convert_to_arrow(timeseries_df))
+    out = systems._convert_data(
+        data, "application/vnd.apache.arrow.file", lambda x: x, codecs=["zstd"]
+    )
+    assert out is data
+    out = systems._convert_data(data, "application/vnd.apache.arrow.file", lambda x: x)
+    assert utils.arrow_compression(out) is None
+    pd.testing.assert_frame_equal(
+        pd.read_feather(BytesIO(out)), timeseries_df, check_dtype=False
+    )
+
+
+def test_convert_data_file(tmp_path, timeseries_bytes, timeseries_csv):
+    path = tmp_path / "timeseries"
+    path.write_bytes(timeseries_bytes)
+    out = systems._convert_data(path, "application/vnd.apache.arrow.file", lambda x: x)
+    assert isinstance(out, FileResponse)
+    assert out.path == path
+    out = systems._convert_data(path, "text/csv", lambda x: x)
+    assert "".join(out) == timeseries_csv
+
+
+def test_convert_data_table(timeseries_bytes, timeseries_csv):
+    table = utils.read_arrow_table(BytesIO(timeseries_bytes))
+    out = systems._convert_data(table, "text/csv", lambda x: x)
+    assert "".join(out) == timeseries_csv
+    out = systems._convert_data(table, "application/vnd.apache.arrow.file", lambda x: x)
+    assert utils.read_arrow_table(BytesIO(out)).equals(table)
+
+
+def test_get_result(mocker, system_id, timeseries_bytes):
+    st = mocker.MagicMock()
+    st.get_system_model_result.return_value = timeseries_bytes
+    out = systems._get_result(st, system_id, "NSRDB_2019", "timeseries", "tag", False)
+    assert out == timeseries_bytes
+    first = systems._get_result(st, system_id, "NSRDB_2019", "timeseries", "tag", True)
+    assert isinstance(first, pa.Table)
+    second = systems._get_result(st, system_id, "NSRDB_2019", "timeseries", "tag", True)
+    assert second is first
+    assert st.get_system_model_result.call_count == 2
+    # a new tag is a different result
+    systems._get_result(st, system_id, "NSRDB_2019", "timeseries", "new", True)
+    assert st.get_system_model_result.call_count == 3
 
 
 def test_convert_job_data_invalid():
@@ -226,6 +274,49 @@ def test_get_system_model_timeseries_csv(
     assert resp.text == timeseries_csv
 
 
+def test_get_system_model_timeseries_selection_csv(client, system_id, dataset_name):
+    resp = client.get(
+        f"/systems/{system_id}/data/{dataset_name}/timeseries",
+        params={"start": "2019-01-15T00:00", "columns": "ac_power"},
+        headers={"accept": "text/csv"},
+    )
+    assert resp.status_code == 200
+    assert resp.text == "time,ac_power\n2019-01-31 17:00:00-07:00,8.2\n"
+
+
+def test_get_system_model_timeseries_selection_arrow(
+    client, system_id, dataset_name, timeseries_df
+):
+    resp = client.get(
+        f"/systems/{system_id}/data/{dataset_name}/timeseries",
+        params={"end": "2019-01-15T00:00Z", "resample": "1d"},
+        headers={"accept": "application/vnd.apache.arrow.file"},
+    )
+    assert resp.status_code == 200
+    df = pd.read_feather(BytesIO(resp.content))
+    assert list(df.columns) == list(timeseries_df.columns)
+    assert len(df) == 1
+    assert df["time"].iloc[0] == pd.Timestamp("2018-12-31T00:00-07:00")
+    assert df["ac_power"].iloc[0] == pytest.approx(10.2)
+
+
+@pytest.mark.parametrize(
+    "params,code",
+    [
+        ({"columns": "not_a_column"}, 400),
+        ({"resample": "1year"}, 422),
+        ({"start": "notatime"}, 422),
+    ],
+)
+def test_get_system_model_timeseries_bad_selection(
+    client, system_id, dataset_name, params, code
+):
+    resp = client.get(
+        f"/systems/{system_id}/data/{dataset_name}/timeseries", params=params
+    )
+    assert resp.status_code == code
+
+
 @pytest.mark.parametrize(
     "accept", ["application/*", "application/vnd.apache.arrow.file"]
 )
@@ -255,6 +346,69 @@ def test_get_system_model_statistics_csv(
     assert resp.text == statistics_csv
 
 
+@pytest.mark.parametrize("artifact", ["timeseries", "statistics"])
+def test_get_system_model_result_not_modified(
+    client, system_id, dataset_name, artifact, mocker
+):
+    url = f"/systems/{system_id}/data/{dataset_name}/{artifact}"
+    first = client.get(url, headers={"accept": "text/csv"})
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"] == utils.RESULT_CACHE_CONTROL
+    get_result = mocker.spy(storage.StorageInterface, "get_system_model_result")
+    second = client.get(
+        url, headers={"accept": "text/csv", "if-none-match": f"W/{etag}"}
+    )
+    assert second.status_code == 304
+    assert second.content == b""
+    assert second.headers["etag"] == etag
+    assert get_result.call_count == 0
+    # the ETag differs for each representation of the result
+    arrow = client.get(
+        url,
+        headers={
+            "accept": "application/vnd.apache.arrow.file",
+            "if-none-match": etag,
+        },
+    )
+    assert arrow.status_code == 200
+    assert arrow.headers["etag"] != etag
+
+
+def test_get_system_model_timeseries_etag_selection(client, system_id, dataset_name):
+    url = f"/systems/{system_id}/data/{dataset_name}/timeseries"
+    full = client.get(url)
+    selected = client.get(url, params={"resample": "1h"})
+    assert full.headers["etag"] != selected.headers["etag"]
+
+
+def test_get_system_model_result_etag_changes(
+    client, system_id, dataset_name, nocommit_transaction, async_queue
+):
+    url = f"/systems/{system_id}/data/{dataset_name}/statistics"
+    first = client.get(url)
+    assert first.status_code == 200
+    resp = client.post(f"/systems/{system_id}/data/{dataset_name}")
+    assert resp.status_code == 202
+    second = client.get(url, headers={"if-none-match": first.headers["etag"]})
+    assert second.status_code != 304
+
+
+def test_get_system_model_timeseries_table_cache(
+    client, system_id, dataset_name, timeseries_csv, mocker
+):
+    url = f"/systems/{system_id}/data/{dataset_name}/timeseries"
+    first = client.get(url, headers={"accept": "text/csv"})
+    assert first.text == timeseries_csv
+    get_result = mocker.spy(storage.StorageInterface, "get_system_model_result")
+    second = client.get(url, headers={"accept": "text/csv"})
+    assert second.text == timeseries_csv
+    assert get_result.call_count == 0
+    # arrow is sent as stored without decoding
+    client.get(url, headers={"accept": "application/vnd.apache.arrow.file"})
+    assert get_result.call_count == 1
+
+
 def test_get_create_run_system(
     client, system_def, nocommit_transaction, system_id, dataset_name, async_queue
 ):
@@ -294,6 +448,70 @@ def test_run_system_model_simple(client, system_id, dataset_name, async_queue):
     assert async_queue.jobs[0].id == f"{system_id}:{dataset_name}"
 
 
+def test_run_many_system_models(
+    client, system_id, system_def, dataset_name, nocommit_transaction, async_bulk_queue
+):
+    other = client.post("/systems/", json=system_def.dict()).json()["object_id"]
+    items = [
+        {"system_id": system_id, "dataset": dataset_name},
+        {"system_id": other, "dataset": dataset_name},
+        {"system_id": other, "dataset": "NSRDB_2018"},
+    ]
+    resp = client.post("/systems/data", json=items)
+    assert resp.status_code == 202
+    # the datasets of a system are modeled by one job
+    assert async_bulk_queue.job_ids == [
+        f"{system_id}:{dataset_name}",
+        f"{other}:{dataset_name}+NSRDB_2018",
+    ]
+    for item in items:
+        status = client.get(f"/systems/{item['system_id']}/data/{item['dataset']}")
+        assert status.json()["status"] == "queued"
+
+
+def test_run_many_system_models_single_calls(
+    client, system_id, dataset_name, async_bulk_queue, mocker
+):
+    definitions = mocker.spy(
+        storage.StorageInterface, "get_system_model_definition_pairs"
+    )
+    create = mocker.spy(storage.StorageInterface, "create_system_model_data_many")
+    items = [
+        {"system_id": system_id, "dataset": dataset}
+        for dataset in ("NSRDB_2018", "NSRDB_2019", "NSRDB_2020")
+    ]
+    resp = client.post("/systems/data", json=items)
+    assert resp.status_code == 202
+    assert definitions.call_count == 1
+    assert create.call_count == 1
+    assert len(async_bulk_queue.jobs) == 1
+
+
+def test_run_many_system_models_empty(client, async_bulk_queue):
+    resp = client.post("/systems/data", json=[])
+    assert resp.status_code == 202
+    assert len(async_bulk_queue.jobs) == 0
+
+
+def test_run_many_system_models_dne(
+    client, system_id, other_system_id, dataset_name, async_bulk_queue
+):
+    items = [
+        {"system_id": system_id, "dataset": dataset_name},
+        {"system_id": other_system_id, "dataset": dataset_name},
+    ]
+    resp = client.post("/systems/data", json=items)
+    assert resp.status_code == 404
+    assert len(async_bulk_queue.jobs) == 0
+
+
+def test_run_many_system_models_bad_dataset(client, system_id):
+    resp = client.post(
+        "/systems/data", json=[{"system_id": system_id, "dataset": "bad"}]
+    )
+    assert resp.status_code == 422
+
+
 def test_run_system_model_dne(client, other_system_id, dataset_name):
     resp = client.post(f"/systems/{other_system_id}/data/{dataset_name}")
     assert resp.status_code == 404
@@ -361,3 +579,69 @@ def test_full_run_through(client, dataset_name, async_queue, mocker, ready_datas
     assert ts.status_code == 404
     stat = client.get(f"/systems/{sysid}/data/{dataset_name}/statistics")
     assert stat.status_code == 404
+
+
+def test_capacity_change_run_through(
+    client, dataset_name, async_queue, mocker, ready_dataset
+):
+    get_dataset = mocker.patch(
+        "esprr_api.compute._get_dataset", return_value=ready_dataset
+    )
+    sys = models.PVSystem(
+        name="Capacity",
+        boundary=dict(
+            nw_corner=dict(
+                latitude=32.04,
+                longitude=-110.9,
+            ),
+            se_corner=dict(latitude=32.03, longitude=-110.88),
+        ),
+        ac_capacity=20.5,
+        dc_ac_ratio=1.3,
+        albedo=0.2,
+        tracking=dict(tilt=20, azimuth=180),
+    )
+    resp = client.post("/systems/", json=sys.dict())
+    sysid = resp.json()["object_id"]
+    client.post(f"/systems/{sysid}/data/{dataset_name}")
+    w = SimpleWorker([async_queue], connection=async_queue.connection)
+    w.work(burst=True)
+    assert get_dataset.call_count == 1
+    before = pd.read_feather(
+        BytesIO(
+            client.get(
+                f"/systems/{sysid}/data/{dataset_name}/timeseries",
+                headers={"accept": "application/vnd.apache.arrow.file"},
+            ).content
+        )
+    )
+
+    newsys = sys.copy(update={"name": "Bigger", "ac_capacity": 41.0})
+    upd = client.post(f"/systems/{sysid}", json=newsys.dict())
+    assert upd.status_code == 201
+    cmpt = client.post(f"/systems/{sysid}/data/{dataset_name}")
+    assert cmpt.status_code == 202
+
+    # stored results are kept for the rescaling job, but are reported as
+    # queued since they are for the old capacity
+    r4 = client.get(f"/systems/{sysid}/data/{dataset_name}")
+    assert r4.json()["status"] == "queued"
+    assert r4.json()["system_modified"]
+
+    w.work(burst=True)
+    assert get_dataset.call_count == 1
+    r4 = client.get(f"/systems/{sysid}/data/{dataset_name}")
+    assert r4.json()["status"] == "complete"
+    assert not r4.json()["system_modified"]
+    after = pd.read_feather(
+        BytesIO(
+            client.get(
+                f"/systems/{sysid}/data/{dataset_name}/timeseries",
+                headers={"accept": "application/vnd.apache.arrow.file"},
+            ).content
+        )
+    )
+    pd.testing.assert_frame_equal(
+        after.set_index("time"), before.set_index("time") * 2, rtol=1e-6
+    )
+    client.delete(f"/systems/{sysid}")
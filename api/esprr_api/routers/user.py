@@ -10,7 +10,7 @@ router = APIRouter()
 
 
 @router.get("/", response_model=models.UserInfo, responses=default_get_responses)
-async def get_user_info(
+def get_user_info(
     storage: StorageInterface = Depends(StorageInterface),
 ) -> models.UserInfo:
     """Get info about the current user"""
@@ -31,7 +31,8 @@ from contextlib import contextmanager
 import datetime as dt
 from functools import partial
 import json
-from typing import List, Callable, Dict, Any, Union, Optional
+from pathlib import Path
+from typing import List, Callable, Dict, Any, Union, Optional, Sequence, Set, Tuple
 from uuid import UUID
 
 
@@ -46,12 +47,50 @@ from sqlalchemy.pool import QueuePool  # type: ignore
 
 from . import settings, models, __version__
 from .auth import get_user_id
+from .result_store import get_result_store, is_reference, reference_digest
+from .table_cache import table_cache
+
+
+MISSING_RESULT_DETAIL = {
+    "timeseries": "No timeseries data available",
+    "statistics": "No statistics available",
+}
 
 
 # this is faster than using strftime
 TIMEFORMAT = "'{0.year:04}-{0.month:02}-{0.day:02} {0.hour:02}:{0.minute:02}:{0.second:02}'"  # NOQA
 
 
+# earlier than any modified_at, and still a valid MySQL timestamp
+EARLIEST_TIMESTAMP = dt.datetime(1970, 1, 2, tzinfo=dt.timezone.utc)
+
+
+def _result_tag(row: dict) -> str:
+    """The tag of the stored results from a row of system data metadata"""
+    return f"{row['system_hash']}:{row['version']}:{row['modified_at']}"
+
+
+def _system_dataset_json(
+    items: Sequence[Tuple[UUID, Union[models.DatasetEnum, str]]]
+) -> str:
+    """JSON of (system_id, dataset) pairs for the procedures that take many"""
+    return json.dumps(
+        [
+            {"system_id": str(system_id), "dataset": dataset}
+            for system_id, dataset in items
+        ]
+    )
+
+
+def _management_status(rows: List[dict]) -> List[models.ManagementSystemDataStatus]:
+    def repq(d):
+        if d["status"] == "prepared":
+            d["status"] = "queued"
+        return d
+
+    return [models.ManagementSystemDataStatus(**repq(r)) for r in rows]
+
+
 def escape_timestamp(value, mapping=None):
     # adapted from the SolarForecastArbiter API under the above MIT license
     if value.tzinfo is not None:
@@ -285,6 +324,48 @@ class StorageInterface:
     def create_system_model_data(self, system_id: UUID, dataset: models.DatasetEnum):
         self._call_procedure("create_system_data", system_id, dataset)
 
+    def create_system_model_data_many(
+        self, items: Sequence[Tuple[UUID, models.DatasetEnum]]
+    ):
+        """Create or reset the system data of many (system_id, dataset) pairs
+        with a single call"""
+        self._call_procedure("create_system_data_many", _system_dataset_json(items))
+
+    def queue_system_model_data_many(
+        self, items: Sequence[Tuple[UUID, models.DatasetEnum]]
+    ):
+        """Mark the system data of many (system_id, dataset) pairs as queued
+        until the job stores new results, keeping the stored results for the
+        job to rescale"""
+        self._call_procedure("queue_system_data_many", _system_dataset_json(items))
+
+    def get_system_model_definition_pairs(
+        self, items: Sequence[Tuple[UUID, models.DatasetEnum]]
+    ) -> List[Tuple[UUID, str, models.PVSystem, Optional[models.PVSystem]]]:
+        """Get the current definition of the system and the system definition
+        that can be reused (see get_system_model_definition) for many
+        (system_id, dataset) pairs with a single call"""
+        out = []
+        for res in self._call_procedure(
+            "get_system_data_definitions", _system_dataset_json(items)
+        ):
+            previous = None
+            if (
+                res["status"] == "complete"
+                and res["version"] == __version__
+                and res["system_definition"] is not None
+            ):
+                previous = models.PVSystem(**res["system_definition"])
+            out.append(
+                (
+                    UUID(res["system_id"]),
+                    res["dataset"],
+                    models.PVSystem(**res["definition"]),
+                    previous,
+                )
+            )
+        return out
+
     def get_system_model_meta(
         self, system_id: UUID, dataset: models.DatasetEnum
     ) -> models.SystemDataMeta:
@@ -302,6 +383,16 @@ class StorageInterface:
             out["status"] = "queued"
         return models.SystemDataMeta(**out)
 
+    def get_system_model_result_tag(
+        self, system_id: UUID, dataset: models.DatasetEnum
+    ) -> str:
+        """A tag that changes whenever the stored results of the system model
+        change, from the system data metadata without reading the results"""
+        out = self._call_procedure_for_single(
+            "get_system_data_meta", system_id, dataset
+        )
+        return _result_tag(out)
+
     def update_system_model_data(
         self,
         system_id: UUID,
@@ -310,39 +401,98 @@ class StorageInterface:
         timeseries_data: Optional[bytes],
         statistics: Optional[bytes],
         error: Union[dict, List[dict]] = [],
+        system_definition: Optional[models.PVSystem] = None,
     ):
         self._call_procedure(
             "update_system_data",
             system_id,
             dataset,
-            timeseries_data,
-            statistics,
+            self._store_result(timeseries_data),
+            self._store_result(statistics),
             json.dumps(error),
             __version__,
             system_hash,
+            system_definition.json() if system_definition is not None else None,
         )
+        # tables of the old results are no longer used, free them now
+        table_cache.invalidate(system_id)
 
-    def get_system_model_timeseries(
+    def get_system_model_definition(
         self, system_id: UUID, dataset: models.DatasetEnum
+    ) -> Optional[models.PVSystem]:
+        """Get the system definition that the complete timeseries and
+        statistics were computed from by this version of the API, or None
+        if there are no stored results that can be reused"""
+        out = self._call_procedure("get_system_data_definition", system_id, dataset)
+        if len(out) == 0:
+            return None
+        res = out[0]
+        if (
+            res["status"] != "complete"
+            or res["version"] != __version__
+            or res["system_definition"] is None
+        ):
+            return None
+        return models.PVSystem(**res["system_definition"])
+
+    def _store_result(self, data: Optional[bytes]) -> Optional[bytes]:
+        """Put a result in the result store, if configured, returning the
+        reference to store in MySQL in its place"""
+        store = get_result_store()
+        if store is None:
+            return data
+        return store.store(data)
+
+    def _load_result(self, data: bytes) -> bytes:
+        """Get the result stored in MySQL or referenced from the result store"""
+        if not is_reference(data):
+            return data
+        store = get_result_store()
+        if store is None:
+            raise HTTPException(status_code=500, detail="No result store configured")
+        try:
+            return store.get(reference_digest(data))
+        except KeyError:
+            raise HTTPException(status_code=500, detail="Stored result is missing")
+
+    def _get_system_result(
+        self, system_id: UUID, dataset: models.DatasetEnum, artifact: str
     ) -> bytes:
         res = self._call_procedure_for_single(
-            "get_system_timeseries", system_id, dataset
+            f"get_system_{artifact}", system_id, dataset
         )
-        if res["timeseries"] is None:
-            raise HTTPException(status_code=404, detail="No timeseries data available")
-        out: bytes = res["timeseries"]
+        if res[artifact] is None:
+            raise HTTPException(status_code=404, detail=MISSING_RESULT_DETAIL[artifact])
+        out: bytes = res[artifact]
         return out
 
+    def get_system_model_result(
+        self, system_id: UUID, dataset: models.DatasetEnum, artifact: str
+    ) -> Union[bytes, Path]:
+        """Get the ``artifact`` ("timeseries" or "statistics") of the system
+        model, as the path of a local file if it is in a file result store
+        so that it can be sent without reading it into memory"""
+        data = self._get_system_result(system_id, dataset, artifact)
+        store = get_result_store()
+        if store is not None and is_reference(data):
+            path = store.local_path(reference_digest(data))
+            if path is not None:
+                return path
+        return self._load_result(data)
+
+    def get_system_model_timeseries(
+        self, system_id: UUID, dataset: models.DatasetEnum
+    ) -> bytes:
+        return self._load_result(
+            self._get_system_result(system_id, dataset, "timeseries")
+        )
+
     def get_system_model_statistics(
         self, system_id: UUID, dataset: models.DatasetEnum
     ) -> bytes:
-        res = self._call_procedure_for_single(
-            "get_system_statistics", system_id, dataset
+        return self._load_result(
+            self._get_system_result(system_id, dataset, "statistics")
         )
-        if res["statistics"] is None:
-            raise HTTPException(status_code=404, detail="No statistics available")
-        out: bytes = res["statistics"]
-        return out
 
     @ensure_user_exists
     def create_system_group(self, name: str):
@@ -388,6 +538,108 @@ class StorageInterface:
     def remove_system_from_group(self, system_id: UUID, group_id: UUID):
         self._call_procedure("remove_system_from_group", system_id, group_id)
 
+    def get_group_model_timeseries(
+        self,
+        group_id: UUID,
+        dataset: models.DatasetEnum,
+        system_ids: Optional[Sequence[UUID]] = None,
+    ) -> Dict[UUID, bytes]:
+        """Get the timeseries of every system in the group, or of only the
+        systems in system_ids, with a single query, keyed by system id"""
+        if system_ids is None:
+            res = self._call_procedure("get_group_system_timeseries", group_id, dataset)
+        else:
+            res = self._call_procedure(
+                "get_group_system_timeseries_of",
+                group_id,
+                dataset,
+                json.dumps([str(system_id) for system_id in system_ids]),
+            )
+        out = {}
+        for row in res:
+            if row["timeseries"] is None:
+                raise HTTPException(
+                    status_code=404,
+                    detail=f"No timeseries data available for {row['system_id']}",
+                )
+            out[UUID(row["system_id"])] = self._load_result(row["timeseries"])
+        return out
+
+    def get_group_model_result_tags(
+        self, group_id: UUID, dataset: models.DatasetEnum
+    ) -> Dict[UUID, str]:
+        """Get the result tag (see get_system_model_result_tag) of every
+        system in the group that has data for the dataset, keyed by system id"""
+        res = self._call_procedure("get_group_system_data_meta", group_id, dataset)
+        return {UUID(row["system_id"]): _result_tag(row) for row in res}
+
+    def get_group_model_meta(
+        self, group_id: UUID, dataset: models.DatasetEnum
+    ) -> Dict[UUID, models.SystemDataMeta]:
+        """Get the system data metadata of every system in the group that has
+        data for the dataset, keyed by system id"""
+        res = self._call_procedure("get_group_system_data_meta", group_id, dataset)
+        out = {}
+        for row in res:
+            stored_hash = row.pop("system_hash")
+            current_hash = row.pop("current_system_hash")
+            row["system_modified"] = (
+                stored_hash is not None and stored_hash.lower() != current_hash
+            )
+            # present "prepared" status as "queued"
+            if row["status"] == "prepared":
+                row["status"] = "queued"
+            meta = models.SystemDataMeta(**row)
+            out[meta.system_id] = meta
+        return out
+
+    def get_group_model_data(
+        self, group_id: UUID, dataset: models.DatasetEnum, artifact: str
+    ) -> Tuple[str, Optional[bytes]]:
+        """Get the key describing the current members of the group and their
+        results along with the stored group ``artifact`` ("timeseries" or
+        "statistics"), which is None unless it was computed for that key by
+        this version of the API"""
+        res = self._call_procedure_for_single(
+            "get_system_group_data", group_id, dataset, artifact
+        )
+        data_key: str = res["data_key"]
+        stored_key = res["stored_data_key"]
+        if (
+            stored_key is None
+            or stored_key.lower() != data_key
+            or res["version"] != __version__
+        ):
+            return data_key, None
+        return data_key, self._load_result(res["data"])
+
+    def get_group_model_data_key(
+        self, group_id: UUID, dataset: models.DatasetEnum
+    ) -> str:
+        """Get the key describing the current members of the group and their
+        results without reading any stored group data"""
+        res = self._call_procedure_for_single("get_group_data_key", group_id, dataset)
+        out: str = res["data_key"]
+        return out
+
+    def update_group_model_data(
+        self,
+        group_id: UUID,
+        dataset: models.DatasetEnum,
+        artifact: str,
+        data_key: str,
+        data: bytes,
+    ):
+        self._call_procedure(
+            "update_system_group_data",
+            group_id,
+            dataset,
+            artifact,
+            data_key,
+            __version__,
+            self._store_result(data),
+        )
+
 
 class ComputeManagementInterface(StorageInterface):
     """A special interface to the database (that requires different permissions)
@@ -401,13 +653,44 @@ class ComputeManagementInterface(StorageInterface):
     def list_system_data_status(self) -> List[models.ManagementSystemDataStatus]:
         with self.start_transaction() as st:
             res = st._call_procedure("list_system_data_status", with_current_user=False)
+        return _management_status(res)
+
+    def list_system_data_status_since(
+        self, since: Optional[dt.datetime] = None
+    ) -> List[models.ManagementSystemDataStatus]:
+        """List the status of the system data, or systems, modified at or after
+        since, or of all system data if since is None"""
+        if since is None:
+            since = EARLIEST_TIMESTAMP
+        with self.start_transaction() as st:
+            res = st._call_procedure(
+                "list_system_data_status_since", since, with_current_user=False
+            )
+        return _management_status(res)
+
+    def list_system_data_status_of(
+        self, items: Sequence[Tuple[UUID, str]]
+    ) -> List[models.ManagementSystemDataStatus]:
+        """List the status of the (system_id, dataset) pairs, skipping any
+        pairs without system data"""
+        if len(items) == 0:
+            return []
+        with self.start_transaction() as st:
+            res = st._call_procedure(
+                "list_system_data_status_of",
+                _system_dataset_json(items),
+                with_current_user=False,
+            )
+        return _management_status(res)
 
-        def repq(d):
-            if d["status"] == "prepared":
-                d["status"] = "queued"
-            return d
-
-        return [models.ManagementSystemDataStatus(**repq(r)) for r in res]
+    def list_result_references(self) -> Set[str]:
+        """The digests of all results referenced from the result store"""
+        with self.start_transaction() as st:
+            res = st._call_procedure("list_result_references", with_current_user=False)
+        return {
+            r["digest"].decode() if isinstance(r["digest"], bytes) else r["digest"]
+            for r in res
+        }
 
     def report_failure(self, system_id: str, dataset: str, message: str):
         with self.start_transaction() as st:
@@ -0,0 +1,136 @@
+"""In-process least recently used cache of the decoded Arrow tables of system
+model results, so that repeated requests for the same results, e.g. from the
+dashboard or the aggregation of groups, do not decode the stored bytes again.
+"""
+from collections import OrderedDict
+import threading
+from typing import Callable, Optional, Tuple
+from uuid import UUID
+
+
+from prometheus_client import Counter, Gauge  # type: ignore
+import pyarrow as pa  # type: ignore
+
+
+from . import models, settings
+
+
+TABLE_CACHE_HITS = Counter(
+    "esprr_table_cache_hits", "Number of result tables found in the cache"
+)
+TABLE_CACHE_MISSES = Counter(
+    "esprr_table_cache_misses", "Number of result tables decoded and added to the cache"
+)
+TABLE_CACHE_EVICTIONS = Counter(
+    "esprr_table_cache_evictions",
+    "Number of result tables removed from the cache to stay under the size limit",
+)
+TABLE_CACHE_BYTES = Gauge(
+    "esprr_table_cache_bytes", "Total size of the result tables in the cache"
+)
+TABLE_CACHE_ENTRIES = Gauge(
+    "esprr_table_cache_entries", "Number of result tables in the cache"
+)
+TABLE_CACHE_HIT_RATIO = Gauge(
+    "esprr_table_cache_hit_ratio",
+    "Fraction of the result tables requested from the cache that were found",
+)
+
+# (system id, dataset, artifact, result tag)
+_TableKey = Tuple[str, str, str, str]
+
+
+def result_key(
+    system_id: UUID, dataset: models.DatasetEnum, artifact: str, tag: str
+) -> _TableKey:
+    """The key of the ``artifact`` of the system model, where ``tag`` changes
+    whenever the stored result changes (see
+    StorageInterface.get_system_model_result_tag) so that entries of old
+    results are never used, even if they were replaced by another process"""
+    return (str(system_id), models.DatasetEnum(dataset).value, artifact, tag)
+
+
+class TableCache:
+    """
+    Least recently used cache of Arrow tables that keeps the total size of
+    the tables no larger than max_bytes. Tables are immutable, so a cached
+    table is shared by all requests.
+    """
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.nbytes = 0
+        self._tables: "OrderedDict[_TableKey, pa.Table]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._tables)
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def get(self, key: _TableKey) -> Optional[pa.Table]:
+        """Get the table stored under key, or None if it is not in the cache"""
+        with self._lock:
+            table = self._tables.get(key)
+            if table is None:
+                self.misses += 1
+                TABLE_CACHE_MISSES.inc()
+                return None
+            self._tables.move_to_end(key)
+            self.hits += 1
+        TABLE_CACHE_HITS.inc()
+        return table
+
+    def put(self, key: _TableKey, table: pa.Table) -> None:
+        """Add table to the cache, removing the least recently used tables
+        if the cache is then larger than max_bytes"""
+        if table.nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._tables.pop(key, None)
+            if old is not None:
+                self.nbytes -= old.nbytes
+            self._tables[key] = table
+            self.nbytes += table.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self._tables.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+                self.evictions += 1
+                TABLE_CACHE_EVICTIONS.inc()
+            self._update_gauges()
+
+    def get_or_load(self, key: _TableKey, load: Callable[[], pa.Table]) -> pa.Table:
+        """Get the table stored under key, adding the table returned by
+        load to the cache if it is not found"""
+        table = self.get(key)
+        if table is None:
+            table = load()
+            self.put(key, table)
+        return table
+
+    def invalidate(self, system_id: UUID) -> None:
+        """Remove all tables of the system"""
+        with self._lock:
+            for key in [k for k in self._tables if k[0] == str(system_id)]:
+                self.nbytes -= self._tables.pop(key).nbytes
+            self._update_gauges()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tables.clear()
+            self.nbytes = 0
+            self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        TABLE_CACHE_BYTES.set(self.nbytes)
+        TABLE_CACHE_ENTRIES.set(len(self._tables))
+
+
+table_cache = TableCache(settings.table_cache_max_bytes)
+TABLE_CACHE_HIT_RATIO.set_function(lambda: table_cache.hit_ratio)
@@ -1,9 +1,12 @@
+from io import BytesIO
+
+
 import pandas as pd
 import numpy as np
 import pytest
 
 
-from esprr_api import compute, models, settings
+from esprr_api import compute, models, settings, utils
 from esprr_api.data import nsrdb
 
 
@@ -72,6 +75,59 @@ def test_compute_single_location(system_def, mocker):
     assert solpos.call_count == 1  # cachelocation working
 
 
+@pytest.mark.parametrize(
+    "tracker",
+    [
+        models.FixedTracking(tilt=20, azimuth=180),
+        models.SingleAxisTracking(
+            axis_tilt=20, axis_azimuth=180, gcr=0.3, backtracking=True
+        ),
+    ],
+)
+def test_compute_single_location_shared_geometry(
+    ready_dataset, system_def, mocker, tracker
+):
+    system_def.tracking = tracker
+    data = next(ready_dataset.generate_data(system_def))
+    singleaxis = mocker.spy(compute.SingleAxisTracker, "singleaxis")
+    aoi = mocker.spy(compute.PVSystem, "get_aoi")
+    out = compute.compute_single_location(system_def, data)
+    assert singleaxis.call_count + aoi.call_count == 1
+
+    # same as running the clearsky data through its own ModelChain
+    mocker.patch.object(
+        compute.SharedGeometryModelChain,
+        "run_model_with_geometry",
+        new=lambda self, weather, geometry: self.run_model(weather),
+    )
+    expected = compute.compute_single_location(system_def, data)
+    assert singleaxis.call_count + aoi.call_count == 3
+    pd.testing.assert_frame_equal(out, expected)
+
+
+def test_shared_geometry_modelchain_times(system_def):
+    location = compute.Location(32.02, -110.9, altitude=800)
+    pvsystem = compute.PVSystem(
+        surface_tilt=20,
+        surface_azimuth=180,
+        module_parameters=dict(gamma_pdc=-0.004, pdc0=1),
+        inverter_parameters=dict(pdc0=1),
+        temperature_model_parameters=compute.TEMPERATURE_PARAMETERS,
+    )
+    weather = pd.DataFrame(
+        {"ghi": [1100, 0], "dni": [1000, 0], "dhi": [100, 0]},
+        index=pd.DatetimeIndex(["2021-05-03T19:00Z", "2021-05-04T07:00Z"]),
+    )
+    mc = compute.SharedGeometryModelChain.with_pvwatts(pvsystem, location)
+    mc.run_model(weather)
+    clr_mc = compute.SharedGeometryModelChain.with_pvwatts(pvsystem, location)
+    with pytest.raises(ValueError):
+        clr_mc.run_model_with_geometry(weather.iloc[:1], mc.results)
+    clr_mc.run_model_with_geometry(weather, mc.results)
+    pd.testing.assert_series_equal(clr_mc.results.ac, mc.results.ac)
+    assert clr_mc._geometry is None
+
+
 @pytest.mark.parametrize(
     "tracker",
     [
@@ -82,7 +138,7 @@ def test_compute_single_location(system_def, mocker):
     ],
 )
 def test_compute_total_system_power(ready_dataset, system_def, mocker, tracker):
-    single = mocker.spy(compute, "compute_single_location")
+    gridded = mocker.spy(compute, "compute_gridded_system_power")
     system_def.tracking = tracker
     out = compute.compute_total_system_power(system_def, ready_dataset)
     assert isinstance(out, pd.DataFrame)
@@ -96,7 +152,150 @@ def test_compute_total_system_power(ready_dataset, system_def, mocker, tracker):
     assert abs(out.ac_power.max() - 10.0) < 1e-6
     assert abs(out.clearsky_ac_power.max() - 10.0) < 1e-6
     assert out.ac_power.min() == 0.0
-    assert single.call_count == 12
+    assert gridded.call_count == 1
+
+
+def test_compute_total_system_power_points(ready_dataset, system_def, mocker):
+    points = ready_dataset.find_system_locations(system_def)
+    find = mocker.spy(ready_dataset, "find_system_locations")
+    out = compute.compute_total_system_power(system_def, ready_dataset, points)
+    assert find.call_count == 0
+    pd.testing.assert_frame_equal(
+        out, compute.compute_total_system_power(system_def, ready_dataset)
+    )
+
+
+@pytest.mark.parametrize(
+    "tracker",
+    [
+        models.FixedTracking(tilt=20, azimuth=180),
+        models.SingleAxisTracking(
+            axis_tilt=20, axis_azimuth=180, gcr=0.3, backtracking=True
+        ),
+        models.SingleAxisTracking(
+            axis_tilt=0, axis_azimuth=170, gcr=0.4, backtracking=False
+        ),
+    ],
+)
+def test_compute_gridded_system_power(ready_dataset, system_def, mocker, tracker):
+    mocker.patch.object(compute, "LOCATION_BLOCK_SIZE", new=5)
+    # the default tolerance gives exact results
+    mocker.patch.object(
+        compute,
+        "solar_position_cache",
+        new=compute.SolarPositionCache(100, compute.settings.solar_position_tolerance),
+    )
+    system_def.tracking = tracker
+    data = list(ready_dataset.generate_data(system_def))
+    expected = sum(compute.compute_single_location(system_def, d) for d in data)
+    out = compute.compute_gridded_system_power(
+        system_def, models.GriddedSystemData.from_system_data(data)
+    )
+    pd.testing.assert_frame_equal(out, expected, check_freq=False)
+
+
+def test_compute_gridded_system_power_tolerance(ready_dataset, system_def, mocker):
+    assert compute.settings.solar_position_tolerance == 0
+    mocker.patch.object(
+        compute, "solar_position_cache", new=compute.SolarPositionCache(100, 0.05)
+    )
+    data = list(ready_dataset.generate_data(system_def))
+    expected = sum(compute.compute_single_location(system_def, d) for d in data)
+    out = compute.compute_gridded_system_power(
+        system_def, models.GriddedSystemData.from_system_data(data)
+    )
+    # nearby grid points share a position
+    assert compute.solar_position_cache.misses < len(data)
+    # the shift of sunrise may turn the zero DC power of one time into nan
+    flipped = out.isna() != expected.isna()
+    assert flipped.any(axis=1).sum() <= 1
+    assert not flipped[["ac_power", "clearsky_ac_power"]].any().any()
+    assert (expected[flipped].fillna(0) == 0).all().all()
+    # within 0.2% of the peak power
+    np.testing.assert_allclose(
+        out.fillna(0), expected.fillna(0), rtol=0, atol=2e-3 * expected.max().max()
+    )
+
+
+def test_solar_position_cache(mocker):
+    times = pd.date_range("2019-06-01T00:00Z", freq="5min", periods=288)
+    lat = np.array([32.03, 32.05, 32.03])
+    lon = np.array([-110.9, -110.92, -110.9])
+    alt = np.array([800.0, 820.0, 800.0])
+    cache = compute.SolarPositionCache(2)
+    position = mocker.spy(compute, "_topocentric_position")
+    out = cache.get(times, lat, lon, alt)
+    assert position.call_count == 1
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert out[0][0] is out[2][0]
+    assert not out[0][0].flags.writeable
+    expected = compute.get_solarposition(
+        times, 32.03, -110.9, 800.0, method="nrel_numpy", delta_t=67
+    )
+    np.testing.assert_allclose(out[0][0], expected.elevation, atol=2e-2)
+    np.testing.assert_allclose(out[0][1], expected.azimuth)
+
+    out2 = cache.get(times, lat[:1], lon[:1], alt[:1])
+    assert position.call_count == 1
+    assert out2[0][0] is out[0][0]
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    # least recently used location is evicted
+    cache.get(times, np.array([32.1]), np.array([-110.8]), np.array([900.0]))
+    assert position.call_count == 2
+    cache.get(times, lat[:1], lon[:1], alt[:1])
+    assert position.call_count == 2
+    cache.get(times, lat[1:2], lon[1:2], alt[1:2])
+    assert position.call_count == 3
+
+    # new times are a miss
+    cache.get(times + pd.Timedelta("365D"), lat[:1], lon[:1], alt[:1])
+    assert position.call_count == 4
+    assert (cache.hits, cache.misses) == (3, 5)
+
+
+def test_solar_position_cache_time_terms(mocker):
+    times = pd.date_range("2019-06-01T00:00Z", freq="5min", periods=288)
+    other = times + pd.Timedelta("365D")
+    cache = compute.SolarPositionCache(10, times_size=1)
+    terms = mocker.spy(compute, "_solar_time_terms")
+    cache.time_terms(times)
+    cache.time_terms(times)
+    assert terms.call_count == 1
+    cache.time_terms(other)
+    cache.time_terms(times)
+    assert terms.call_count == 3
+
+
+def test_solar_position_cache_tolerance():
+    times = pd.date_range("2019-06-01T00:00Z", freq="5min", periods=288)
+    cache = compute.SolarPositionCache(10, tolerance=0.05)
+    out = cache.get(
+        times,
+        np.array([32.02, 32.01, 32.1]),
+        np.array([-110.91, -110.89, -110.9]),
+        np.array([800.4, 799.6, 800.0]),
+    )
+    assert (cache.hits, cache.misses) == (1, 2)
+    assert out[0][0] is out[1][0]
+    assert out[0][0] is not out[2][0]
+    exact = compute.SolarPositionCache(10).get(
+        times, np.array([32.0]), np.array([-110.9]), np.array([1000.0])
+    )
+    np.testing.assert_allclose(out[0][0], exact[0][0])
+
+
+def test_compute_gridded_system_power_cache(ready_dataset, system_def, mocker):
+    mocker.patch.object(
+        compute, "solar_position_cache", new=compute.SolarPositionCache(100)
+    )
+    data = ready_dataset.get_gridded_data(system_def)
+    first = compute.compute_gridded_system_power(system_def, data)
+    assert compute.solar_position_cache.misses == 12
+    assert compute.solar_position_cache.hits == 0
+    second = compute.compute_gridded_system_power(system_def, data)
+    assert compute.solar_position_cache.hits == 12
+    pd.testing.assert_frame_equal(first, second)
 
 
 def test_daytime_limits():
@@ -122,6 +321,62 @@ def test_daytime_limits():
     )
 
 
+@pytest.mark.parametrize("size", [0, 1, 7, 1000])
+def test_grouped_quantiles(size):
+    rng = np.random.default_rng(size)
+    codes = rng.integers(1, 13, size)
+    values = rng.normal(size=size)
+    quantiles = [0.0001, 0.05, 0.5, 0.95, 0.9999]
+    groups, out = compute._grouped_quantiles(codes, values, quantiles)
+    assert out.shape == (len(quantiles), len(groups))
+    for q, vals in zip(quantiles, out):
+        expected = pd.Series(values).groupby(codes).quantile(q)
+        np.testing.assert_array_equal(groups, expected.index)
+        np.testing.assert_allclose(vals, expected.to_numpy())
+
+
+@pytest.mark.parametrize("period", [5, 15, 60])
+def test_ramp_statistics(period):
+    index = pd.date_range(
+        "2019-01-01T00:00-07:00", "2019-03-01T00:00-07:00", freq="5min"
+    ).tz_convert("Etc/GMT+7")
+    rng = np.random.default_rng(period)
+    hour = index.hour + index.minute / 60
+    zenith = pd.Series(np.abs(hour - 12) * 15 + 5, index=index)
+    clear = np.clip(np.cos(np.radians(zenith)), 0, None)
+    data = pd.DataFrame(
+        {
+            "ac_power": clear * rng.uniform(0.2, 1, len(index)),
+            "clearsky_ac_power": clear,
+        },
+        index=index,
+    )
+    out = compute._ramp_statistics(period, data, zenith)
+    assert list(out.keys()) == [
+        (f"{period}-min", stat)
+        for stat, _ in compute.LARGEST_RAMP_QUANTILES
+        + compute.TYPICAL_SS_RAMP_QUANTILES
+    ]
+
+    keep = compute._daytime_limits(period, zenith)
+    diffs = data.resample(f"{period}min").mean().diff()[keep].dropna()
+    for stat, q in compute.LARGEST_RAMP_QUANTILES:
+        expected = diffs.ac_power.groupby(lambda x: x.month).quantile(q)
+        pd.testing.assert_series_equal(
+            out[(f"{period}-min", stat)], expected, check_names=False
+        )
+    for stat, q in compute.TYPICAL_SS_RAMP_QUANTILES:
+        expected = (
+            diffs.clearsky_ac_power.groupby(lambda x: x.date)
+            .quantile(q)
+            .groupby(lambda x: x.month)
+            .mean()
+        )
+        pd.testing.assert_series_equal(
+            out[(f"{period}-min", stat)], expected, check_names=False
+        )
+
+
 def test_compute_statistics(system_def):
     data = pd.DataFrame(
         {
@@ -206,6 +461,114 @@ def test_run_job_error(
     assert cargs[5] == {"message": "test err"}
 
 
+def test_run_job_capacity_change(
+    system_id,
+    dataset_name,
+    auth0_id,
+    mocker,
+    system_def,
+    timeseries_bytes,
+    add_example_db_data,
+):
+    get_dataset = mocker.patch("esprr_api.compute._get_dataset")
+    previous = system_def.copy(update={"ac_capacity": system_def.ac_capacity / 2})
+    mocker.patch(
+        "esprr_api.storage.StorageInterface.get_system_model_definition",
+        return_value=previous,
+    )
+    mocker.patch(
+        "esprr_api.storage.StorageInterface.get_system_model_timeseries",
+        return_value=timeseries_bytes,
+    )
+    update = mocker.patch("esprr_api.storage.StorageInterface.update_system_model_data")
+    compute.run_job(system_id, dataset_name, auth0_id)
+    assert get_dataset.call_count == 0
+    assert update.call_count == 1
+    cargs = update.call_args[0]
+    ts = utils.read_arrow(BytesIO(cargs[3]))
+    before = utils.read_arrow(BytesIO(timeseries_bytes))
+    pd.testing.assert_frame_equal(
+        ts.set_index("time"), before.set_index("time") * 2, check_dtype=False
+    )
+    assert update.call_args[1]["system_definition"] == system_def
+
+
+def test_run_datasets_job(
+    system_id, auth0_id, mocker, ready_dataset, add_example_db_data
+):
+    mocker.patch("esprr_api.compute._get_dataset", return_value=ready_dataset)
+    find = mocker.spy(ready_dataset, "find_system_locations")
+    update = mocker.patch("esprr_api.storage.StorageInterface.update_system_model_data")
+    compute.run_datasets_job(system_id, ["NSRDB_2019", "NSRDB_2020"], auth0_id)
+    # the grid is shared by both datasets
+    assert find.call_count == 1
+    assert update.call_count == 2
+    assert [c[0][1] for c in update.call_args_list] == ["NSRDB_2019", "NSRDB_2020"]
+    for c in update.call_args_list:
+        assert c[0][0] == system_id
+        assert c[0][3].startswith(b"ARROW")
+        assert c[0][4].startswith(b"ARROW")
+
+
+def test_run_datasets_job_badid(
+    other_system_id, auth0_id, mocker, ready_dataset, add_example_db_data
+):
+    mocker.patch("esprr_api.compute._get_dataset", return_value=ready_dataset)
+    update = mocker.patch("esprr_api.storage.StorageInterface.update_system_model_data")
+    compute.run_datasets_job(other_system_id, ["NSRDB_2019", "NSRDB_2020"], auth0_id)
+    assert update.call_count == 0
+
+
+def test_run_datasets_job_error(
+    system_id, auth0_id, mocker, ready_dataset, add_example_db_data
+):
+    mocker.patch("esprr_api.compute._get_dataset", return_value=ready_dataset)
+    update = mocker.patch("esprr_api.storage.StorageInterface.update_system_model_data")
+    errors = [ValueError("test err")]
+    stats = compute.compute_statistics
+
+    def compute_statistics(*args):
+        if errors:
+            raise errors.pop()
+        return stats(*args)
+
+    mocker.patch("esprr_api.compute.compute_statistics", side_effect=compute_statistics)
+    # the error of the first dataset does not stop the second
+    compute.run_datasets_job(system_id, ["NSRDB_2019", "NSRDB_2020"], auth0_id)
+    assert update.call_count == 2
+    first, second = update.call_args_list
+    assert first[0][1] == "NSRDB_2019"
+    assert first[0][3] is None
+    assert first[0][5] == {"message": "test err"}
+    assert second[0][1] == "NSRDB_2020"
+    assert second[0][3].startswith(b"ARROW")
+
+
+def test_capacity_scale_factor(system_def):
+    new = system_def.copy(update={"name": "other", "ac_capacity": 25.0})
+    assert compute.capacity_scale_factor(system_def, new) == 25.0 / 10.0
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        {"dc_ac_ratio": 1.4},
+        {"albedo": 0.3},
+        {"apply_variability_multiplier": True},
+        {"tracking": models.FixedTracking(tilt=10, azimuth=180)},
+    ],
+)
+def test_capacity_scale_factor_other_change(system_def, update):
+    new = system_def.copy(update={"ac_capacity": 25.0, **update})
+    assert compute.capacity_scale_factor(system_def, new) is None
+
+
+def test_scale_system_power(timeseries_bytes, timeseries_df):
+    out = compute.scale_system_power(timeseries_bytes, 0.5)
+    expected = timeseries_df.set_index("time") * 0.5
+    pd.testing.assert_frame_equal(out, expected, check_freq=False, rtol=1e-6)
+
+
 variable_mult_df = pd.DataFrame(
     {
         "ac_power": (
@@ -0,0 +1,78 @@
+import asyncio
+from contextlib import contextmanager
+import datetime as dt
+import inspect
+import time
+import uuid
+
+
+from fastapi.routing import APIRoute
+import httpx
+import pytest
+
+
+from esprr_api import auth, main, models
+from esprr_api.storage import StorageInterface
+
+
+def test_handlers_not_coroutines():
+    # handlers call the blocking storage, so they must run in the threadpool
+    for route in main.app.routes:
+        if isinstance(route, APIRoute) and route.path != "/ping":
+            assert not inspect.iscoroutinefunction(route.endpoint), route.path
+
+
+class SlowStorage:
+    def __init__(self, delay):
+        self.delay = delay
+
+    @contextmanager
+    def start_transaction(self):
+        time.sleep(self.delay)  # like a slow query
+        yield self
+
+    def get_user(self):
+        now = dt.datetime.now(dt.timezone.utc)
+        return models.UserInfo(
+            object_id=uuid.uuid1(),
+            object_type="user",
+            created_at=now,
+            modified_at=now,
+            auth0_id="auth0|slow",
+        )
+
+
+@pytest.fixture()
+def slow_app():
+    main.app.dependency_overrides[auth.get_user_id] = lambda: "auth0|slow"
+    main.app.dependency_overrides[StorageInterface] = lambda: SlowStorage(0.5)
+    yield main.app
+    main.app.dependency_overrides.clear()
+
+
+@pytest.mark.asyncio
+async def test_slow_storage_does_not_block(slow_app):
+    async with httpx.AsyncClient(app=slow_app, base_url="http://test") as client:
+        done = []
+
+        async def get(path):
+            resp = await client.get(path)
+            assert resp.status_code == 200
+            done.append(path)
+
+        start = time.monotonic()
+        await asyncio.gather(get("/user/"), get("/user/"), get("/ping"))
+        assert done[0] == "/ping"
+        # both slow requests ran at the same time
+        assert time.monotonic() - start < 0.9
+
+
+@pytest.mark.asyncio
+async def test_set_threadpool_size():
+    limiter = main.anyio.to_thread.current_default_thread_limiter()
+    before = limiter.total_tokens
+    main.set_threadpool_size(3)
+    try:
+        assert limiter.total_tokens == 3
+    finally:
+        main.set_threadpool_size(before)
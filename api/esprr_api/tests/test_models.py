@@ -4,6 +4,7 @@ import re
 
 from hypothesis import given, example, assume
 from hypothesis.strategies import floats, booleans, composite, from_regex
+import numpy as np
 import pandas as pd
 from pydantic import BaseModel, ValidationError
 import pytest
@@ -213,3 +214,57 @@ good_df = pd.DataFrame(
 def test_systemdata(inp):
     with pytest.raises(ValidationError):
         models.SystemData(**inp)
+
+
+gridded_df = pd.DataFrame(
+    {k: [1.0, 2.0, 3.0] for k in models.WEATHER_VARIABLES},
+    index=pd.date_range("2021-04-04T00:00Z", freq="5min", periods=3),
+)
+
+
+def test_griddedsystemdata_from_system_data():
+    data = [
+        models.SystemData(
+            location=dict(latitude=32 + i, longitude=-110, altitude=800),
+            fraction_of_total=0.5,
+            weather_data=gridded_df * i,
+            clearsky_data=gridded_df,
+        )
+        for i in range(2)
+    ]
+    out = models.GriddedSystemData.from_system_data(data)
+    assert (out.times == gridded_df.index).all()
+    assert out.fraction_of_total == [0.5, 0.5]
+    assert (out.latitude == [32, 33]).all()
+    assert (out.altitude == [800, 800]).all()
+    assert out.weather_data["ghi"].shape == (len(gridded_df), 2)
+    assert (out.weather_data["ghi"][:, 0] == 0).all()
+    assert (out.weather_data["ghi"][:, 1] == [1, 2, 3]).all()
+    assert (out.clearsky_data["ghi"][:, 0] == gridded_df["ghi"]).all()
+
+
+def test_griddedsystemdata_from_system_data_empty():
+    with pytest.raises(ValueError):
+        models.GriddedSystemData.from_system_data([])
+
+
+@pytest.mark.parametrize(
+    "update",
+    [
+        dict(fraction_of_total=[1.0, 0.0]),
+        dict(weather_data={"ghi": np.zeros((3, 1))}),
+        dict(clearsky_data={k: np.zeros((2, 1)) for k in models.WEATHER_VARIABLES}),
+        pytest.param(dict(), marks=pytest.mark.xfail(strict=True)),
+    ],
+)
+def test_griddedsystemdata_invalid(update):
+    inp = dict(
+        times=gridded_df.index,
+        locations=[dict(latitude=32, longitude=-110, altitude=800)],
+        fraction_of_total=[1.0],
+        weather_data={k: np.zeros((3, 1)) for k in models.WEATHER_VARIABLES},
+        clearsky_data={k: np.zeros((3, 1)) for k in models.WEATHER_VARIABLES},
+    )
+    inp.update(update)
+    with pytest.raises(ValidationError):
+        models.GriddedSystemData(**inp)
@@ -1,10 +1,15 @@
+import datetime as dt
+import os
+import uuid
+
+
 import pytest
 from rq import Queue, get_current_job, SimpleWorker
 from rq.exceptions import NoSuchJobError
 from rq.job import Job
 
 
-from esprr_api import queuing, models
+from esprr_api import queuing, models, result_store
 
 
 pytestmark = pytest.mark.usefixtures("mock_redis")
@@ -25,8 +30,13 @@ def run(sys_id, dsname, user):
 def qm():
     out = queuing.QueueManager()
     out.job_func = run
+    out.datasets_job_func = run
     q = Queue(is_async=False, connection=out.redis_conn)
     out.q = q
+    out.bulk_queues = [
+        Queue(name, is_async=False, connection=out.redis_conn)
+        for name in queuing.bulk_queue_names()
+    ]
     return out
 
 
@@ -41,12 +51,259 @@ def test_qmanager_enqueue_job(qm, system_id, dataset_name):
     assert job2 == job
 
 
+def test_qmanager_enqueue_jobs(qm, system_id, dataset_name):
+    first = qm.enqueue_job(system_id, dataset_name, "user")
+    jobs = qm.enqueue_jobs(
+        [
+            (system_id, dataset_name),
+            (system_id, "other"),
+            (system_id, dataset_name),
+        ],
+        "user",
+    )
+    assert first.is_finished
+    assert len(jobs) == 1
+    assert jobs[0].id == qm.generate_key(system_id, "other")
+    assert jobs[0].is_finished
+    assert jobs[0].result == (system_id, "other", "user")
+
+
+def test_qmanager_enqueue_jobs_datasets(qm, system_id, other_system_id):
+    jobs = qm.enqueue_jobs(
+        [
+            (system_id, "a"),
+            (other_system_id, "a"),
+            (system_id, "b"),
+            (system_id, "a"),
+        ],
+        "user",
+    )
+    assert [job.id for job in jobs] == [
+        f"{system_id}:a+b",
+        f"{other_system_id}:a",
+    ]
+    assert jobs[0].result == (system_id, ["a", "b"], "user")
+    assert jobs[1].result == (other_system_id, "a", "user")
+
+
+def test_qmanager_enqueue_jobs_async(async_queue, mocker, system_id, other_system_id):
+    qm = queuing.QueueManager()
+    pipeline = mocker.spy(qm.redis_conn, "pipeline")
+    jobs = qm.enqueue_jobs(
+        [(system_id, str(i)) for i in range(5)]
+        + [(other_system_id, str(i)) for i in range(2)],
+        "user",
+    )
+    assert [job.id for job in jobs] == [
+        f"{system_id}:0+1+2+3+4",
+        f"{other_system_id}:0+1",
+    ]
+    # one to fetch the existing jobs, one to list the queued and started
+    # jobs and one to enqueue the new jobs
+    assert pipeline.call_count == 3
+    bulk = qm.get_queue(queuing.JobPriority.bulk, "user")
+    assert bulk.job_ids == [job.id for job in jobs]
+    # datasets already modeled by a queued job are not queued again
+    jobs = qm.enqueue_jobs([(system_id, str(i)) for i in range(7)], "user")
+    assert [job.id for job in jobs] == [f"{system_id}:5+6"]
+    assert len(qm.queued_job_ids()) == 3
+
+
+def test_qmanager_get_queue(mocker):
+    mocker.patch.object(queuing.settings, "bulk_queue_count", 4)
+    qm = queuing.QueueManager()
+    assert qm.get_queue(queuing.JobPriority.interactive, "user") is qm.q
+    bulk = qm.get_queue(queuing.JobPriority.bulk, "user")
+    assert bulk in qm.bulk_queues
+    assert qm.get_queue(queuing.JobPriority.bulk, "user") is bulk
+    assert {
+        qm.get_queue(queuing.JobPriority.bulk, f"user{i}").name for i in range(20)
+    } == {f"jobs-bulk-{i}" for i in range(4)}
+
+
+def test_queue_priority():
+    assert queuing.queue_priority("jobs") == queuing.JobPriority.interactive
+    assert queuing.queue_priority("jobs-bulk-3") == queuing.JobPriority.bulk
+
+
+def test_qmanager_enqueue_job_promote(async_queue, system_id):
+    qm = queuing.QueueManager()
+    bulk = qm.get_queue(queuing.JobPriority.bulk, "user")
+    (job,) = qm.enqueue_jobs([(system_id, "a")], "user")
+    assert bulk.job_ids == [job.id]
+    # a job the user is now waiting on is moved to the interactive queue
+    out = qm.enqueue_job(system_id, "a", "user")
+    assert out.id == job.id
+    assert out.origin == "jobs"
+    assert async_queue.job_ids == [job.id]
+    assert bulk.job_ids == []
+    # and is not moved back by a bulk run
+    assert qm.enqueue_jobs([(system_id, "a")], "user") == []
+    assert async_queue.job_ids == [job.id]
+
+
+def test_qmanager_enqueue_job_promote_started(async_queue, system_id):
+    qm = queuing.QueueManager()
+    (job,) = qm.enqueue_jobs([(system_id, "a")], "user")
+    job.set_status("started")
+    qm.get_queue(queuing.JobPriority.bulk, "user").remove(job)
+    qm.enqueue_job(system_id, "a", "user")
+    assert async_queue.job_ids == []
+
+
+def test_qmanager_enqueue_job_datasets_job(async_queue, system_id):
+    qm = queuing.QueueManager()
+    (job,) = qm.enqueue_jobs([(system_id, "a"), (system_id, "b")], "user")
+    # the job modeling several datasets is moved instead of adding a job
+    out = qm.enqueue_job(system_id, "a", "user")
+    assert out.id == job.id == f"{system_id}:a+b"
+    assert qm.queued_job_ids() == [job.id]
+    assert async_queue.job_ids == [job.id]
+
+
+def test_qmanager_enqueue_datasets_job_started(async_queue, system_id):
+    qm = queuing.QueueManager()
+    bulk = qm.get_queue(queuing.JobPriority.bulk, "user")
+    (job,) = qm.enqueue_jobs([(system_id, "a"), (system_id, "b")], "user")
+    job.set_status("started")
+    bulk.remove(job)
+    bulk.started_job_registry.add(job, -1)
+    assert qm.active_job_ids() == {
+        f"{system_id}:a": job.id,
+        f"{system_id}:b": job.id,
+    }
+    assert qm.enqueue_jobs([(system_id, "a"), (system_id, "c")], "user")[0].id == (
+        f"{system_id}:c"
+    )
+    assert qm.enqueue_job(system_id, "b", "user").id == job.id
+    assert async_queue.job_ids == []
+
+
+def test_queue_metrics_collector(async_queue, system_id, mocker, caplog):
+    qm = queuing.QueueManager()
+    qm.enqueue_job(system_id, "a", "user")
+    qm.enqueue_jobs([(system_id, "b"), (system_id, "c")], "user")
+    qm.enqueue_jobs([(system_id, "d")], "other")
+    pipeline = mocker.spy(qm.redis_conn, "pipeline")
+    collector = queuing.QueueMetricsCollector()
+    assert [m.name for m in collector.describe()] == [
+        "esprr_queue_depth",
+        "esprr_queue_oldest_job_wait_seconds",
+        "esprr_queue_workers",
+    ]
+    assert pipeline.call_count == 0
+    depth, wait, workers = collector.collect()
+    assert pipeline.call_count == 2
+    assert {s.labels["priority"]: s.value for s in depth.samples} == {
+        "interactive": 1,
+        "bulk": 2,
+    }
+    assert {s.labels["priority"] for s in wait.samples} == {"interactive", "bulk"}
+    assert all(0 <= s.value < 60 for s in wait.samples)
+    assert [s.value for s in workers.samples] == [0, 0]
+    assert "2 bulk jobs are queued but no worker" in caplog.text
+
+
+def test_queue_metrics_collector_empty(async_queue, caplog):
+    depth, wait, workers = queuing.QueueMetricsCollector().collect()
+    assert [s.value for s in depth.samples] == [0, 0]
+    assert [s.value for s in wait.samples] == [0, 0]
+    assert [s.value for s in workers.samples] == [0, 0]
+    assert "no worker" not in caplog.text
+
+
+def test_queue_metrics_collector_workers(async_queue, system_id, caplog):
+    qm = queuing.QueueManager()
+    qm.enqueue_jobs([(system_id, "a")], "user")
+    SimpleWorker([qm.q], connection=qm.redis_conn).register_birth()
+    SimpleWorker(qm.queues, connection=qm.redis_conn).register_birth()
+    SimpleWorker(qm.bulk_queues[:1], connection=qm.redis_conn).register_birth()
+    depth, wait, workers = queuing.QueueMetricsCollector().collect()
+    assert {s.labels["priority"]: s.value for s in workers.samples} == {
+        "interactive": 2,
+        "bulk": 2,
+    }
+    assert "no worker" not in caplog.text
+    assert qm.worker_counts() == {
+        queuing.JobPriority.interactive: 2,
+        queuing.JobPriority.bulk: 2,
+    }
+
+
+def test_qmanager_check_bulk_workers(async_queue, system_id, caplog):
+    qm = queuing.QueueManager()
+    assert qm.check_bulk_workers()
+    qm.enqueue_job(system_id, "a", "user")
+    SimpleWorker([qm.q], connection=qm.redis_conn).register_birth()
+    assert qm.check_bulk_workers()
+    qm.enqueue_jobs([(system_id, "b")], "user")
+    assert not qm.check_bulk_workers()
+    assert "1 bulk jobs are queued but no worker" in caplog.text
+    SimpleWorker(qm.bulk_queues[-1:], connection=qm.redis_conn).register_birth()
+    assert qm.check_bulk_workers()
+
+
+def test_queue_metrics_collector_redis_error(mocker):
+    mocker.patch.object(
+        queuing.QueueMetricsCollector,
+        "read",
+        side_effect=queuing.RedisError("down"),
+    )
+    assert list(queuing.QueueMetricsCollector().collect()) == []
+
+
+def test_qmanager_enqueue_jobs_none(qm):
+    assert qm.enqueue_jobs([], "user") == []
+
+
 def test_qmanager_job_is_running(qm, system_id, dataset_name):
     assert not qm.job_is_running(system_id, dataset_name)
     qm.enqueue_job(system_id, dataset_name, "user")
     assert qm.job_is_running(system_id, dataset_name)
 
 
+def test_qmanager_job_is_running_datasets(async_queue, system_id):
+    qm = queuing.QueueManager()
+    (job,) = qm.enqueue_jobs([(system_id, "a"), (system_id, "b")], "user")
+    assert not qm.job_is_running(system_id, "b")
+    async_queue.started_job_registry.add(job, -1)
+    assert qm.job_is_running(system_id, "a")
+    assert qm.job_is_running(system_id, "b")
+    assert not qm.job_is_running(system_id, "c")
+
+
+def test_qmanager_expand_key(qm, system_id):
+    assert qm.expand_key(qm.generate_datasets_key(system_id, ["a", "b"])) == [
+        f"{system_id}:a",
+        f"{system_id}:b",
+    ]
+    assert qm.expand_key(f"{system_id}:a") == [f"{system_id}:a"]
+
+
+def test_qmanager_delete_jobs(async_queue, system_id, mocker):
+    qm = queuing.QueueManager()
+    jobs = [qm._create_job(system_id, str(i), "user") for i in range(3)]
+    for job in jobs:
+        async_queue.enqueue_job(job)
+    jobs[1].worker_name = "worker"
+    jobs[1].save()
+    async_queue.started_job_registry.add(jobs[1], -1)
+    send = mocker.patch("esprr_api.queuing.send_command")
+    pipeline = mocker.spy(qm.redis_conn, "pipeline")
+    qm.delete_jobs([jobs[0].id, jobs[1].id, "missing"])
+    # one to fetch the jobs and one to remove them
+    assert pipeline.call_count == 2
+    assert send.call_count == 1
+    assert send.call_args[0][1:] == ("worker", "stop-job")
+    assert async_queue.job_ids == [jobs[2].id]
+    assert async_queue.started_job_registry.get_job_ids() == []
+    qm.delete_jobs([])
+    assert pipeline.call_count == 2
+    assert not Job.exists(jobs[0].id, connection=qm.redis_conn)
+    assert not Job.exists(jobs[1].id, connection=qm.redis_conn)
+    assert Job.exists(jobs[2].id, connection=qm.redis_conn)
+
+
 def test_qmanager_delete_job(qm, system_id, dataset_name):
     key = qm.generate_key(system_id, dataset_name)
     qm.enqueue_job(system_id, dataset_name, "user")
@@ -80,9 +337,9 @@ def test_qmanager_remove_invalid_jobs(system_id):
     for j in current_stat:
         qm.enqueue_job(j.system_id, j.dataset, j.user)
     qm.enqueue_job(system_id, "other", "other")
-    assert len(qm.q.job_ids) == 9
+    assert len(qm.queued_job_ids()) == 9
     qm.remove_invalid_jobs(current_stat)
-    assert qm.q.job_ids == [f"{system_id}:{i}" for i in range(5)]
+    assert qm.queued_job_ids() == [f"{system_id}:{i}" for i in range(5)]
 
 
 def test_qmanager_add_missing_jobs(system_id):
@@ -106,10 +363,10 @@ def test_qmanager_add_missing_jobs(system_id):
         for i in range(7)
     ]
     qm.enqueue_job(system_id, "0", "user")
-    assert set(qm.q.job_ids) == {f"{system_id}:0"}
+    assert set(qm.queued_job_ids()) == {f"{system_id}:0"}
     qm.add_missing_jobs(current_stat)
-    assert len(qm.q.job_ids) == 5
-    assert {j.split(":")[1] for j in qm.q.job_ids} == {"0", "1", "2", "5", "6"}
+    # the missing datasets of the system are modeled by one job
+    assert qm.queued_job_ids() == [f"{system_id}:0", f"{system_id}:1+2+5+6"]
 
 
 def fail(err, msg):
@@ -155,6 +412,65 @@ def test_qmanager_evaluate_failed_jobs(system_id):
     assert "error" in out[0][2]
 
 
+def _datasets_status(system_id, statuses, hash_changed=()):
+    return [
+        models.ManagementSystemDataStatus(
+            system_id=system_id,
+            dataset=str(i),
+            version="v0.1",
+            status=status,
+            hash_changed=i in hash_changed,
+            user="user",
+        )
+        for i, status in enumerate(statuses)
+    ]
+
+
+def test_qmanager_remove_invalid_jobs_datasets(system_id):
+    qm = queuing.QueueManager()
+    qm.enqueue_jobs([(system_id, "0"), (system_id, "1")], "user")
+    qm.enqueue_jobs([(system_id, "2"), (system_id, "3")], "user")
+    qm.enqueue_jobs([(system_id, "4"), (system_id, "5")], "user")
+    current_stat = _datasets_status(
+        system_id, ["complete", "queued", "complete", "complete", "complete"]
+    )
+    qm.remove_invalid_jobs(current_stat)
+    # 5 was deleted from the db and 4 is complete
+    assert qm.queued_job_ids() == [f"{system_id}:0+1"]
+
+
+def test_qmanager_add_missing_jobs_datasets(system_id):
+    qm = queuing.QueueManager()
+    qm.enqueue_jobs([(system_id, "0"), (system_id, "1")], "user")
+    current_stat = _datasets_status(system_id, ["queued", "queued", "queued"])
+    qm.add_missing_jobs(current_stat)
+    assert qm.queued_job_ids() == [f"{system_id}:0+1", f"{system_id}:2"]
+
+
+def test_qmanager_evaluate_failed_jobs_datasets(system_id):
+    qm = queuing.QueueManager()
+    qm.q.enqueue(fail, ValueError, "timeout", job_id=f"{system_id}:0+1+2+3")
+    w = SimpleWorker([qm.q], connection=qm.redis_conn)
+    w.work(burst=True)
+    current_stat = _datasets_status(
+        system_id, ["complete", "complete", "queued"], hash_changed=(1,)
+    )
+    out = qm.evaluate_failed_jobs(current_stat)
+    # 0 was modeled before the job failed and 3 is not in the db
+    assert [o[1] for o in out] == ["1", "2"]
+    assert len(qm.q.failed_job_registry) == 0
+
+
+def _mock_cmi(mocker, current_stat):
+    cmi = mocker.MagicMock()
+    startt = cmi.start_transaction.return_value.__enter__.return_value
+    startt.list_system_data_status_since.return_value = current_stat
+    startt.list_system_data_status_of.side_effect = lambda items: [
+        m for m in current_stat if (m.system_id, m.dataset) in set(items)
+    ]
+    return cmi
+
+
 def test_sync_jobs(system_id, mocker):
     qm = queuing.QueueManager()
     qm.job_func = run
@@ -182,18 +498,98 @@ def test_sync_jobs(system_id, mocker):
     assert len(qm.q.failed_job_registry) == 2
 
     qm.enqueue_job(system_id, "5", "user")
-    assert qm.q.job_ids == [f"{system_id}:5"]
+    assert qm.queued_job_ids() == [f"{system_id}:5"]
 
     mocker.patch("esprr_api.queuing.time.sleep", side_effect=KeyboardInterrupt)
 
-    jmi = mocker.MagicMock()
+    jmi = _mock_cmi(mocker, current_stat)
     startt = jmi.start_transaction.return_value.__enter__.return_value
-    startt.list_system_data_status.return_value = current_stat
     mocker.patch(
         "esprr_api.queuing._get_compute_management_interface",
         return_value=jmi,
     )
     queuing.sync_jobs()
+    startt.list_system_data_status_since.assert_called_once_with(None)
     assert startt.report_failure.call_count == 1
-    assert set(qm.q.job_ids) == {f"{system_id}:2", f"{system_id}:5", f"{system_id}:6"}
+    assert set(qm.queued_job_ids()) == {f"{system_id}:5", f"{system_id}:2+6"}
     assert len(qm.q.failed_job_registry.get_job_ids()) == 0
+
+
+def test_sync_jobs_full_pass(mocker):
+    mocker.patch.object(queuing.settings, "sync_jobs_full_pass_every", 3)
+    since = dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc)
+    sync_pass = mocker.patch("esprr_api.queuing.sync_jobs_pass", return_value=since)
+    mocker.patch(
+        "esprr_api.queuing.time.sleep", side_effect=[None] * 6 + [KeyboardInterrupt]
+    )
+    mocker.patch("esprr_api.queuing._get_compute_management_interface")
+    queuing.sync_jobs()
+    # every third pass lists all of the system data again
+    assert [c.args[2] for c in sync_pass.call_args_list] == [
+        None,
+        since,
+        since,
+        None,
+        since,
+        since,
+        None,
+    ]
+
+
+def test_sync_jobs_sweep_result_store(mocker, tmp_path):
+    store = result_store.FileResultStore(tmp_path)
+    digest = store.put(b"data")
+    os.utime(store.local_path(digest), (0, 0))
+    mocker.patch("esprr_api.queuing.get_result_store", return_value=store)
+    mocker.patch("esprr_api.queuing.sync_jobs_pass")
+    mocker.patch("esprr_api.queuing.time.sleep", side_effect=KeyboardInterrupt)
+    cmi = mocker.MagicMock()
+    cmi.list_result_references.return_value = set()
+    mocker.patch(
+        "esprr_api.queuing._get_compute_management_interface", return_value=cmi
+    )
+    queuing.sync_jobs()
+    assert store.local_path(digest) is None
+
+
+def test_sync_jobs_pass(mocker):
+    qm = queuing.QueueManager()
+    qm.job_func = run
+    modified_at = dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc)
+    system_ids = sorted(uuid.uuid1() for _ in range(3))
+    current_stat = [
+        models.ManagementSystemDataStatus(
+            system_id=system_ids[i],
+            dataset=str(i),
+            version="v0.1",
+            status="queued",
+            hash_changed=False,
+            user="user",
+            modified_at=modified_at + dt.timedelta(seconds=i),
+        )
+        for i in range(3)
+    ]
+    cmi = _mock_cmi(mocker, current_stat)
+    startt = cmi.start_transaction.return_value.__enter__.return_value
+    since = queuing.sync_jobs_pass(cmi, qm)
+    assert since == modified_at + dt.timedelta(seconds=2)
+    assert len(qm.queued_job_ids()) == 3
+
+    # only the system data modified since the last pass is listed, and the
+    # jobs of system data that was deleted are removed
+    startt.list_system_data_status_since.return_value = []
+    del current_stat[1]
+    assert queuing.sync_jobs_pass(cmi, qm, since) == since
+    startt.list_system_data_status_since.assert_called_with(
+        since - queuing.SYNC_JOBS_OVERLAP
+    )
+    startt.list_system_data_status_of.assert_called_with(
+        [(system_ids[i], str(i)) for i in range(3)]
+    )
+    assert qm.queued_job_ids() == [f"{system_ids[0]}:0", f"{system_ids[2]}:2"]
+
+
+def test_job_pairs(system_id):
+    assert queuing._job_pairs([f"{system_id}:a", "abnormal", "nothere:b"]) == [
+        (uuid.UUID(system_id), "a")
+    ]
@@ -0,0 +1,167 @@
+import datetime as dt
+import hashlib
+from io import BytesIO
+import os
+
+
+import pytest
+
+
+from esprr_api import result_store, settings
+
+
+@pytest.fixture()
+def file_store(tmp_path):
+    return result_store.FileResultStore(tmp_path / "results")
+
+
+def test_file_result_store(file_store):
+    digest = file_store.put(b"data")
+    assert digest == hashlib.sha256(b"data").hexdigest()
+    assert file_store.get(digest) == b"data"
+    path = file_store.local_path(digest)
+    assert path.read_bytes() == b"data"
+    assert path.parent.name == digest[:2]
+    # storing the same data again is a no-op
+    assert file_store.put(b"data") == digest
+    assert [p.name for p in path.parent.iterdir()] == [path.name]
+
+
+def test_file_result_store_digests(file_store):
+    digest = file_store.put(b"data")
+    other = file_store.put(b"other")
+    (file_store.path / digest[:2] / ".tmp-partial").write_bytes(b"da")
+    os.utime(file_store.local_path(other), (0, 0))
+    now = dt.datetime.now(dt.timezone.utc) + dt.timedelta(seconds=1)
+    assert set(file_store.digests(now)) == {digest, other}
+    assert list(file_store.digests(now - dt.timedelta(hours=1))) == [other]
+    # storing the data again marks it as recently stored
+    file_store.put(b"other")
+    assert list(file_store.digests(now - dt.timedelta(hours=1))) == []
+    file_store.delete(other)
+    assert file_store.local_path(other) is None
+    file_store.delete(other)
+
+
+def test_result_store_abstract():
+    with pytest.raises(TypeError):
+        result_store.ResultStore()
+
+
+def test_file_result_store_missing(file_store):
+    with pytest.raises(KeyError):
+        file_store.get("ab" * 32)
+    assert file_store.local_path("ab" * 32) is None
+
+
+def test_result_store_reference(file_store):
+    ref = file_store.store(b"data")
+    assert result_store.is_reference(ref)
+    assert result_store.reference_digest(ref) == hashlib.sha256(b"data").hexdigest()
+    assert len(ref) < 100
+    assert file_store.load(ref) == b"data"
+    assert file_store.store(None) is None
+
+
+def test_result_store_load_not_reference(file_store):
+    assert not result_store.is_reference(b"ARROW1")
+    assert file_store.load(b"ARROW1") == b"ARROW1"
+
+
+class FakeS3Client:
+    class exceptions:
+        class NoSuchKey(Exception):
+            pass
+
+    def __init__(self):
+        self.objects = {}
+
+    def put_object(self, Bucket, Key, Body):
+        self.objects[(Bucket, Key)] = Body
+
+    def get_object(self, Bucket, Key):
+        try:
+            return {"Body": BytesIO(self.objects[(Bucket, Key)])}
+        except KeyError:
+            raise self.exceptions.NoSuchKey(Key)
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def list_objects_v2(self, Bucket, ContinuationToken=0):
+        # one object per page to exercise the continuation
+        keys = sorted(k for b, k in self.objects if b == Bucket)
+        out = {
+            "Contents": [
+                {
+                    "Key": k,
+                    "LastModified": dt.datetime(2020, 1, 1, tzinfo=dt.timezone.utc),
+                }
+                for k in keys[ContinuationToken : ContinuationToken + 1]
+            ],
+            "IsTruncated": ContinuationToken + 1 < len(keys),
+        }
+        if out["IsTruncated"]:
+            out["NextContinuationToken"] = ContinuationToken + 1
+        return out
+
+
+def test_s3_result_store():
+    client = FakeS3Client()
+    store = result_store.S3ResultStore("results", client=client)
+    ref = store.store(b"data")
+    digest = result_store.reference_digest(ref)
+    assert client.objects == {("results", digest): b"data"}
+    assert store.load(ref) == b"data"
+    assert store.local_path(digest) is None
+    with pytest.raises(KeyError):
+        store.get("ab" * 32)
+
+
+def test_s3_result_store_digests():
+    client = FakeS3Client()
+    store = result_store.S3ResultStore("results", client=client)
+    digests = {store.put(b"data"), store.put(b"other")}
+    client.put_object(Bucket="other", Key="ab" * 32, Body=b"")
+    assert set(store.digests(dt.datetime(2021, 1, 1, tzinfo=dt.timezone.utc))) == (
+        digests
+    )
+    assert list(store.digests(dt.datetime(2019, 1, 1, tzinfo=dt.timezone.utc))) == []
+    for digest in digests:
+        store.delete(digest)
+    assert client.objects == {("other", "ab" * 32): b""}
+
+
+def test_sweep_result_store(file_store):
+    kept = file_store.put(b"kept")
+    unreferenced = file_store.put(b"unreferenced")
+    recent = file_store.put(b"recent")
+    for digest in (kept, unreferenced):
+        os.utime(file_store.local_path(digest), (0, 0))
+    assert (
+        result_store.sweep_result_store(
+            file_store, lambda: {kept}, dt.timedelta(hours=1)
+        )
+        == 1
+    )
+    assert file_store.get(kept) == b"kept"
+    assert file_store.get(recent) == b"recent"
+    with pytest.raises(KeyError):
+        file_store.get(unreferenced)
+
+
+@pytest.fixture()
+def clear_result_store():
+    result_store.get_result_store.cache_clear()
+    yield
+    result_store.get_result_store.cache_clear()
+
+
+def test_get_result_store(clear_result_store, monkeypatch, tmp_path):
+    assert result_store.get_result_store() is None
+    result_store.get_result_store.cache_clear()
+    monkeypatch.setattr(settings, "result_store_path", tmp_path)
+    store = result_store.get_result_store()
+    assert isinstance(store, result_store.FileResultStore)
+    assert store.path == tmp_path
+    assert result_store.get_result_store() is store
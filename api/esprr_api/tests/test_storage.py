@@ -10,7 +10,7 @@ import pymysql
 import pytest
 
 
-from esprr_api import storage, models, __version__
+from esprr_api import storage, models, result_store, settings, __version__
 
 
 pytestmark = pytest.mark.usefixtures("add_example_db_data")
@@ -384,6 +384,72 @@ def test_create_system_model_data_wrong_owner(
     assert err.value.status_code == 404
 
 
+def test_create_system_model_data_many(
+    storage_interface, system_id, system_def, dataset_name
+):
+    with storage_interface.start_transaction() as st:
+        other = st.create_system(system_def).object_id
+        st.create_system_model_data_many(
+            [(system_id, dataset_name), (other, dataset_name), (other, "NSRDB_2018")]
+        )
+        assert st.get_system_model_meta(system_id, dataset_name).status == "queued"
+        assert st.get_system_model_meta(other, dataset_name).status == "queued"
+        assert st.get_system_model_meta(other, "NSRDB_2018").status == "queued"
+
+
+def test_create_system_model_data_many_empty(storage_interface):
+    with storage_interface.start_transaction() as st:
+        st.create_system_model_data_many([])
+
+
+def test_create_system_model_data_many_wrong_owner(
+    storage_interface, system_id, other_system_id, dataset_name
+):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.create_system_model_data_many(
+                [(system_id, dataset_name), (other_system_id, dataset_name)]
+            )
+    assert err.value.status_code == 404
+
+
+def test_queue_system_model_data_many(
+    storage_interface, system_id, system_def, dataset_name
+):
+    with storage_interface.start_transaction() as st:
+        st.update_system_model_data(
+            system_id,
+            dataset_name,
+            "a" * 32,
+            b"new timeseries",
+            b"new stats",
+            system_definition=system_def,
+        )
+        st.queue_system_model_data_many([(system_id, dataset_name)])
+        assert st.get_system_model_meta(system_id, dataset_name).status == "queued"
+        # the queued job can still rescale the stored results
+        assert st.get_system_model_definition(system_id, dataset_name) == system_def
+        assert st.get_system_model_timeseries(system_id, dataset_name) == (
+            b"new timeseries"
+        )
+
+
+def test_queue_system_model_data_many_empty(storage_interface):
+    with storage_interface.start_transaction() as st:
+        st.queue_system_model_data_many([])
+
+
+def test_queue_system_model_data_many_wrong_owner(
+    storage_interface, system_id, other_system_id, dataset_name
+):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.queue_system_model_data_many(
+                [(system_id, dataset_name), (other_system_id, dataset_name)]
+            )
+    assert err.value.status_code == 404
+
+
 def test_get_system_model_meta(storage_interface, system_id, dataset_name):
     with storage_interface.start_transaction() as st:
         out = st.get_system_model_meta(system_id, dataset_name)
@@ -423,6 +489,25 @@ def test_get_system_model_meta_dne(storage_interface, dataset_name):
     assert err.value.status_code == 404
 
 
+def test_get_system_model_result_tag(storage_interface, system_id, dataset_name):
+    with storage_interface.start_transaction() as st:
+        tag = st.get_system_model_result_tag(system_id, dataset_name)
+        assert tag == st.get_system_model_result_tag(system_id, dataset_name)
+        st.update_system_model_data(
+            system_id, dataset_name, "f" * 32, b"new timeseries", b"new stats"
+        )
+        assert tag != st.get_system_model_result_tag(system_id, dataset_name)
+
+
+def test_get_system_model_result_tag_wrong_owner(
+    storage_interface, other_system_id, dataset_name
+):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.get_system_model_result_tag(other_system_id, dataset_name)
+    assert err.value.status_code == 404
+
+
 def test_update_system_model_data(
     storage_interface,
     dataset_name,
@@ -486,6 +571,82 @@ def test_update_system_model_data_error(
     assert after.version == __version__
 
 
+def test_get_system_model_definition(
+    storage_interface, dataset_name, system_id, system_def
+):
+    with storage_interface.start_transaction() as st:
+        # example data was computed without storing the definition
+        assert st.get_system_model_definition(system_id, dataset_name) is None
+        st.update_system_model_data(
+            system_id,
+            dataset_name,
+            "a" * 32,
+            b"new timeseries",
+            b"new stats",
+            system_definition=system_def,
+        )
+        out = st.get_system_model_definition(system_id, dataset_name)
+    assert out == system_def
+
+
+def test_get_system_model_definition_error(
+    storage_interface, dataset_name, system_id, system_def
+):
+    with storage_interface.start_transaction() as st:
+        st.update_system_model_data(
+            system_id,
+            dataset_name,
+            "a" * 32,
+            None,
+            None,
+            [{"message": "failed"}],
+            system_definition=system_def,
+        )
+        assert st.get_system_model_definition(system_id, dataset_name) is None
+
+
+def test_get_system_model_definition_wrong_owner(
+    storage_interface, dataset_name, other_system_id
+):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.get_system_model_definition(other_system_id, dataset_name)
+    assert err.value.status_code == 404
+
+
+def test_get_system_model_definition_pairs(
+    storage_interface, dataset_name, system_id, system_def
+):
+    with storage_interface.start_transaction() as st:
+        current = st.get_system(system_id).definition
+        out = st.get_system_model_definition_pairs(
+            [(system_id, dataset_name), (system_id, "NSRDB_2018")]
+        )
+        assert sorted(out, key=lambda x: x[1]) == [
+            (uuid.UUID(system_id), "NSRDB_2018", current, None),
+            (uuid.UUID(system_id), dataset_name, current, None),
+        ]
+        st.update_system_model_data(
+            system_id,
+            dataset_name,
+            "a" * 32,
+            b"new timeseries",
+            b"new stats",
+            system_definition=system_def,
+        )
+        out = st.get_system_model_definition_pairs([(system_id, dataset_name)])
+    assert out == [(uuid.UUID(system_id), dataset_name, current, system_def)]
+
+
+def test_get_system_model_definition_pairs_wrong_owner(
+    storage_interface, dataset_name, other_system_id
+):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.get_system_model_definition_pairs([(other_system_id, dataset_name)])
+    assert err.value.status_code == 404
+
+
 def test_update_system_model_data_bad_types(storage_interface, system_id):
     with pytest.raises(HTTPException) as err:
         with storage_interface.start_transaction() as st:
@@ -651,6 +812,77 @@ def test_list_system_data_status(
     root_conn.commit()
 
 
+def test_list_system_data_status_since(
+    compute_management_interface, system_id, dataset_name, root_conn
+):
+    out = compute_management_interface.list_system_data_status_since()
+    assert (system_id, dataset_name) in {(str(m.system_id), m.dataset) for m in out}
+    last = max(m.modified_at for m in out)
+    assert last.tzinfo is not None
+    assert (
+        compute_management_interface.list_system_data_status_since(
+            last + dt.timedelta(seconds=1)
+        )
+        == []
+    )
+
+    curs = root_conn.cursor()
+    curs.execute(
+        "update system_data set error = json_array('new') where "
+        "system_id = uuid_to_bin(%s, 1)",
+        system_id,
+    )
+    root_conn.commit()
+    out = compute_management_interface.list_system_data_status_since(last)
+    changed = {(str(m.system_id), m.dataset): m for m in out}
+    assert changed[(system_id, dataset_name)].status == "error"
+    curs.execute(
+        "update system_data set error = json_array() where "
+        "system_id = uuid_to_bin(%s, 1)",
+        system_id,
+    )
+    root_conn.commit()
+
+
+def test_list_system_data_status_of(
+    compute_management_interface, system_id, dataset_name, other_system_id
+):
+    out = compute_management_interface.list_system_data_status_of(
+        [(system_id, dataset_name), (system_id, "missing"), (other_system_id, "a")]
+    )
+    assert len(out) == 1
+    assert str(out[0].system_id) == system_id
+    assert out[0].dataset == dataset_name
+    assert out[0].status == "complete"
+    assert compute_management_interface.list_system_data_status_of([]) == []
+
+
+def test_list_result_references(
+    compute_management_interface, root_conn, system_id, dataset_name
+):
+    assert compute_management_interface.list_result_references() == set()
+    curs = root_conn.cursor()
+    curs.execute(
+        "select statistics from system_data where system_id = uuid_to_bin(%s, 1)"
+        " and dataset = %s",
+        (system_id, dataset_name),
+    )
+    stats = curs.fetchone()[0]
+    curs.execute(
+        "update system_data set statistics = %s where system_id = "
+        "uuid_to_bin(%s, 1) and dataset = %s",
+        (result_store.REFERENCE_PREFIX + b"ab" * 32, system_id, dataset_name),
+    )
+    root_conn.commit()
+    assert compute_management_interface.list_result_references() == {"ab" * 32}
+    curs.execute(
+        "update system_data set statistics = %s where system_id = "
+        "uuid_to_bin(%s, 1) and dataset = %s",
+        (stats, system_id, dataset_name),
+    )
+    root_conn.commit()
+
+
 def test_report_failure(
     compute_management_interface, root_conn, system_id, dataset_name
 ):
@@ -669,3 +901,166 @@ def test_report_failure(
         (system_id, dataset_name),
     )
     root_conn.commit()
+
+
+def test_group_model_data(storage_interface, group_id, dataset_name):
+    with storage_interface.start_transaction() as st:
+        data_key, data = st.get_group_model_data(group_id, dataset_name, "timeseries")
+        assert data is None
+        st.update_group_model_data(
+            group_id, dataset_name, "timeseries", data_key, b"group timeseries"
+        )
+        assert st.get_group_model_data(group_id, dataset_name, "timeseries") == (
+            data_key,
+            b"group timeseries",
+        )
+        assert st.get_group_model_data(group_id, dataset_name, "statistics") == (
+            data_key,
+            None,
+        )
+
+
+def test_group_model_data_key_changes(
+    storage_interface, group_id, system_id, dataset_name
+):
+    with storage_interface.start_transaction() as st:
+        data_key, _ = st.get_group_model_data(group_id, dataset_name, "statistics")
+        st.update_group_model_data(
+            group_id, dataset_name, "statistics", data_key, b"group stats"
+        )
+        st.remove_system_from_group(system_id, group_id)
+        new_key, data = st.get_group_model_data(group_id, dataset_name, "statistics")
+    assert new_key != data_key
+    assert data is None
+
+
+def test_get_group_model_data_key(storage_interface, group_id, system_id, dataset_name):
+    with storage_interface.start_transaction() as st:
+        data_key, _ = st.get_group_model_data(group_id, dataset_name, "timeseries")
+        assert st.get_group_model_data_key(group_id, dataset_name) == data_key
+        st.remove_system_from_group(system_id, group_id)
+        assert st.get_group_model_data_key(group_id, dataset_name) != data_key
+
+
+def test_get_group_model_data_key_wrong_owner(storage_interface, dataset_name):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.get_group_model_data_key(uuid.uuid1(), dataset_name)
+    assert err.value.status_code == 404
+
+
+def test_group_model_data_wrong_owner(storage_interface, dataset_name):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.get_group_model_data(uuid.uuid1(), dataset_name, "timeseries")
+    assert err.value.status_code == 404
+
+
+def test_get_group_model_timeseries(
+    storage_interface, group_id, system_id, dataset_name, timeseries_bytes
+):
+    with storage_interface.start_transaction() as st:
+        out = st.get_group_model_timeseries(group_id, dataset_name)
+    assert out == {uuid.UUID(system_id): timeseries_bytes}
+
+
+def test_get_group_model_timeseries_of_systems(
+    storage_interface, group_id, system_id, dataset_name, timeseries_bytes
+):
+    with storage_interface.start_transaction() as st:
+        assert st.get_group_model_timeseries(
+            group_id, dataset_name, [uuid.UUID(system_id), uuid.uuid1()]
+        ) == {uuid.UUID(system_id): timeseries_bytes}
+        assert st.get_group_model_timeseries(group_id, dataset_name, []) == {}
+
+
+def test_get_group_model_timeseries_missing(
+    storage_interface, group_id, system_id, dataset_name
+):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.update_system_model_data(system_id, dataset_name, None, None, None)
+            st.get_group_model_timeseries(group_id, dataset_name)
+    assert err.value.status_code == 404
+
+
+def test_get_group_model_timeseries_wrong_owner(storage_interface, dataset_name):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.get_group_model_timeseries(uuid.uuid1(), dataset_name)
+    assert err.value.status_code == 404
+
+
+def test_get_group_model_meta(storage_interface, group_id, system_id, dataset_name):
+    with storage_interface.start_transaction() as st:
+        out = st.get_group_model_meta(group_id, dataset_name)
+        expected = st.get_system_model_meta(system_id, dataset_name)
+    assert out == {uuid.UUID(system_id): expected}
+
+
+def test_get_group_model_meta_no_data(storage_interface, group_id):
+    with storage_interface.start_transaction() as st:
+        assert st.get_group_model_meta(group_id, "no data") == {}
+
+
+@pytest.fixture()
+def file_result_store(monkeypatch, tmp_path):
+    result_store.get_result_store.cache_clear()
+    monkeypatch.setattr(settings, "result_store_path", tmp_path / "results")
+    yield result_store.get_result_store()
+    result_store.get_result_store.cache_clear()
+
+
+def test_update_system_model_data_result_store(
+    storage_interface, dataset_name, system_id, file_result_store
+):
+    with storage_interface.start_transaction() as st:
+        st.update_system_model_data(
+            system_id, dataset_name, "a" * 32, b"new timeseries", b"new stats"
+        )
+        raw = st._call_procedure_for_single(
+            "get_system_timeseries", system_id, dataset_name
+        )
+        assert result_store.is_reference(raw["timeseries"])
+        assert (
+            st.get_system_model_timeseries(system_id, dataset_name) == b"new timeseries"
+        )
+        assert st.get_system_model_statistics(system_id, dataset_name) == b"new stats"
+        path = st.get_system_model_result(system_id, dataset_name, "timeseries")
+    assert path.read_bytes() == b"new timeseries"
+
+
+def test_get_system_model_result_in_mysql(
+    storage_interface, dataset_name, system_id, timeseries_bytes, file_result_store
+):
+    # stored before the result store was configured
+    with storage_interface.start_transaction() as st:
+        out = st.get_system_model_result(system_id, dataset_name, "timeseries")
+    assert out == timeseries_bytes
+
+
+def test_get_system_model_result_missing(
+    storage_interface, dataset_name, system_id, file_result_store
+):
+    with pytest.raises(HTTPException) as err:
+        with storage_interface.start_transaction() as st:
+            st.update_system_model_data(
+                system_id, dataset_name, "a" * 32, b"new timeseries", b"new stats"
+            )
+            path = st.get_system_model_result(system_id, dataset_name, "timeseries")
+            path.unlink()
+            st.get_system_model_timeseries(system_id, dataset_name)
+    assert err.value.status_code == 500
+
+
+def test_update_group_model_data_result_store(
+    storage_interface, group_id, dataset_name, file_result_store
+):
+    with storage_interface.start_transaction() as st:
+        key, _ = st.get_group_model_data(group_id, dataset_name, "timeseries")
+        st.update_group_model_data(group_id, dataset_name, "timeseries", key, b"agg")
+        assert st.get_group_model_data(group_id, dataset_name, "timeseries") == (
+            key,
+            b"agg",
+        )
+    assert len(list(file_result_store.path.glob("*/*"))) == 1
@@ -0,0 +1,97 @@
+import uuid
+
+
+import pyarrow as pa  # type: ignore
+import pytest
+
+
+from esprr_api import models, table_cache
+
+
+def _table(nrows):
+    return pa.table({"ac_power": pa.array([1.0] * nrows, type=pa.float32())})
+
+
+@pytest.fixture()
+def cache():
+    return table_cache.TableCache(100)
+
+
+def test_result_key():
+    system_id = uuid.uuid1()
+    assert table_cache.result_key(
+        system_id, models.DatasetEnum.nsrdb_2019, "timeseries", "tag"
+    ) == table_cache.result_key(str(system_id), "NSRDB_2019", "timeseries", "tag")
+
+
+def test_table_cache(cache):
+    table = _table(10)
+    assert cache.get(("a", "b", "c", "d")) is None
+    cache.put(("a", "b", "c", "d"), table)
+    assert cache.get(("a", "b", "c", "d")) is table
+    assert cache.hits == 1
+    assert cache.misses == 1
+    assert cache.hit_ratio == 0.5
+    assert cache.nbytes == table.nbytes
+    assert len(cache) == 1
+
+
+def test_table_cache_evict(cache):
+    # 40 bytes each
+    for i in range(2):
+        cache.put((str(i), "b", "c", "d"), _table(10))
+    # mark 0 as recently used so that 1 is evicted
+    assert cache.get(("0", "b", "c", "d")) is not None
+    cache.put(("2", "b", "c", "d"), _table(10))
+    assert cache.evictions == 1
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.get(("1", "b", "c", "d")) is None
+    assert cache.get(("0", "b", "c", "d")) is not None
+
+
+def test_table_cache_too_large(cache):
+    cache.put(("a", "b", "c", "d"), _table(100))
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_table_cache_replace(cache):
+    cache.put(("a", "b", "c", "d"), _table(10))
+    cache.put(("a", "b", "c", "d"), _table(5))
+    assert len(cache) == 1
+    assert cache.nbytes == _table(5).nbytes
+
+
+def test_table_cache_get_or_load(cache, mocker):
+    load = mocker.MagicMock(return_value=_table(10))
+    first = cache.get_or_load(("a", "b", "c", "d"), load)
+    second = cache.get_or_load(("a", "b", "c", "d"), load)
+    assert first is second
+    assert load.call_count == 1
+
+
+def test_table_cache_invalidate(cache):
+    system_id = uuid.uuid1()
+    cache.put(
+        table_cache.result_key(system_id, "NSRDB_2019", "timeseries", "tag"),
+        _table(5),
+    )
+    cache.put(
+        table_cache.result_key(system_id, "NSRDB_2019", "statistics", "tag"),
+        _table(5),
+    )
+    cache.put(("other", "b", "c", "d"), _table(5))
+    cache.invalidate(system_id)
+    assert len(cache) == 1
+    assert cache.nbytes == _table(5).nbytes
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+
+
+def test_table_cache_metrics(cache):
+    before = table_cache.TABLE_CACHE_HITS._value.get()
+    cache.put(("a", "b", "c", "d"), _table(10))
+    cache.get(("a", "b", "c", "d"))
+    assert table_cache.TABLE_CACHE_HITS._value.get() == before + 1
+    assert table_cache.TABLE_CACHE_ENTRIES._value.get() == 1
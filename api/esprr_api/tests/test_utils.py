@@ -228,3 +228,276 @@ def test_dump_arrow_bytes(df):
 def test__get_return_type(accepts):
     res, acc = utils._get_return_type(accepts)
     assert acc == accepts
+
+
+def test_read_arrow_table():
+    tbl = pa.Table.from_arrays([[1.0, 2, 3], [4.0, 5, 6]], ["a", "b"])
+    out = utils.read_arrow_table(BytesIO(utils.dump_arrow_bytes(tbl)))
+    assert out.equals(tbl)
+
+
+def test_read_arrow_table_invalid():
+    with pytest.raises(HTTPException) as err:
+        utils.read_arrow_table(BytesIO(b"notanarrowfile"))
+    assert err.value.status_code == 400
+
+
+@pytest.mark.parametrize("batch_rows", [1, 2, 3, 10])
+def test_stream_csv(batch_rows):
+    df = pd.DataFrame(
+        {
+            "time": pd.date_range("2019-01-01", freq="5min", periods=5, tz="UTC"),
+            "ac_power": pd.Series([10.2, None, 0, 1e-7, 8.2], dtype="float32"),
+            "name": ["a", "b,c", None, 'd"', "e"],
+        }
+    )
+    tbl = utils.convert_to_arrow(df)
+    out = list(utils.stream_csv(tbl, batch_rows=batch_rows))
+    assert len(out) == -(-5 // batch_rows)
+    expected = df.copy()
+    expected["time"] = expected["time"].dt.tz_convert("Etc/GMT+7")
+    assert "".join(out) == expected.to_csv(index=False)
+
+
+def test_stream_csv_empty():
+    tbl = pa.table(
+        [pa.array([], type=pa.timestamp("s", tz="UTC")), pa.array([], pa.float32())],
+        names=["time", "ac_power"],
+    )
+    assert list(utils.stream_csv(tbl)) == ["time,ac_power\n"]
+
+
+def test_stream_csv_no_time():
+    df = pd.DataFrame({"month": ["January"], "value": [10.0]})
+    out = "".join(utils.stream_csv(pa.Table.from_pandas(df)))
+    assert out == df.to_csv(index=False)
+
+
+@pytest.fixture()
+def month_table():
+    df = pd.DataFrame(
+        {
+            "time": pd.date_range(
+                "2019-01-30T07:00Z", "2019-03-01T06:55Z", freq="5min"
+            ),
+            "ac_power": 1.0,
+            "dc_power": 2.0,
+        }
+    )
+    df.loc[df.index % 2 == 1, "ac_power"] = 3.0
+    return utils.convert_to_arrow(df)
+
+
+def test_dump_arrow_bytes_month_batches(month_table):
+    out = utils.dump_arrow_bytes(month_table)
+    reader = pa.ipc.open_file(BytesIO(out))
+    # Jan 30 - 31, Feb, in Etc/GMT+7
+    assert reader.num_record_batches == 2
+    assert reader.get_batch(0).num_rows == 2 * 288
+    assert reader.read_all().equals(month_table)
+
+
+def test_dump_arrow_bytes_empty_time():
+    tbl = pa.table([pa.array([], pa.timestamp("s", tz="UTC"))], names=["time"])
+    out = utils.read_arrow_table(BytesIO(utils.dump_arrow_bytes(tbl)))
+    assert out.equals(tbl)
+
+
+def _local(time):
+    time = pd.Timestamp(time)
+    return time if time.tz is not None else time.tz_localize("Etc/GMT+7")
+
+
+@pytest.mark.parametrize(
+    "start,end,nrows",
+    [
+        (None, None, 30 * 288),
+        (dt.datetime(2019, 2, 1), None, 28 * 288),
+        (None, dt.datetime(2019, 2, 1, tzinfo=dt.timezone.utc), 288 + 17 * 12),
+        (
+            dt.datetime(2019, 2, 10, 12),
+            dt.datetime(2019, 2, 10, 13),
+            12,
+        ),
+        (dt.datetime(2019, 6, 1), None, 0),
+    ],
+)
+def test_read_arrow_selection(month_table, start, end, nrows):
+    data = BytesIO(utils.dump_arrow_bytes(month_table))
+    out = utils.read_arrow_selection(data, start, end)
+    assert out.num_rows == nrows
+    assert out.schema == month_table.schema
+    if nrows:
+        times = out.column("time").to_pandas()
+        if start is not None:
+            assert times.min() == _local(start)
+        if end is not None:
+            assert times.max() < _local(end)
+
+
+def test_read_arrow_selection_columns(month_table):
+    data = BytesIO(utils.dump_arrow_bytes(month_table))
+    out = utils.read_arrow_selection(data, columns=["dc_power"])
+    assert out.column_names == ["time", "dc_power"]
+    assert out.num_rows == month_table.num_rows
+
+
+def test_read_arrow_selection_unknown_column(month_table):
+    data = BytesIO(utils.dump_arrow_bytes(month_table))
+    with pytest.raises(HTTPException) as err:
+        utils.read_arrow_selection(data, columns=["dc_power", "other"])
+    assert err.value.status_code == 400
+    assert "other" in err.value.detail
+
+
+def test_read_arrow_selection_invalid():
+    with pytest.raises(HTTPException) as err:
+        utils.read_arrow_selection(BytesIO(b"notanarrowfile"))
+    assert err.value.status_code == 400
+
+
+def test_resample_arrow(month_table):
+    out = utils.resample_arrow(month_table, "1h")
+    assert out.schema == month_table.schema
+    assert out.num_rows == 30 * 24
+    df = out.to_pandas()
+    assert (df["ac_power"] == 2.0).all()
+    assert (df["dc_power"] == 2.0).all()
+    assert (df["time"].diff().dropna() == pd.Timedelta("1h")).all()
+
+
+def test_resample_arrow_day(month_table):
+    out = utils.resample_arrow(month_table, "1d").to_pandas()
+    assert len(out) == 30
+    assert out["time"].iloc[0] == pd.Timestamp("2019-01-30T00:00-07:00")
+
+
+def test_resample_arrow_invalid(month_table):
+    with pytest.raises(HTTPException) as err:
+        utils.resample_arrow(month_table, "1y")
+    assert err.value.status_code == 400
+
+
+def test_timeseries_selection(month_table):
+    selection = utils.TimeseriesSelection(None, None, None, None)
+    assert not selection.selected
+    selection = utils.TimeseriesSelection(
+        dt.datetime(2019, 2, 1), None, ["ac_power"], "1d"
+    )
+    assert selection.selected
+    out = selection.apply(utils.dump_arrow_bytes(month_table))
+    assert out.column_names == ["time", "ac_power"]
+    assert out.num_rows == 28
+
+
+@pytest.mark.parametrize("compression", ["zstd", "lz4", None])
+def test_dump_arrow_bytes_compression(month_table, compression):
+    out = utils.dump_arrow_bytes(month_table, compression)
+    assert utils.arrow_compression(out) == compression
+    assert utils.read_arrow_table(BytesIO(out)).equals(month_table)
+    if compression is not None:
+        assert len(out) < len(utils.dump_arrow_bytes(month_table, None))
+
+
+def test_arrow_compression_not_arrow():
+    assert utils.arrow_compression(b"notanarrowfile") is None
+
+
+@pytest.mark.parametrize(
+    "accept,exp",
+    [
+        (None, []),
+        ("*/*", []),
+        ("application/vnd.apache.arrow.file", []),
+        ('application/vnd.apache.arrow.file; codecs="zstd"', ["zstd"]),
+        ("application/vnd.apache.arrow.file;codecs=lz4", ["lz4"]),
+        (
+            'text/csv;q=0.5, application/vnd.apache.arrow.file; codecs="lz4, zstd"',
+            ["lz4", "zstd"],
+        ),
+        ('application/vnd.apache.arrow.file; codecs="snappy"', []),
+        ('text/csv; codecs="zstd"', []),
+    ],
+)
+def test_accepted_arrow_codecs(accept, exp):
+    assert utils.accepted_arrow_codecs(accept) == exp
+
+
+@pytest.mark.parametrize(
+    "stored,codecs,exp",
+    [
+        ("zstd", ["zstd"], "zstd"),
+        ("zstd", ["lz4", "zstd"], "zstd"),
+        ("zstd", ["lz4"], "lz4"),
+        ("zstd", [], None),
+        (None, [], None),
+        (None, ["zstd"], None),
+    ],
+)
+def test_arrow_bytes_for_codecs(month_table, stored, codecs, exp):
+    data = utils.dump_arrow_bytes(month_table, stored)
+    out = utils.arrow_bytes_for_codecs(data, codecs)
+    assert utils.arrow_compression(out) == exp
+    if stored == exp:
+        assert out is data
+    assert utils.read_arrow_table(BytesIO(out)).equals(month_table)
+
+
+def test_result_etag():
+    etag = utils.result_etag("tag", "timeseries", "text/csv", [])
+    assert etag.startswith('"') and etag.endswith('"')
+    assert etag == utils.result_etag("tag", "timeseries", "text/csv", [])
+    assert etag != utils.result_etag("other", "timeseries", "text/csv", [])
+    assert etag != utils.result_etag("tag", "statistics", "text/csv", [])
+    assert etag != utils.result_etag("tag", "timeseries", "text/csv", ["zstd"])
+
+
+@pytest.mark.parametrize(
+    "header,exp",
+    [
+        (None, False),
+        ("", False),
+        ('"abc"', True),
+        ('W/"abc"', True),
+        ('"def", "abc"', True),
+        ('"def",W/"abc"', True),
+        ("*", True),
+        ('"abcd"', False),
+        ("abc", False),
+    ],
+)
+def test_etag_matches(header, exp):
+    assert utils.etag_matches(header, '"abc"') is exp
+
+
+def test_timeseries_selection_cache_key():
+    assert (
+        utils.TimeseriesSelection(None, None, None, None).cache_key
+        != utils.TimeseriesSelection(None, None, None, "1h").cache_key
+    )
+
+
+@pytest.mark.parametrize(
+    "start,end,columns",
+    [
+        (None, None, None),
+        (dt.datetime(2019, 2, 15), None, None),
+        (None, dt.datetime(2019, 2, 10), ["ac_power"]),
+        (dt.datetime(2019, 1, 31, 23), dt.datetime(2019, 2, 1, 1), None),
+    ],
+)
+def test_select_arrow_table(month_table, start, end, columns):
+    data = utils.dump_arrow_bytes(month_table)
+    table = utils.read_arrow_table(BytesIO(data))
+    assert utils.select_arrow_table(table, start, end, columns).equals(
+        utils.read_arrow_selection(BytesIO(data), start, end, columns)
+    )
+
+
+def test_timeseries_selection_apply_table(month_table):
+    selection = utils.TimeseriesSelection(
+        dt.datetime(2019, 2, 15), None, ["ac_power"], "1d"
+    )
+    data = utils.dump_arrow_bytes(month_table)
+    table = utils.read_arrow_table(BytesIO(data))
+    assert selection.apply(table).equals(selection.apply(data))
@@ -0,0 +1,154 @@
+import datetime as dt
+import gc
+import os
+
+
+from prometheus_client import REGISTRY
+import pytest
+from rq import Queue, Worker
+
+
+from esprr_api import compute, settings, worker
+
+
+pytestmark = pytest.mark.usefixtures("mock_redis")
+
+
+@pytest.fixture()
+def preload_settings(nsrdb_data, tmp_path, mocker):
+    mocker.patch.dict(
+        settings.nsrdb_data_path,
+        {"NSRDB_2019": nsrdb_data, "NSRDB_2020": tmp_path / "missing.zarr"},
+        clear=True,
+    )
+    mocker.patch.dict(compute._preloaded_datasets, clear=True)
+
+
+def test_preload_datasets(preload_settings, dataset_name):
+    compute.preload_datasets()
+    assert list(compute._preloaded_datasets.keys()) == ["NSRDB_2019"]
+    ds = compute._preloaded_datasets["NSRDB_2019"]
+    ds.grid
+    ds.boundary
+    assert compute._get_dataset(dataset_name) is ds
+
+
+def test_preload_datasets_time_terms(preload_settings, system_def, mocker):
+    mocker.patch.object(
+        compute, "solar_position_cache", new=compute.SolarPositionCache(100)
+    )
+    compute.preload_datasets()
+    terms = mocker.spy(compute, "_solar_time_terms")
+    data = compute._preloaded_datasets["NSRDB_2019"].get_gridded_data(system_def)
+    compute.compute_gridded_system_power(system_def, data)
+    # computed before the worker forks rather than in each job
+    assert terms.call_count == 0
+
+
+def test_preload_datasets_share_grid(preload_settings, nsrdb_data):
+    settings.nsrdb_data_path["NSRDB_2020"] = nsrdb_data
+    compute.preload_datasets()
+    ds19 = compute._preloaded_datasets["NSRDB_2019"]
+    ds20 = compute._preloaded_datasets["NSRDB_2020"]
+    assert ds19 is not ds20
+    assert ds19.grid_points is ds20.grid_points
+
+
+def test_get_dataset_preload_changed_path(
+    preload_settings, dataset_name, tmp_path, mocker
+):
+    compute.preload_datasets()
+    ds = compute._preloaded_datasets["NSRDB_2019"]
+    settings.nsrdb_data_path["NSRDB_2019"] = tmp_path / "other.zarr"
+    mocker.patch.object(compute.NSRDBDataset, "load_grid")
+    out = compute._get_dataset(dataset_name)
+    assert out is not ds
+    assert out.data_path == tmp_path / "other.zarr"
+
+
+def test_preloaded_grid_worker(preload_settings, mock_redis):
+    w = worker.PreloadedGridWorker(
+        [Queue("jobs", connection=mock_redis)], connection=mock_redis
+    )
+    w.work(burst=True)
+    assert "NSRDB_2019" in compute._preloaded_datasets
+    gc.unfreeze()
+
+
+@pytest.mark.parametrize("multiproc", [True, False])
+def test_start_metrics_server(mocker, tmp_path, multiproc):
+    if multiproc:
+        mocker.patch.dict("os.environ", {"PROMETHEUS_MULTIPROC_DIR": str(tmp_path)})
+    else:
+        mocker.patch.dict("os.environ")
+        os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    start = mocker.patch.object(worker, "start_http_server")
+    worker.start_metrics_server(9000)
+    assert start.call_args[0] == (9000,)
+    assert (start.call_args[1]["registry"] is REGISTRY) is not multiproc
+
+
+def test_preloaded_grid_worker_metrics(preload_settings, mock_redis, mocker):
+    mocker.patch.object(settings, "worker_metrics_port", 9001)
+    start = mocker.patch.object(worker, "start_metrics_server")
+    w = worker.PreloadedGridWorker(
+        [Queue("jobs", connection=mock_redis)], connection=mock_redis
+    )
+    w.work(burst=True)
+    start.assert_called_once_with(9001)
+    gc.unfreeze()
+
+
+@pytest.mark.parametrize("queues", [["jobs"], ["jobs", "jobs-bulk"]])
+def test_preloaded_grid_worker_bulk_queues(mock_redis, mocker, queues):
+    mocker.patch.object(settings, "bulk_queue_count", 3)
+    w = worker.PreloadedGridWorker(
+        [Queue(queues[0], connection=mock_redis), *queues[1:]],
+        connection=mock_redis,
+    )
+    assert [q.name for q in w.queues] == [
+        "jobs",
+        "jobs-bulk-0",
+        "jobs-bulk-1",
+        "jobs-bulk-2",
+    ]
+    for name, job_ids in (
+        ("jobs-bulk-0", ["a", "b"]),
+        ("jobs-bulk-1", ["c"]),
+        ("jobs-bulk-2", ["d"]),
+        ("jobs", ["e"]),
+    ):
+        q = Queue(name, connection=mock_redis)
+        for job_id in job_ids:
+            q.enqueue(print, job_id=job_id)
+    order = []
+    result = w.dequeue_job_and_maintain_ttl(None)
+    while result is not None:
+        order.append(result[0].id)
+        result = w.dequeue_job_and_maintain_ttl(None)
+    # interactive jobs first, then the bulk queues in turn
+    assert order == ["e", "a", "c", "d", "b"]
+
+
+def test_preloaded_grid_worker_bulk_only(mock_redis, mocker):
+    mocker.patch.object(settings, "bulk_queue_count", 2)
+    w = worker.PreloadedGridWorker(["jobs-bulk"], connection=mock_redis)
+    assert [q.name for q in w.queues] == ["jobs-bulk-0", "jobs-bulk-1"]
+
+
+def test_preloaded_grid_worker_wait_time(mock_redis, mocker):
+    execute = mocker.patch.object(Worker, "execute_job")
+    w = worker.PreloadedGridWorker(["jobs"], connection=mock_redis)
+    q = Queue("jobs-bulk-0", connection=mock_redis)
+    job = q.enqueue(print)
+    job.enqueued_at = dt.datetime.utcnow() - dt.timedelta(seconds=30)
+
+    def sample(name):
+        return REGISTRY.get_sample_value(name, {"priority": "bulk"}) or 0
+
+    count = sample("esprr_job_wait_seconds_count")
+    total = sample("esprr_job_wait_seconds_sum")
+    w.execute_job(job, q)
+    execute.assert_called_once_with(job, q)
+    assert sample("esprr_job_wait_seconds_count") == count + 1
+    assert sample("esprr_job_wait_seconds_sum") - total >= 30
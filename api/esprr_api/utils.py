@@ -1,24 +1,37 @@
+import datetime as dt
+import hashlib
+from io import BytesIO
 import logging
-from typing import IO, Type, Union, Optional, Tuple
+from pathlib import Path
+import re
+from typing import Any, Dict, IO, Iterator, List, Type, Union, Optional, Tuple
 
 
 from accept_types import AcceptableType  # type: ignore
-from fastapi import HTTPException, Response
+from fastapi import HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+import numpy as np
 import pandas as pd
 import pandas.api.types as pdtypes  # type: ignore
 import pyarrow as pa  # type: ignore
+import pyarrow.compute as pc  # type: ignore
 
 
 logger = logging.getLogger(__name__)
 
 
-def read_arrow(content: IO) -> pd.DataFrame:
-    """Read a buffer in Apache Arrow File format into a DataFrame"""
+def read_arrow_table(content: IO) -> pa.Table:
+    """Read a buffer in Apache Arrow File format into an Arrow Table"""
     try:
         table = pa.ipc.open_file(content).read_all()
     except pa.lib.ArrowInvalid as err:
         raise HTTPException(status_code=400, detail=err.args[0])
-    df: pd.DataFrame = table.to_pandas(split_blocks=True)
+    return table
+
+
+def read_arrow(content: IO) -> pd.DataFrame:
+    """Read a buffer in Apache Arrow File format into a DataFrame"""
+    df: pd.DataFrame = read_arrow_table(content).to_pandas(split_blocks=True)
     return df
 
 
@@ -51,21 +64,331 @@ def convert_to_arrow(df: pd.DataFrame) -> pa.Table:
     return table
 
 
-def dump_arrow_bytes(table: pa.Table) -> bytes:
-    """Dump an Arrow table out to bytes in the Arrow File/Feather format"""
+def _has_time_column(schema: pa.Schema) -> bool:
+    index = schema.get_field_index("time")
+    return index != -1 and bool(pa.types.is_timestamp(schema.field(index).type))
+
+
+def _month_slices(table: pa.Table) -> List[Tuple[int, int]]:
+    """Offsets and lengths of the runs of rows of a table with a time column
+    that fall in the same month in Etc/GMT+7"""
+    time = table.column("time").cast(pa.timestamp("s", tz="Etc/GMT+7"), safe=False)
+    months = pc.add(pc.multiply(pc.year(time), 12), pc.month(time))
+    changes = np.flatnonzero(np.diff(months.to_numpy(zero_copy_only=False))) + 1
+    bounds = [0, *changes.tolist(), table.num_rows]
+    return [(start, end - start) for start, end in zip(bounds[:-1], bounds[1:])]
+
+
+# schema metadata key recording the compression of the record batches, files
+# stored before compression was added have no marker and are uncompressed
+ARROW_COMPRESSION_KEY = b"esprr_compression"
+ARROW_CODECS = ("zstd", "lz4")
+
+
+def dump_arrow_bytes(table: pa.Table, compression: Optional[str] = "zstd") -> bytes:
+    """Dump an Arrow table out to bytes in the Arrow File/Feather format.
+    Tables with a time column are written with one record batch per month
+    so that a time range can be read without reading the whole file.
+    The record batches are compressed with ``compression``, one of zstd, lz4,
+    or None, which is recorded in the schema metadata."""
+    metadata = {
+        key: val
+        for key, val in (table.schema.metadata or {}).items()
+        if key != ARROW_COMPRESSION_KEY
+    }
+    if compression is not None:
+        metadata[ARROW_COMPRESSION_KEY] = compression.encode()
+    table = table.replace_schema_metadata(metadata)
     sink = pa.BufferOutputStream()
-    writer = pa.ipc.new_file(sink, table.schema)
-    writer.write(table)
+    writer = pa.ipc.new_file(
+        sink, table.schema, options=pa.ipc.IpcWriteOptions(compression=compression)
+    )
+    if _has_time_column(table.schema) and table.num_rows > 0:
+        for offset, length in _month_slices(table):
+            writer.write(table.slice(offset, length))
+    else:
+        writer.write(table)
     writer.close()
     out: bytes = sink.getvalue().to_pybytes()
     return out
 
 
+def arrow_compression(data: Union[bytes, Path]) -> Optional[str]:
+    """The compression of Arrow File bytes or a file written by
+    dump_arrow_bytes, None if they are uncompressed or not an Arrow File"""
+    try:
+        source = pa.memory_map(str(data)) if isinstance(data, Path) else BytesIO(data)
+        metadata = pa.ipc.open_file(source).schema.metadata or {}
+    except pa.lib.ArrowInvalid:
+        return None
+    compression = metadata.get(ARROW_COMPRESSION_KEY)
+    return compression.decode() if compression is not None else None
+
+
+def accepted_arrow_codecs(accept: Optional[str]) -> List[str]:
+    """The Arrow IPC compression codecs a client accepts, listed in the codecs
+    parameter of the Arrow media type in the Accept header, e.g.
+    application/vnd.apache.arrow.file; codecs="zstd, lz4" """
+    if accept is None:
+        return []
+    # split on the commas that are not in a quoted parameter value
+    for media_range in re.split(r',(?=(?:[^"]*"[^"]*")*[^"]*$)', accept):
+        media_type, *params = media_range.split(";")
+        if media_type.strip() != "application/vnd.apache.arrow.file":
+            continue
+        for param in params:
+            key, _, val = param.partition("=")
+            if key.strip() == "codecs":
+                codecs = [codec.strip() for codec in val.strip(' "').split(",")]
+                return [codec for codec in codecs if codec in ARROW_CODECS]
+    return []
+
+
+def arrow_bytes_for_codecs(data: bytes, codecs: List[str]) -> bytes:
+    """Pass stored Arrow File bytes through if the client accepts their
+    compression, otherwise rewrite them with a codec the client accepts
+    or without compression"""
+    compression = arrow_compression(data)
+    if compression is None or compression in codecs:
+        return data
+    return dump_arrow_bytes(
+        read_arrow_table(BytesIO(data)), codecs[0] if codecs else None
+    )
+
+
+def _localize(time: dt.datetime) -> dt.datetime:
+    # times without a timezone are in the timezone of the CSV output
+    if time.tzinfo is None:
+        return time.replace(tzinfo=dt.timezone(dt.timedelta(hours=-7)))
+    return time
+
+
+def _select_batches(
+    schema: pa.Schema,
+    batches: Iterator[pa.RecordBatch],
+    start: Optional[dt.datetime],
+    end: Optional[dt.datetime],
+    columns: Optional[List[str]],
+) -> pa.Table:
+    names = schema.names
+    if columns is not None:
+        missing = [col for col in columns if col not in names]
+        if missing:
+            raise HTTPException(
+                status_code=400, detail=f"Unknown columns: {', '.join(missing)}"
+            )
+        names = [col for col in names if col == "time" or col in columns]
+    bounds = [
+        (compare, _localize(time))
+        for compare, time in ((pc.greater_equal, start), (pc.less, end))
+        if time is not None
+    ]
+    selected = []
+    for batch in batches:
+        batch = batch.select(names)
+        if bounds and _has_time_column(batch.schema):
+            time = batch.column("time")
+            mask = None
+            for compare, bound in bounds:
+                cond = compare(time, pa.scalar(bound, type=time.type))
+                mask = cond if mask is None else pc.and_(mask, cond)
+            if not pc.any(mask).as_py():
+                continue
+            if not pc.all(mask).as_py():
+                batch = batch.filter(mask)
+        selected.append(batch)
+    return pa.Table.from_batches(
+        selected, schema=pa.schema([schema.field(name) for name in names])
+    )
+
+
+def read_arrow_selection(
+    content: IO,
+    start: Optional[dt.datetime] = None,
+    end: Optional[dt.datetime] = None,
+    columns: Optional[List[str]] = None,
+) -> pa.Table:
+    """Read the rows with a time from ``start`` (inclusive) to ``end``
+    (exclusive) and the ``columns`` of a buffer in Apache Arrow File format.
+    Only the record batches that overlap the time range are kept and the
+    time column is always included."""
+    try:
+        reader = pa.ipc.open_file(content)
+    except pa.lib.ArrowInvalid as err:
+        raise HTTPException(status_code=400, detail=err.args[0])
+    return _select_batches(
+        reader.schema,
+        (reader.get_batch(i) for i in range(reader.num_record_batches)),
+        start,
+        end,
+        columns,
+    )
+
+
+def select_arrow_table(
+    table: pa.Table,
+    start: Optional[dt.datetime] = None,
+    end: Optional[dt.datetime] = None,
+    columns: Optional[List[str]] = None,
+) -> pa.Table:
+    """Like read_arrow_selection for a table that has already been read"""
+    return _select_batches(table.schema, iter(table.to_batches()), start, end, columns)
+
+
+RESAMPLE_UNITS = {"min": "minute", "h": "hour", "d": "day"}
+RESAMPLE_PATTERN = r"^([1-9][0-9]*)(min|h|d)$"
+
+
+def resample_arrow(table: pa.Table, freq: str) -> pa.Table:
+    """Average the columns of a table with a time column over intervals of
+    ``freq``, e.g. 15min, 1h, or 1d, labeled by the start of the interval.
+    Intervals are aligned to Etc/GMT+7 so that days start at local midnight."""
+    match = re.match(RESAMPLE_PATTERN, freq)
+    if match is None:
+        raise HTTPException(status_code=400, detail=f"Invalid resample {freq}")
+    multiple, unit = int(match.group(1)), RESAMPLE_UNITS[match.group(2)]
+    time_type = table.schema.field("time").type
+    local = table.column("time").cast(pa.timestamp("s", tz="Etc/GMT+7"), safe=False)
+    start = pc.floor_temporal(local, multiple=multiple, unit=unit).cast(time_type)
+    others = [field for field in table.schema if field.name != "time"]
+    out = (
+        table.set_column(table.schema.get_field_index("time"), "time", start)
+        .group_by("time")
+        .aggregate([(field.name, "mean") for field in others])
+        .sort_by("time")
+    )
+    return pa.table(
+        [out.column("time")]
+        + [out.column(f"{field.name}_mean").cast(field.type) for field in others],
+        schema=pa.schema([table.schema.field("time"), *others]),
+    )
+
+
+class TimeseriesSelection:
+    """Query parameters to select part of a stored timeseries"""
+
+    def __init__(
+        self,
+        start: Optional[dt.datetime] = Query(
+            None,
+            description=(
+                "Only return data from this time (inclusive). "
+                "Times without a timezone are assumed to be in Etc/GMT+7."
+            ),
+        ),
+        end: Optional[dt.datetime] = Query(
+            None,
+            description=(
+                "Only return data before this time (exclusive). "
+                "Times without a timezone are assumed to be in Etc/GMT+7."
+            ),
+        ),
+        columns: Optional[List[str]] = Query(
+            None, description="Only return these columns along with the time"
+        ),
+        resample: Optional[str] = Query(
+            None,
+            regex=RESAMPLE_PATTERN,
+            description=(
+                "Average the data over intervals of this length in minutes (min), "
+                "hours (h), or days (d), e.g. 1h"
+            ),
+        ),
+    ):
+        self.start = start
+        self.end = end
+        self.columns = columns
+        self.resample = resample
+
+    @property
+    def selected(self) -> bool:
+        """If any part of the timeseries was selected"""
+        return any(
+            val is not None
+            for val in (self.start, self.end, self.columns, self.resample)
+        )
+
+    @property
+    def cache_key(self) -> str:
+        """A string that identifies the selection for use in an ETag"""
+        return repr((self.start, self.end, self.columns, self.resample))
+
+    def apply(self, data: Union[bytes, pa.Table]) -> pa.Table:
+        """Read the selected part of a timeseries stored in Arrow format or
+        of a timeseries table"""
+        if isinstance(data, pa.Table):
+            table = select_arrow_table(data, self.start, self.end, self.columns)
+        else:
+            table = read_arrow_selection(
+                BytesIO(data), self.start, self.end, self.columns
+            )
+        if self.resample is not None:
+            table = resample_arrow(table, self.resample)
+        return table
+
+
+# a month of 5 minute data
+CSV_BATCH_ROWS = 8928
+
+
+def _format_csv_time(time: pa.ChunkedArray) -> pa.ChunkedArray:
+    """Format a timestamp column as strings in Etc/GMT+7 like pandas would,
+    e.g. 2019-01-01 00:00:00-07:00"""
+    # results are stored with second precision
+    local = time.cast(pa.timestamp("s", tz="Etc/GMT+7"), safe=False)
+    out = pc.strftime(local, format="%Y-%m-%d %H:%M:%S%z")
+    return pc.replace_substring_regex(
+        out, pattern=r"([+-]\d\d)(\d\d)$", replacement=r"\1:\2"
+    )
+
+
+def stream_csv(table: pa.Table, batch_rows: int = CSV_BATCH_ROWS) -> Iterator[str]:
+    """Format an Arrow Table as CSV, one batch of rows at a time, with any time
+    column converted to Etc/GMT+7"""
+    if _has_time_column(table.schema):
+        table = table.set_column(
+            table.schema.get_field_index("time"),
+            "time",
+            _format_csv_time(table.column("time")),
+        )
+    # always emit at least one batch so empty tables still have a header
+    for start in range(0, max(table.num_rows, 1), batch_rows):
+        batch = table.slice(start, batch_rows).to_pandas(split_blocks=True)
+        yield batch.to_csv(None, index=False, header=start == 0)
+
+
+# let the dashboard and proxies store results, but check they are current
+RESULT_CACHE_CONTROL = "no-cache, must-revalidate"
+
+
+def result_etag(tag: str, *parts: Any) -> str:
+    """A strong ETag for a response of a stored result from the ``tag`` of
+    the stored result and the ``parts`` of the request that determine the
+    content of the response, e.g. the media type"""
+    key = ":".join(str(part) for part in (tag, *parts))
+    return f'"{hashlib.sha256(key.encode()).hexdigest()[:32]}"'
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If the If-None-Match header matches etag using the weak comparison"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [
+        tag[2:] if tag.startswith("W/") else tag for tag in tags
+    ]
+
+
+def result_cache_headers(etag: str) -> Dict[str, str]:
+    """Headers for the caching of a response of a stored result"""
+    return {"ETag": etag, "Cache-Control": RESULT_CACHE_CONTROL, "Vary": "Accept"}
+
+
 class ArrowResponse(Response):
     media_type = "application/vnd.apache.arrow.file"
 
 
-class CSVResponse(Response):
+class CSVResponse(StreamingResponse):
     media_type = "text/csv"
 
 
@@ -0,0 +1,106 @@
+"""RQ worker that loads the NSRDB grids once, before any job process is forked.
+
+Start with
+``rq worker jobs --with-scheduler -w esprr_api.worker.PreloadedGridWorker``
+which takes jobs from the ``jobs`` queue and then from all of its bulk queues.
+A worker only for bulk jobs is given ``jobs-bulk``, which stands for every bulk
+queue of the ``jobs`` queue.
+"""
+import datetime as dt
+import gc
+import os
+
+
+from prometheus_client import (  # type: ignore
+    REGISTRY,
+    CollectorRegistry,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+from rq import Worker  # type: ignore
+from rq.utils import ensure_list  # type: ignore
+
+
+from . import compute, settings
+from .queuing import JobPriority, bulk_queue_names, queue_priority
+
+
+JOB_WAIT_SECONDS = Histogram(
+    "esprr_job_wait_seconds",
+    "Time jobs waited in the queue before a worker started them",
+    ["priority"],
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600, 7200, 14400, 28800),
+)
+
+
+def start_metrics_server(port: int) -> None:
+    """Serve the prometheus metrics of the worker, including those of the job
+    processes it forks if PROMETHEUS_MULTIPROC_DIR is set"""
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    start_http_server(port, registry=registry)
+
+
+class PreloadedGridWorker(Worker):
+    """Worker that loads the grid of every configured dataset before it starts
+    working so that the forked job processes inherit them instead of loading
+    the grid for every job. Each interactive queue given also brings its
+    bulk queues, so reruns are never left without a worker. Jobs are taken
+    from the interactive queues first and from the bulk queues in turn, so
+    each user, whose bulk jobs all go to one bulk queue, gets a share of the
+    worker."""
+
+    def __init__(self, queues, *args, **kwargs):
+        interactive = []
+        bulk = []
+        for queue in ensure_list(queues):
+            name = queue if isinstance(queue, str) else queue.name
+            if name.endswith("-bulk"):
+                bulk.extend(bulk_queue_names(name[: -len("-bulk")]))
+            elif queue_priority(name) == JobPriority.bulk:
+                bulk.append(queue)
+            else:
+                interactive.append(queue)
+                bulk.extend(bulk_queue_names(name))
+        expanded = {}
+        for queue in interactive + bulk:
+            expanded.setdefault(queue if isinstance(queue, str) else queue.name, queue)
+        super().__init__(list(expanded.values()), *args, **kwargs)
+
+    def dequeue_job_and_maintain_ttl(self, timeout):
+        result = super().dequeue_job_and_maintain_ttl(timeout)
+        if result is not None:
+            self.rotate_bulk_queues(result[1])
+        return result
+
+    def rotate_bulk_queues(self, served):
+        """Move the bulk queues up to and including the served queue behind
+        the other bulk queues"""
+        bulk = [q for q in self.queues if queue_priority(q.name) == JobPriority.bulk]
+        if served not in bulk:
+            return
+        i = bulk.index(served) + 1
+        bulk = bulk[i:] + bulk[:i]
+        self.queues = [
+            q for q in self.queues if queue_priority(q.name) != JobPriority.bulk
+        ] + bulk
+
+    def execute_job(self, job, queue):
+        if job.enqueued_at is not None:
+            JOB_WAIT_SECONDS.labels(priority=queue_priority(queue.name).value).observe(
+                (dt.datetime.utcnow() - job.enqueued_at).total_seconds()
+            )
+        return super().execute_job(job, queue)
+
+    def work(self, *args, **kwargs):
+        if settings.worker_metrics_port is not None:
+            start_metrics_server(settings.worker_metrics_port)
+        compute.preload_datasets()
+        # move the loaded objects out of the view of the garbage collector so
+        # collections in the job processes do not copy their memory pages
+        gc.freeze()
+        return super().work(*args, **kwargs)
@@ -29,6 +29,7 @@ if __name__ == "__main__":
             "xarray",
             "zarr",
         ],
+        extras_require={"s3": ["boto3"]},
         use_scm_version={
             "write_to": "api/esprr_api/_version.py",
             "root": "..",
@@ -0,0 +1,25 @@
+import argparse
+from pathlib import Path
+
+
+from esprr_api.data.nsrdb import NSRDBDataset
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=(
+            "Precompute the grid boxes, their areas, and the boundary of NSRDB zarr "
+            "datasets made by reformat_nsrdb.py. The grid is saved next to each "
+            "dataset and used by the workers instead of rebuilding it for each job."
+        )
+    )
+    parser.add_argument("zarr_path", nargs="+", type=Path)
+    args = parser.parse_args()
+    for path in args.zarr_path:
+        ds = NSRDBDataset(path)
+        ds.build_grid()
+        print(f"Wrote {ds.grid_path}")
+
+
+if __name__ == "__main__":
+    main()
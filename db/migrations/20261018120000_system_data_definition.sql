@@ -0,0 +1,87 @@
+-- migrate:up
+alter table system_data add column system_definition JSON after system_hash;
+
+drop procedure update_system_data;
+create definer = 'update_objects'@'localhost'
+  procedure update_system_data (auth0id varchar(32), systemid char(36),
+    datasetid varchar(32), new_timeseries longblob, new_statistics longblob,
+    new_error JSON, new_version varchar(32), new_system_hash char(32),
+    new_system_definition JSON)
+    comment 'Update the timeseries and stats data'
+    modifies sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+    declare allowed boolean;
+    set allowed = check_users_system(auth0id, systemid) and exists(
+      select 1 from system_data where system_id = binid and dataset = datasetid
+      );
+
+    if allowed then
+      update system_data set version = new_version,
+        system_hash = unhex(new_system_hash),
+        system_definition = new_system_definition,
+        timeseries = new_timeseries, statistics = new_statistics, error = new_error
+	where system_id = binid and dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'Updating system data denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+grant execute on procedure `update_system_data` to 'update_objects'@'localhost';
+grant execute on procedure `update_system_data` to 'apiuser'@'%';
+
+
+create definer = 'select_objects'@'localhost'
+  procedure get_system_data_definition (auth0id varchar(32), systemid char(36),
+    datasetid varchar(32))
+    comment 'Get the system definition the system data was computed from'
+    reads sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+    declare allowed boolean default (check_users_system(auth0id, systemid));
+
+    if allowed then
+      select bin_to_uuid(system_id, 1) as system_id,
+        dataset, version, get_system_data_status(binid, datasetid) as status,
+        system_definition
+      from system_data where system_id = binid and dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'Getting system data definition denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+grant execute on procedure `get_system_data_definition` to 'select_objects'@'localhost';
+grant execute on procedure `get_system_data_definition` to 'apiuser'@'%';
+
+
+-- migrate:down
+drop procedure get_system_data_definition;
+
+drop procedure update_system_data;
+create definer = 'update_objects'@'localhost'
+  procedure update_system_data (auth0id varchar(32), systemid char(36),
+    datasetid varchar(32), new_timeseries longblob, new_statistics longblob,
+    new_error JSON, new_version varchar(32), new_system_hash char(32))
+    comment 'Update the timeseries and stats data'
+    modifies sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+    declare allowed boolean;
+    set allowed = check_users_system(auth0id, systemid) and exists(
+      select 1 from system_data where system_id = binid and dataset = datasetid
+      );
+
+    if allowed then
+      update system_data set version = new_version,
+        system_hash = unhex(new_system_hash),
+        timeseries = new_timeseries, statistics = new_statistics, error = new_error
+	where system_id = binid and dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'Updating system data denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+grant execute on procedure `update_system_data` to 'update_objects'@'localhost';
+grant execute on procedure `update_system_data` to 'apiuser'@'%';
+
+alter table system_data drop column system_definition;
@@ -0,0 +1,98 @@
+-- migrate:up
+create table system_group_data (
+  group_id binary(16) not null,
+  dataset varchar(32) not null,
+  artifact enum('timeseries', 'statistics') not null,
+  version varchar(32),
+  data_key binary(16) not null,
+  data longblob,
+  created_at timestamp not null default current_timestamp,
+  modified_at timestamp not null default current_timestamp on update current_timestamp,
+  primary key (group_id, dataset, artifact),
+  foreign key (group_id)
+    references system_groups(id)
+    on delete cascade on update restrict
+) engine=innodb row_format=compressed;
+
+
+-- key of the members of a group and the results they have for a dataset
+create definer = 'select_objects'@'localhost'
+  function get_system_group_data_key (binid binary(16), datasetid varchar(32))
+    returns char(32)
+    comment 'Hash the group members, their definitions and system data state'
+    reads sql data sql security definer
+  begin
+    return md5(coalesce((
+      select group_concat(
+        concat_ws(':', hex(m.system_id), md5(s.definition),
+          coalesce(hex(d.system_hash), ''), coalesce(d.modified_at, ''))
+        order by m.system_id separator ',')
+      from system_group_mapping as m
+      join systems as s on s.id = m.system_id
+      left join system_data as d on d.system_id = m.system_id
+        and d.dataset = datasetid
+      where m.group_id = binid), ''));
+  end;
+
+grant execute on function `get_system_group_data_key` to 'select_objects'@'localhost';
+
+
+create definer = 'select_objects'@'localhost'
+  procedure get_system_group_data (auth0id varchar(32), groupid char(36),
+    datasetid varchar(32), artifactname varchar(32))
+    comment 'Get the current group data key and the stored group artifact'
+    reads sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select get_system_group_data_key(binid, datasetid) as data_key,
+        hex(d.data_key) as stored_data_key, d.version, d.data, d.modified_at
+      from (select 1) as one
+      left join system_group_data as d on d.group_id = binid
+        and d.dataset = datasetid and d.artifact = artifactname;
+    else
+      signal sqlstate '42000' set message_text = 'System group data inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant select on system_group_data to 'select_objects'@'localhost';
+grant execute on procedure `get_system_group_data` to 'select_objects'@'localhost';
+grant execute on procedure `get_system_group_data` to 'apiuser'@'%';
+
+
+create definer = 'insert_objects'@'localhost'
+  procedure update_system_group_data (auth0id varchar(32), groupid char(36),
+    datasetid varchar(32), artifactname varchar(32), new_data_key char(32),
+    new_version varchar(32), new_data longblob)
+    comment 'Store a group artifact computed for a group data key'
+    modifies sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      insert into system_group_data (group_id, dataset, artifact, version,
+        data_key, data)
+      values (binid, datasetid, artifactname, new_version, unhex(new_data_key),
+        new_data)
+      on duplicate key update version = new_version,
+        data_key = unhex(new_data_key), data = new_data;
+    else
+      signal sqlstate '42000' set message_text = 'Updating system group data denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant insert, update(version, data_key, data) on system_group_data to 'insert_objects'@'localhost';
+grant execute on procedure `update_system_group_data` to 'insert_objects'@'localhost';
+grant execute on procedure `update_system_group_data` to 'apiuser'@'%';
+
+
+-- migrate:down
+drop procedure update_system_group_data;
+drop procedure get_system_group_data;
+drop function get_system_group_data_key;
+drop table system_group_data;
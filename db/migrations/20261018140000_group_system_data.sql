@@ -0,0 +1,59 @@
+-- migrate:up
+create definer = 'select_objects'@'localhost'
+  procedure get_group_system_timeseries (auth0id varchar(32), groupid char(36),
+    datasetid varchar(32))
+    comment 'Get the timeseries data for every system in a group'
+    reads sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select bin_to_uuid(m.system_id, 1) as system_id, d.timeseries
+      from system_group_mapping as m
+      left join system_data as d on d.system_id = m.system_id
+        and d.dataset = datasetid
+      where m.group_id = binid;
+    else
+      signal sqlstate '42000' set message_text = 'System group timeseries inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant execute on procedure `get_group_system_timeseries` to 'select_objects'@'localhost';
+grant execute on procedure `get_group_system_timeseries` to 'apiuser'@'%';
+
+
+create definer = 'select_objects'@'localhost'
+  procedure get_group_system_data_meta (auth0id varchar(32), groupid char(36),
+    datasetid varchar(32))
+    comment 'Get the system data metadata for every system in a group'
+    reads sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select bin_to_uuid(m.system_id, 1) as system_id,
+        d.dataset, d.version, hex(d.system_hash) as system_hash,
+        md5(s.definition) as current_system_hash,
+        get_system_data_status(m.system_id, datasetid) as status,
+        d.error, d.created_at, d.modified_at
+      from system_group_mapping as m
+      join systems as s on s.id = m.system_id
+      join system_data as d on d.system_id = m.system_id
+        and d.dataset = datasetid
+      where m.group_id = binid;
+    else
+      signal sqlstate '42000' set message_text = 'System group data metadata inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant execute on procedure `get_group_system_data_meta` to 'select_objects'@'localhost';
+grant execute on procedure `get_group_system_data_meta` to 'apiuser'@'%';
+
+
+-- migrate:down
+drop procedure get_group_system_data_meta;
+drop procedure get_group_system_timeseries;
@@ -0,0 +1,9 @@
+-- migrate:up
+-- the stored Arrow data is compressed by the API, so avoid recompressing pages
+alter table system_data row_format=dynamic;
+alter table system_group_data row_format=dynamic;
+
+
+-- migrate:down
+alter table system_group_data row_format=compressed;
+alter table system_data row_format=compressed;
@@ -0,0 +1,24 @@
+-- migrate:up
+create definer = 'select_objects'@'localhost'
+  procedure get_group_data_key (auth0id varchar(32), groupid char(36),
+    datasetid varchar(32))
+    comment 'Get the key of the group members and their results without the data'
+    reads sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select get_system_group_data_key(binid, datasetid) as data_key;
+    else
+      signal sqlstate '42000' set message_text = 'System group data key inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant execute on procedure `get_group_data_key` to 'select_objects'@'localhost';
+grant execute on procedure `get_group_data_key` to 'apiuser'@'%';
+
+
+-- migrate:down
+drop procedure get_group_data_key;
@@ -0,0 +1,62 @@
+-- migrate:up
+create definer = 'select_objects'@'localhost'
+  procedure get_system_data_definitions (auth0id varchar(32), items json)
+    comment 'Get the current and computed system definitions of many system datasets'
+    reads sql data sql security definer
+  begin
+    declare allowed boolean;
+    set allowed = (
+      select coalesce(min(check_users_system(auth0id, j.system_id)), true)
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id')) as j);
+
+    if allowed then
+      select j.system_id, j.dataset, s.definition, d.version,
+        get_system_data_status(s.id, j.dataset) as status,
+        d.system_definition
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id',
+        dataset varchar(32) path '$.dataset')) as j
+      join systems as s on s.id = uuid_to_bin(j.system_id, 1)
+      left join system_data as d on d.system_id = s.id and d.dataset = j.dataset;
+    else
+      signal sqlstate '42000' set message_text = 'Getting system data definitions denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant execute on procedure `get_system_data_definitions` to 'select_objects'@'localhost';
+grant execute on procedure `get_system_data_definitions` to 'apiuser'@'%';
+
+
+create definer = 'insert_objects'@'localhost'
+  procedure create_system_data_many (auth0id varchar(32), items json)
+    comment 'Create or reset the system data rows of many systems and datasets'
+    modifies sql data sql security definer
+  begin
+    declare allowed boolean;
+    set allowed = (
+      select coalesce(min(check_users_system(auth0id, j.system_id)), true)
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id')) as j);
+
+    if allowed then
+      insert into system_data (system_id, dataset)
+      select uuid_to_bin(j.system_id, 1), j.dataset
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id',
+        dataset varchar(32) path '$.dataset')) as j
+      on duplicate key update timeseries = null, statistics = null, error = json_array();
+    else
+      signal sqlstate '42000' set message_text = 'Create system data denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant execute on procedure `create_system_data_many` to 'insert_objects'@'localhost';
+grant execute on procedure `create_system_data_many` to 'apiuser'@'%';
+
+
+-- migrate:down
+drop procedure create_system_data_many;
+drop procedure get_system_data_definitions;
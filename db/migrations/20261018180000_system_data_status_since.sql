@@ -0,0 +1,60 @@
+-- migrate:up
+alter table system_data add key system_data_modified_at_key (modified_at);
+alter table systems add key systems_modified_at_key (modified_at);
+
+
+create definer = 'select_objects'@'localhost'
+  procedure list_system_data_status_since (since timestamp)
+    comment 'List the status of system data modified, or of systems modified, since a time'
+    reads sql data sql security definer
+  begin
+    select bin_to_uuid(d.system_id, 1) as system_id, d.dataset,
+      get_system_data_status(d.system_id, d.dataset) as status, d.version,
+      (d.system_hash != unhex(md5(s.definition))) as hash_changed,
+      u.auth0_id as user, greatest(d.modified_at, s.modified_at) as modified_at
+    from system_data as d
+    join systems as s on s.id = d.system_id
+    join users as u on u.id = s.user_id
+    where d.modified_at >= since
+    union
+    select bin_to_uuid(d.system_id, 1) as system_id, d.dataset,
+      get_system_data_status(d.system_id, d.dataset) as status, d.version,
+      (d.system_hash != unhex(md5(s.definition))) as hash_changed,
+      u.auth0_id as user, greatest(d.modified_at, s.modified_at) as modified_at
+    from systems as s
+    join system_data as d on d.system_id = s.id
+    join users as u on u.id = s.user_id
+    where s.modified_at >= since;
+  end;
+
+grant execute on procedure `list_system_data_status_since` to 'select_objects'@'localhost';
+grant execute on procedure `list_system_data_status_since` to 'qmanager'@'%';
+
+
+create definer = 'select_objects'@'localhost'
+  procedure list_system_data_status_of (items json)
+    comment 'List the status of many system datasets that still exist'
+    reads sql data sql security definer
+  begin
+    select bin_to_uuid(d.system_id, 1) as system_id, d.dataset,
+      get_system_data_status(d.system_id, d.dataset) as status, d.version,
+      (d.system_hash != unhex(md5(s.definition))) as hash_changed,
+      u.auth0_id as user, greatest(d.modified_at, s.modified_at) as modified_at
+    from json_table(items, '$[*]' columns (
+      system_id char(36) path '$.system_id',
+      dataset varchar(32) path '$.dataset')) as j
+    join system_data as d on d.system_id = uuid_to_bin(j.system_id, 1)
+      and d.dataset = j.dataset
+    join systems as s on s.id = d.system_id
+    join users as u on u.id = s.user_id;
+  end;
+
+grant execute on procedure `list_system_data_status_of` to 'select_objects'@'localhost';
+grant execute on procedure `list_system_data_status_of` to 'qmanager'@'%';
+
+
+-- migrate:down
+drop procedure list_system_data_status_of;
+drop procedure list_system_data_status_since;
+alter table systems drop key systems_modified_at_key;
+alter table system_data drop key system_data_modified_at_key;
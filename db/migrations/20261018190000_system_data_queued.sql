@@ -0,0 +1,318 @@
+-- migrate:up
+alter table system_data add column queued boolean not null default false after error;
+
+
+create definer = 'select_objects'@'localhost'
+  function get_system_data_results_status (binid binary(16), datasetin varchar(32))
+    returns varchar(32)
+    reads sql data sql security definer
+  begin
+    declare error_status boolean default (exists(
+      select 1 from system_data where system_id = binid and dataset = datasetin
+      and json_length(error) != 0));
+    declare timeseries_status boolean default (exists(
+      select 1 from system_data where system_id = binid and dataset = datasetin
+      and timeseries is not null));
+    declare stats_status boolean default (exists(
+      select 1 from system_data where system_id = binid and dataset = datasetin
+      and statistics is not null));
+
+    if error_status then
+      return 'error';
+    elseif timeseries_status and stats_status then
+      return 'complete';
+    elseif timeseries_status and not stats_status then
+      return 'statistics missing';
+    elseif not timeseries_status and stats_status then
+      return 'timeseries missing';
+    else
+      return 'prepared';
+    end if;
+  end;
+grant execute on function `get_system_data_results_status` to 'select_objects'@'localhost';
+
+
+drop function get_system_data_status;
+create definer = 'select_objects'@'localhost'
+  function get_system_data_status (binid binary(16), datasetin varchar(32))
+    returns varchar(32)
+    reads sql data sql security definer
+  begin
+    declare queued_status boolean default (exists(
+      select 1 from system_data where system_id = binid and dataset = datasetin
+      and queued));
+
+    if queued_status then
+      return 'prepared';
+    else
+      return get_system_data_results_status(binid, datasetin);
+    end if;
+  end;
+grant execute on function `get_system_data_status` to 'select_objects'@'localhost';
+
+
+drop procedure get_system_data_definition;
+create definer = 'select_objects'@'localhost'
+  procedure get_system_data_definition (auth0id varchar(32), systemid char(36),
+    datasetid varchar(32))
+    comment 'Get the system definition the system data was computed from'
+    reads sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+    declare allowed boolean default (check_users_system(auth0id, systemid));
+
+    if allowed then
+      select bin_to_uuid(system_id, 1) as system_id,
+        dataset, version, get_system_data_results_status(binid, datasetid) as status,
+        system_definition
+      from system_data where system_id = binid and dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'Getting system data definition denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+grant execute on procedure `get_system_data_definition` to 'select_objects'@'localhost';
+grant execute on procedure `get_system_data_definition` to 'apiuser'@'%';
+
+
+drop procedure get_system_data_definitions;
+create definer = 'select_objects'@'localhost'
+  procedure get_system_data_definitions (auth0id varchar(32), items json)
+    comment 'Get the current and computed system definitions of many system datasets'
+    reads sql data sql security definer
+  begin
+    declare allowed boolean;
+    set allowed = (
+      select coalesce(min(check_users_system(auth0id, j.system_id)), true)
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id')) as j);
+
+    if allowed then
+      select j.system_id, j.dataset, s.definition, d.version,
+        get_system_data_results_status(s.id, j.dataset) as status,
+        d.system_definition
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id',
+        dataset varchar(32) path '$.dataset')) as j
+      join systems as s on s.id = uuid_to_bin(j.system_id, 1)
+      left join system_data as d on d.system_id = s.id and d.dataset = j.dataset;
+    else
+      signal sqlstate '42000' set message_text = 'Getting system data definitions denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant execute on procedure `get_system_data_definitions` to 'select_objects'@'localhost';
+grant execute on procedure `get_system_data_definitions` to 'apiuser'@'%';
+
+
+create definer = 'update_objects'@'localhost'
+  procedure queue_system_data_many (auth0id varchar(32), items json)
+    comment 'Mark the system data of many systems and datasets as queued, keeping the stored results'
+    modifies sql data sql security definer
+  begin
+    declare allowed boolean;
+    set allowed = (
+      select coalesce(min(check_users_system(auth0id, j.system_id)), true)
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id')) as j);
+
+    if allowed then
+      update system_data as d
+      join json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id',
+        dataset varchar(32) path '$.dataset')) as j
+      on d.system_id = uuid_to_bin(j.system_id, 1) and d.dataset = j.dataset
+      set d.queued = true;
+    else
+      signal sqlstate '42000' set message_text = 'Queue system data denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant execute on procedure `queue_system_data_many` to 'update_objects'@'localhost';
+grant execute on procedure `queue_system_data_many` to 'apiuser'@'%';
+
+
+drop procedure update_system_data;
+create definer = 'update_objects'@'localhost'
+  procedure update_system_data (auth0id varchar(32), systemid char(36),
+    datasetid varchar(32), new_timeseries longblob, new_statistics longblob,
+    new_error JSON, new_version varchar(32), new_system_hash char(32),
+    new_system_definition JSON)
+    comment 'Update the timeseries and stats data'
+    modifies sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+    declare allowed boolean;
+    set allowed = check_users_system(auth0id, systemid) and exists(
+      select 1 from system_data where system_id = binid and dataset = datasetid
+      );
+
+    if allowed then
+      update system_data set version = new_version,
+        system_hash = unhex(new_system_hash),
+        system_definition = new_system_definition,
+        timeseries = new_timeseries, statistics = new_statistics, error = new_error,
+        queued = false
+	where system_id = binid and dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'Updating system data denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+grant execute on procedure `update_system_data` to 'update_objects'@'localhost';
+grant execute on procedure `update_system_data` to 'apiuser'@'%';
+
+
+drop procedure report_failure;
+create definer = 'update_objects'@'localhost'
+  procedure report_failure (systemid char(36), datasetname varchar(32), newerror JSON)
+    modifies sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+
+    update system_data set error = newerror, queued = false
+      where system_id = binid and dataset = datasetname;
+  end;
+
+grant execute on procedure `report_failure` to 'update_objects'@'localhost';
+grant execute on procedure `report_failure` to 'qmanager'@'%';
+
+
+-- migrate:down
+drop procedure report_failure;
+create definer = 'update_objects'@'localhost'
+  procedure report_failure (systemid char(36), datasetname varchar(32), newerror JSON)
+    modifies sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+
+    update system_data set error = newerror where system_id = binid and dataset = datasetname;
+  end;
+
+grant execute on procedure `report_failure` to 'update_objects'@'localhost';
+grant execute on procedure `report_failure` to 'qmanager'@'%';
+
+
+drop procedure update_system_data;
+create definer = 'update_objects'@'localhost'
+  procedure update_system_data (auth0id varchar(32), systemid char(36),
+    datasetid varchar(32), new_timeseries longblob, new_statistics longblob,
+    new_error JSON, new_version varchar(32), new_system_hash char(32),
+    new_system_definition JSON)
+    comment 'Update the timeseries and stats data'
+    modifies sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+    declare allowed boolean;
+    set allowed = check_users_system(auth0id, systemid) and exists(
+      select 1 from system_data where system_id = binid and dataset = datasetid
+      );
+
+    if allowed then
+      update system_data set version = new_version,
+        system_hash = unhex(new_system_hash),
+        system_definition = new_system_definition,
+        timeseries = new_timeseries, statistics = new_statistics, error = new_error
+	where system_id = binid and dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'Updating system data denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+grant execute on procedure `update_system_data` to 'update_objects'@'localhost';
+grant execute on procedure `update_system_data` to 'apiuser'@'%';
+
+
+drop procedure queue_system_data_many;
+
+
+drop procedure get_system_data_definition;
+create definer = 'select_objects'@'localhost'
+  procedure get_system_data_definition (auth0id varchar(32), systemid char(36),
+    datasetid varchar(32))
+    comment 'Get the system definition the system data was computed from'
+    reads sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+    declare allowed boolean default (check_users_system(auth0id, systemid));
+
+    if allowed then
+      select bin_to_uuid(system_id, 1) as system_id,
+        dataset, version, get_system_data_status(binid, datasetid) as status,
+        system_definition
+      from system_data where system_id = binid and dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'Getting system data definition denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+grant execute on procedure `get_system_data_definition` to 'select_objects'@'localhost';
+grant execute on procedure `get_system_data_definition` to 'apiuser'@'%';
+
+
+drop procedure get_system_data_definitions;
+create definer = 'select_objects'@'localhost'
+  procedure get_system_data_definitions (auth0id varchar(32), items json)
+    comment 'Get the current and computed system definitions of many system datasets'
+    reads sql data sql security definer
+  begin
+    declare allowed boolean;
+    set allowed = (
+      select coalesce(min(check_users_system(auth0id, j.system_id)), true)
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id')) as j);
+
+    if allowed then
+      select j.system_id, j.dataset, s.definition, d.version,
+        get_system_data_status(s.id, j.dataset) as status,
+        d.system_definition
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id',
+        dataset varchar(32) path '$.dataset')) as j
+      join systems as s on s.id = uuid_to_bin(j.system_id, 1)
+      left join system_data as d on d.system_id = s.id and d.dataset = j.dataset;
+    else
+      signal sqlstate '42000' set message_text = 'Getting system data definitions denied',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant execute on procedure `get_system_data_definitions` to 'select_objects'@'localhost';
+grant execute on procedure `get_system_data_definitions` to 'apiuser'@'%';
+
+
+drop function get_system_data_status;
+create definer = 'select_objects'@'localhost'
+  function get_system_data_status (binid binary(16), datasetin varchar(32))
+    returns varchar(32)
+    reads sql data sql security definer
+  begin
+    declare error_status boolean default (exists(
+      select 1 from system_data where system_id = binid and dataset = datasetin
+      and json_length(error) != 0));
+    declare timeseries_status boolean default (exists(
+      select 1 from system_data where system_id = binid and dataset = datasetin
+      and timeseries is not null));
+    declare stats_status boolean default (exists(
+      select 1 from system_data where system_id = binid and dataset = datasetin
+      and statistics is not null));
+
+    if error_status then
+      return 'error';
+    elseif timeseries_status and stats_status then
+      return 'complete';
+    elseif timeseries_status and not stats_status then
+      return 'statistics missing';
+    elseif not timeseries_status and stats_status then
+      return 'timeseries missing';
+    else
+      return 'prepared';
+    end if;
+  end;
+grant execute on function `get_system_data_status` to 'select_objects'@'localhost';
+
+drop function get_system_data_results_status;
+
+alter table system_data drop column queued;
@@ -0,0 +1,48 @@
+-- migrate:up
+-- hash each member and combine the hashes with bit_xor, since group_concat
+-- truncates the members at group_concat_max_len (1024 bytes by default)
+drop function get_system_group_data_key;
+create definer = 'select_objects'@'localhost'
+  function get_system_group_data_key (binid binary(16), datasetid varchar(32))
+    returns char(32)
+    comment 'Hash the group members, their definitions and system data state'
+    reads sql data sql security definer
+  begin
+    return (
+      select md5(concat_ws(':', count(*),
+        coalesce(bit_xor(cast(conv(left(h.member_hash, 16), 16, 10) as unsigned)), 0),
+        coalesce(bit_xor(cast(conv(right(h.member_hash, 16), 16, 10) as unsigned)), 0)))
+      from (
+        select md5(concat_ws(':', hex(m.system_id), md5(s.definition),
+          coalesce(hex(d.system_hash), ''), coalesce(d.modified_at, ''))) as member_hash
+        from system_group_mapping as m
+        join systems as s on s.id = m.system_id
+        left join system_data as d on d.system_id = m.system_id
+          and d.dataset = datasetid
+        where m.group_id = binid) as h);
+  end;
+
+grant execute on function `get_system_group_data_key` to 'select_objects'@'localhost';
+
+
+-- migrate:down
+drop function get_system_group_data_key;
+create definer = 'select_objects'@'localhost'
+  function get_system_group_data_key (binid binary(16), datasetid varchar(32))
+    returns char(32)
+    comment 'Hash the group members, their definitions and system data state'
+    reads sql data sql security definer
+  begin
+    return md5(coalesce((
+      select group_concat(
+        concat_ws(':', hex(m.system_id), md5(s.definition),
+          coalesce(hex(d.system_hash), ''), coalesce(d.modified_at, ''))
+        order by m.system_id separator ',')
+      from system_group_mapping as m
+      join systems as s on s.id = m.system_id
+      left join system_data as d on d.system_id = m.system_id
+        and d.dataset = datasetid
+      where m.group_id = binid), ''));
+  end;
+
+grant execute on function `get_system_group_data_key` to 'select_objects'@'localhost';
@@ -0,0 +1,22 @@
+-- migrate:up
+create definer = 'select_objects'@'localhost'
+  procedure list_result_references ()
+    comment 'List the digests of the results referenced from the result store'
+    reads sql data sql security definer
+  begin
+    select substr(timeseries, 21) as digest from system_data
+    where left(timeseries, 20) = 'esprr-result:sha256:'
+    union
+    select substr(statistics, 21) as digest from system_data
+    where left(statistics, 20) = 'esprr-result:sha256:'
+    union
+    select substr(data, 21) as digest from system_group_data
+    where left(data, 20) = 'esprr-result:sha256:';
+  end;
+
+grant execute on procedure `list_result_references` to 'select_objects'@'localhost';
+grant execute on procedure `list_result_references` to 'qmanager'@'%';
+
+
+-- migrate:down
+drop procedure list_result_references;
@@ -0,0 +1,30 @@
+-- migrate:up
+create definer = 'select_objects'@'localhost'
+  procedure get_group_system_timeseries_of (auth0id varchar(32), groupid char(36),
+    datasetid varchar(32), systemids json)
+    comment 'Get the timeseries data for some of the systems in a group'
+    reads sql data sql security definer
+  begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select bin_to_uuid(m.system_id, 1) as system_id, d.timeseries
+      from json_table(systemids, '$[*]' columns (
+        system_id char(36) path '$')) as j
+      join system_group_mapping as m on m.system_id = uuid_to_bin(j.system_id, 1)
+        and m.group_id = binid
+      left join system_data as d on d.system_id = m.system_id
+        and d.dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'System group timeseries inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end;
+
+grant execute on procedure `get_group_system_timeseries_of` to 'select_objects'@'localhost';
+grant execute on procedure `get_group_system_timeseries_of` to 'apiuser'@'%';
+
+
+-- migrate:down
+drop procedure get_group_system_timeseries_of;
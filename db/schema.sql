@@ -32,16 +32,39 @@ CREATE TABLE `system_data` (
   `dataset` varchar(32) NOT NULL,
   `version` varchar(32) DEFAULT NULL,
   `system_hash` binary(16) DEFAULT NULL,
+  `system_definition` json DEFAULT NULL,
   `timeseries` longblob,
   `statistics` longblob,
   `error` json NOT NULL DEFAULT (json_array()),
+  `queued` tinyint(1) NOT NULL DEFAULT '0',
   `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
   `modified_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
   PRIMARY KEY (`system_id`,`dataset`),
   KEY `timeseries_null` (`timeseries`(1)),
   KEY `statistics_null` (`statistics`(1)),
+  KEY `system_data_modified_at_key` (`modified_at`),
   CONSTRAINT `system_data_ibfk_1` FOREIGN KEY (`system_id`) REFERENCES `systems` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
-) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci ROW_FORMAT=COMPRESSED;
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci ROW_FORMAT=DYNAMIC;
+/*!40101 SET character_set_client = @saved_cs_client */;
+
+--
+-- Table structure for table `system_group_data`
+--
+
+/*!40101 SET @saved_cs_client     = @@character_set_client */;
+/*!50503 SET character_set_client = utf8mb4 */;
+CREATE TABLE `system_group_data` (
+  `group_id` binary(16) NOT NULL,
+  `dataset` varchar(32) NOT NULL,
+  `artifact` enum('timeseries','statistics') NOT NULL,
+  `version` varchar(32) DEFAULT NULL,
+  `data_key` binary(16) NOT NULL,
+  `data` longblob,
+  `created_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP,
+  `modified_at` timestamp NOT NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`group_id`,`dataset`,`artifact`),
+  CONSTRAINT `system_group_data_ibfk_1` FOREIGN KEY (`group_id`) REFERENCES `system_groups` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci ROW_FORMAT=DYNAMIC;
 /*!40101 SET character_set_client = @saved_cs_client */;
 
 --
@@ -96,6 +119,7 @@ CREATE TABLE `systems` (
   PRIMARY KEY (`id`),
   UNIQUE KEY `system_user_name_key` (`user_id`,`name`),
   KEY `systems_user_id_key` (`user_id`),
+  KEY `systems_modified_at_key` (`modified_at`),
   CONSTRAINT `systems_ibfk_1` FOREIGN KEY (`user_id`) REFERENCES `users` (`id`) ON DELETE CASCADE ON UPDATE RESTRICT
 ) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci ROW_FORMAT=COMPRESSED;
 /*!40101 SET character_set_client = @saved_cs_client */;
@@ -189,7 +213,7 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
-CREATE DEFINER=`select_objects`@`localhost` FUNCTION `get_system_data_status`(binid binary(16), datasetin varchar(32)) RETURNS varchar(32) CHARSET utf8mb4
+CREATE DEFINER=`select_objects`@`localhost` FUNCTION `get_system_data_results_status`(binid binary(16), datasetin varchar(32)) RETURNS varchar(32) CHARSET utf8mb4
     READS SQL DATA
 begin
     declare error_status boolean default (exists(
@@ -228,6 +252,64 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` FUNCTION `get_system_data_status`(binid binary(16), datasetin varchar(32)) RETURNS varchar(32) CHARSET utf8mb4
+    READS SQL DATA
+begin
+    declare queued_status boolean default (exists(
+      select 1 from system_data where system_id = binid and dataset = datasetin
+      and queued));
+
+    if queued_status then
+      return 'prepared';
+    else
+      return get_system_data_results_status(binid, datasetin);
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` FUNCTION `get_system_group_data_key`(binid binary(16), datasetid varchar(32)) RETURNS char(32) CHARSET utf8mb4
+    READS SQL DATA
+    COMMENT 'Hash the group members, their definitions and system data state'
+begin
+    return (
+      select md5(concat_ws(':', count(*),
+        coalesce(bit_xor(cast(conv(left(h.member_hash, 16), 16, 10) as unsigned)), 0),
+        coalesce(bit_xor(cast(conv(right(h.member_hash, 16), 16, 10) as unsigned)), 0)))
+      from (
+        select md5(concat_ws(':', hex(m.system_id), md5(s.definition),
+          coalesce(hex(d.system_hash), ''), coalesce(d.modified_at, ''))) as member_hash
+        from system_group_mapping as m
+        join systems as s on s.id = m.system_id
+        left join system_data as d on d.system_id = m.system_id
+          and d.dataset = datasetid
+        where m.group_id = binid) as h);
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
 CREATE DEFINER=`select_objects`@`localhost` FUNCTION `get_user_binid`(auth0id varchar(32)) RETURNS binary(16)
     READS SQL DATA
     COMMENT 'Get the binary id of a user'
@@ -374,6 +456,42 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
+CREATE DEFINER=`insert_objects`@`localhost` PROCEDURE `create_system_data_many`(auth0id varchar(32), items json)
+    MODIFIES SQL DATA
+    COMMENT 'Create or reset the system data rows of many systems and datasets'
+begin
+    declare allowed boolean;
+    set allowed = (
+      select coalesce(min(check_users_system(auth0id, j.system_id)), true)
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id')) as j);
+
+    if allowed then
+      insert into system_data (system_id, dataset)
+      select uuid_to_bin(j.system_id, 1), j.dataset
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id',
+        dataset varchar(32) path '$.dataset')) as j
+      on duplicate key update timeseries = null, statistics = null, error = json_array();
+    else
+      signal sqlstate '42000' set message_text = 'Create system data denied',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
 CREATE DEFINER=`insert_objects`@`localhost` PROCEDURE `create_system_group`(auth0id varchar(32), name varchar(128))
     MODIFIES SQL DATA
     COMMENT 'Create a new system group'
@@ -509,6 +627,141 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_group_data_key`(auth0id varchar(32), groupid char(36),
+    datasetid varchar(32))
+    READS SQL DATA
+    COMMENT 'Get the key of the group members and their results without the data'
+begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select get_system_group_data_key(binid, datasetid) as data_key;
+    else
+      signal sqlstate '42000' set message_text = 'System group data key inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_group_system_data_meta`(auth0id varchar(32), groupid char(36),
+    datasetid varchar(32))
+    READS SQL DATA
+    COMMENT 'Get the system data metadata for every system in a group'
+begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select bin_to_uuid(m.system_id, 1) as system_id,
+        d.dataset, d.version, hex(d.system_hash) as system_hash,
+        md5(s.definition) as current_system_hash,
+        get_system_data_status(m.system_id, datasetid) as status,
+        d.error, d.created_at, d.modified_at
+      from system_group_mapping as m
+      join systems as s on s.id = m.system_id
+      join system_data as d on d.system_id = m.system_id
+        and d.dataset = datasetid
+      where m.group_id = binid;
+    else
+      signal sqlstate '42000' set message_text = 'System group data metadata inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_group_system_timeseries`(auth0id varchar(32), groupid char(36),
+    datasetid varchar(32))
+    READS SQL DATA
+    COMMENT 'Get the timeseries data for every system in a group'
+begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select bin_to_uuid(m.system_id, 1) as system_id, d.timeseries
+      from system_group_mapping as m
+      left join system_data as d on d.system_id = m.system_id
+        and d.dataset = datasetid
+      where m.group_id = binid;
+    else
+      signal sqlstate '42000' set message_text = 'System group timeseries inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_group_system_timeseries_of`(auth0id varchar(32), groupid char(36),
+    datasetid varchar(32), systemids json)
+    READS SQL DATA
+    COMMENT 'Get the timeseries data for some of the systems in a group'
+begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select bin_to_uuid(m.system_id, 1) as system_id, d.timeseries
+      from json_table(systemids, '$[*]' columns (
+        system_id char(36) path '$')) as j
+      join system_group_mapping as m on m.system_id = uuid_to_bin(j.system_id, 1)
+        and m.group_id = binid
+      left join system_data as d on d.system_id = m.system_id
+        and d.dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'System group timeseries inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
 CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_group_systems`(auth0id varchar(32), groupid varchar(36))
     READS SQL DATA
     COMMENT 'Get name and id of each system that belongs to a group'
@@ -574,6 +827,76 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_system_data_definition`(auth0id varchar(32), systemid char(36),
+    datasetid varchar(32))
+    READS SQL DATA
+    COMMENT 'Get the system definition the system data was computed from'
+begin
+    declare binid binary(16) default (uuid_to_bin(systemid, 1));
+    declare allowed boolean default (check_users_system(auth0id, systemid));
+
+    if allowed then
+      select bin_to_uuid(system_id, 1) as system_id,
+        dataset, version, get_system_data_results_status(binid, datasetid) as status,
+        system_definition
+      from system_data where system_id = binid and dataset = datasetid;
+    else
+      signal sqlstate '42000' set message_text = 'Getting system data definition denied',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_system_data_definitions`(auth0id varchar(32), items json)
+    READS SQL DATA
+    COMMENT 'Get the current and computed system definitions of many system datasets'
+begin
+    declare allowed boolean;
+    set allowed = (
+      select coalesce(min(check_users_system(auth0id, j.system_id)), true)
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id')) as j);
+
+    if allowed then
+      select j.system_id, j.dataset, s.definition, d.version,
+        get_system_data_results_status(s.id, j.dataset) as status,
+        d.system_definition
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id',
+        dataset varchar(32) path '$.dataset')) as j
+      join systems as s on s.id = uuid_to_bin(j.system_id, 1)
+      left join system_data as d on d.system_id = s.id and d.dataset = j.dataset;
+    else
+      signal sqlstate '42000' set message_text = 'Getting system data definitions denied',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
 CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_system_data_meta`(auth0id varchar(32), systemid char(36),
     datasetid varchar(32))
     READS SQL DATA
@@ -639,6 +962,39 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_system_group_data`(auth0id varchar(32), groupid char(36),
+    datasetid varchar(32), artifactname varchar(32))
+    READS SQL DATA
+    COMMENT 'Get the current group data key and the stored group artifact'
+begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      select get_system_group_data_key(binid, datasetid) as data_key,
+        hex(d.data_key) as stored_data_key, d.version, d.data, d.modified_at
+      from (select 1) as one
+      left join system_group_data as d on d.group_id = binid
+        and d.dataset = datasetid and d.artifact = artifactname;
+    else
+      signal sqlstate '42000' set message_text = 'System group data inaccessible',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
 CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `get_system_hash`(auth0id varchar(32), systemid char(36))
     READS SQL DATA
 begin
@@ -753,6 +1109,33 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `list_result_references`()
+    READS SQL DATA
+    COMMENT 'List the digests of the results referenced from the result store'
+begin
+    select substr(timeseries, 21) as digest from system_data
+    where left(timeseries, 20) = 'esprr-result:sha256:'
+    union
+    select substr(statistics, 21) as digest from system_data
+    where left(statistics, 20) = 'esprr-result:sha256:'
+    union
+    select substr(data, 21) as digest from system_group_data
+    where left(data, 20) = 'esprr-result:sha256:';
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
 CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `list_systems`(auth0id varchar(32))
     READS SQL DATA
     COMMENT 'List all user systems'
@@ -799,6 +1182,72 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `list_system_data_status_of`(items json)
+    READS SQL DATA
+    COMMENT 'List the status of many system datasets that still exist'
+begin
+    select bin_to_uuid(d.system_id, 1) as system_id, d.dataset,
+      get_system_data_status(d.system_id, d.dataset) as status, d.version,
+      (d.system_hash != unhex(md5(s.definition))) as hash_changed,
+      u.auth0_id as user, greatest(d.modified_at, s.modified_at) as modified_at
+    from json_table(items, '$[*]' columns (
+      system_id char(36) path '$.system_id',
+      dataset varchar(32) path '$.dataset')) as j
+    join system_data as d on d.system_id = uuid_to_bin(j.system_id, 1)
+      and d.dataset = j.dataset
+    join systems as s on s.id = d.system_id
+    join users as u on u.id = s.user_id;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
+CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `list_system_data_status_since`(since timestamp)
+    READS SQL DATA
+    COMMENT 'List the status of system data modified, or of systems modified, since a time'
+begin
+    select bin_to_uuid(d.system_id, 1) as system_id, d.dataset,
+      get_system_data_status(d.system_id, d.dataset) as status, d.version,
+      (d.system_hash != unhex(md5(s.definition))) as hash_changed,
+      u.auth0_id as user, greatest(d.modified_at, s.modified_at) as modified_at
+    from system_data as d
+    join systems as s on s.id = d.system_id
+    join users as u on u.id = s.user_id
+    where d.modified_at >= since
+    union
+    select bin_to_uuid(d.system_id, 1) as system_id, d.dataset,
+      get_system_data_status(d.system_id, d.dataset) as status, d.version,
+      (d.system_hash != unhex(md5(s.definition))) as hash_changed,
+      u.auth0_id as user, greatest(d.modified_at, s.modified_at) as modified_at
+    from systems as s
+    join system_data as d on d.system_id = s.id
+    join users as u on u.id = s.user_id
+    where s.modified_at >= since;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
 CREATE DEFINER=`select_objects`@`localhost` PROCEDURE `list_system_groups`(auth0id varchar(32))
     READS SQL DATA
     COMMENT 'List all user system groups'
@@ -821,6 +1270,42 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
+CREATE DEFINER=`update_objects`@`localhost` PROCEDURE `queue_system_data_many`(auth0id varchar(32), items json)
+    MODIFIES SQL DATA
+    COMMENT 'Mark the system data of many systems and datasets as queued, keeping the stored results'
+begin
+    declare allowed boolean;
+    set allowed = (
+      select coalesce(min(check_users_system(auth0id, j.system_id)), true)
+      from json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id')) as j);
+
+    if allowed then
+      update system_data as d
+      join json_table(items, '$[*]' columns (
+        system_id char(36) path '$.system_id',
+        dataset varchar(32) path '$.dataset')) as j
+      on d.system_id = uuid_to_bin(j.system_id, 1) and d.dataset = j.dataset
+      set d.queued = true;
+    else
+      signal sqlstate '42000' set message_text = 'Queue system data denied',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
 CREATE DEFINER=`root`@`%` PROCEDURE `remove_example_data`()
     MODIFIES SQL DATA
 begin
@@ -877,7 +1362,8 @@ CREATE DEFINER=`update_objects`@`localhost` PROCEDURE `report_failure`(systemid
 begin
     declare binid binary(16) default (uuid_to_bin(systemid, 1));
 
-    update system_data set error = newerror where system_id = binid and dataset = datasetname;
+    update system_data set error = newerror, queued = false
+      where system_id = binid and dataset = datasetname;
   end ;;
 DELIMITER ;
 /*!50003 SET sql_mode              = @saved_sql_mode */ ;
@@ -924,7 +1410,8 @@ DELIMITER ;
 DELIMITER ;;
 CREATE DEFINER=`update_objects`@`localhost` PROCEDURE `update_system_data`(auth0id varchar(32), systemid char(36),
     datasetid varchar(32), new_timeseries longblob, new_statistics longblob,
-    new_error JSON, new_version varchar(32), new_system_hash char(32))
+    new_error JSON, new_version varchar(32), new_system_hash char(32),
+    new_system_definition JSON)
     MODIFIES SQL DATA
     COMMENT 'Update the timeseries and stats data'
 begin
@@ -937,7 +1424,9 @@ begin
     if allowed then
       update system_data set version = new_version,
         system_hash = unhex(new_system_hash),
-        timeseries = new_timeseries, statistics = new_statistics, error = new_error
+        system_definition = new_system_definition,
+        timeseries = new_timeseries, statistics = new_statistics, error = new_error,
+        queued = false
 	where system_id = binid and dataset = datasetid;
     else
       signal sqlstate '42000' set message_text = 'Updating system data denied',
@@ -986,6 +1475,41 @@ DELIMITER ;
 /*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
 /*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
 DELIMITER ;;
+CREATE DEFINER=`insert_objects`@`localhost` PROCEDURE `update_system_group_data`(auth0id varchar(32), groupid char(36),
+    datasetid varchar(32), artifactname varchar(32), new_data_key char(32),
+    new_version varchar(32), new_data longblob)
+    MODIFIES SQL DATA
+    COMMENT 'Store a group artifact computed for a group data key'
+begin
+    declare binid binary(16) default (uuid_to_bin(groupid, 1));
+    declare allowed boolean default (check_users_system_group(auth0id, groupid));
+
+    if allowed then
+      insert into system_group_data (group_id, dataset, artifact, version,
+        data_key, data)
+      values (binid, datasetid, artifactname, new_version, unhex(new_data_key),
+        new_data)
+      on duplicate key update version = new_version,
+        data_key = unhex(new_data_key), data = new_data;
+    else
+      signal sqlstate '42000' set message_text = 'Updating system group data denied',
+        mysql_errno = 1142;
+    end if;
+  end ;;
+DELIMITER ;
+/*!50003 SET sql_mode              = @saved_sql_mode */ ;
+/*!50003 SET character_set_client  = @saved_cs_client */ ;
+/*!50003 SET character_set_results = @saved_cs_results */ ;
+/*!50003 SET collation_connection  = @saved_col_connection */ ;
+/*!50003 SET @saved_cs_client      = @@character_set_client */ ;
+/*!50003 SET @saved_cs_results     = @@character_set_results */ ;
+/*!50003 SET @saved_col_connection = @@collation_connection */ ;
+/*!50003 SET character_set_client  = utf8mb4 */ ;
+/*!50003 SET character_set_results = utf8mb4 */ ;
+/*!50003 SET collation_connection  = utf8mb4_general_ci */ ;
+/*!50003 SET @saved_sql_mode       = @@sql_mode */ ;
+/*!50003 SET sql_mode              = 'ONLY_FULL_GROUP_BY,STRICT_TRANS_TABLES,NO_ZERO_IN_DATE,NO_ZERO_DATE,ERROR_FOR_DIVISION_BY_ZERO,NO_ENGINE_SUBSTITUTION' */ ;
+DELIMITER ;;
 CREATE DEFINER=`root`@`%` PROCEDURE `_add_example_data_0`()
     MODIFIES SQL DATA
 begin
@@ -1137,5 +1661,16 @@ INSERT INTO `schema_migrations` (version) VALUES
   ('20210429174612'),
   ('20220302095800'),
   ('20220713160000'),
-  ('20220802140000');
+  ('20220802140000'),
+  ('20261018120000'),
+  ('20261018130000'),
+  ('20261018140000'),
+  ('20261018150000'),
+  ('20261018160000'),
+  ('20261018170000'),
+  ('20261018180000'),
+  ('20261018190000'),
+  ('20261018200000'),
+  ('20261018210000'),
+  ('20261018220000');
 UNLOCK TABLES;
@@ -1,3 +1,7 @@
+import datetime as dt
+import json
+
+
 def test_list_system_data_status(dictcursor, system_id, auth0_id):
     dictcursor.execute(
         "update system_data set system_hash = unhex(md5('a')) where system_id = uuid_to_bin(%s, 1) and dataset = 'timeseries missing'",
@@ -19,6 +23,50 @@ def test_list_system_data_status(dictcursor, system_id, auth0_id):
     assert i == 5
 
 
+def test_list_system_data_status_since(dictcursor, system_id, auth0_id):
+    dictcursor.execute("call list_system_data_status_since('1970-01-02')")
+    out = dictcursor.fetchall()
+    assert len(out) == 5
+    for o in out:
+        assert o["system_id"] == system_id
+        assert o["status"] == o["dataset"]
+        assert o["user"] == auth0_id
+        assert o["modified_at"] is not None
+    last = max(o["modified_at"] for o in out)
+    dictcursor.execute(
+        "call list_system_data_status_since(%s)", last + dt.timedelta(seconds=1)
+    )
+    assert len(dictcursor.fetchall()) == 0
+
+
+def test_list_system_data_status_since_system_modified(dictcursor, system_id):
+    dictcursor.execute("select current_timestamp() as now")
+    now = dictcursor.fetchone()["now"]
+    dictcursor.execute(
+        "update systems set name = 'renamed' where id = uuid_to_bin(%s, 1)",
+        system_id,
+    )
+    dictcursor.execute("call list_system_data_status_since(%s)", now)
+    assert len(dictcursor.fetchall()) == 5
+
+
+def test_list_system_data_status_of(dictcursor, system_id, otherid):
+    items = json.dumps(
+        [
+            {"system_id": system_id, "dataset": "complete"},
+            {"system_id": system_id, "dataset": "missing"},
+            {"system_id": otherid, "dataset": "complete"},
+        ]
+    )
+    dictcursor.execute("call list_system_data_status_of(%s)", items)
+    out = dictcursor.fetchall()
+    assert len(out) == 1
+    assert out[0]["system_id"] == system_id
+    assert out[0]["dataset"] == "complete"
+    assert out[0]["status"] == "complete"
+    assert not out[0]["hash_changed"]
+
+
 def test_report_failure(dictcursor, system_id):
     dictcursor.execute(
         "select error from system_data where system_id = uuid_to_bin(%s, 1) and dataset = 'prepared'",
@@ -33,3 +81,34 @@ def test_report_failure(dictcursor, system_id):
         system_id,
     )
     assert dictcursor.fetchone()["error"] == '{"error": "i failed"}'
+
+
+def test_report_failure_queued(dictcursor, system_id):
+    dictcursor.execute(
+        "update system_data set queued = true where system_id = uuid_to_bin(%s, 1)"
+        " and dataset = 'complete'",
+        system_id,
+    )
+    dictcursor.execute(
+        "call report_failure(%s, 'complete', %s)", (system_id, '{"error": "i failed"}')
+    )
+    dictcursor.execute(
+        "select queued, get_system_data_status(system_id, dataset) as status"
+        " from system_data where system_id = uuid_to_bin(%s, 1) and dataset = 'complete'",
+        system_id,
+    )
+    out = dictcursor.fetchone()
+    assert not out["queued"]
+    assert out["status"] == "error"
+
+
+def test_list_result_references(dictcursor, system_id):
+    digest = "ab" * 32
+    dictcursor.execute(
+        "update system_data set timeseries = %s, statistics = %s"
+        " where system_id = uuid_to_bin(%s, 1) and dataset = 'complete'",
+        (f"esprr-result:sha256:{digest}", b"ARROW1", system_id),
+    )
+    dictcursor.execute("call list_result_references()")
+    out = dictcursor.fetchall()
+    assert [r["digest"].decode() for r in out] == [digest]
@@ -1,3 +1,4 @@
+import json
 from uuid import uuid1
 
 
@@ -70,6 +71,53 @@ def test_create_system_data_bad_user(cursor, bad_user, system_id):
     assert err.value.args[0] == 1142
 
 
+def test_create_system_data_many(dictcursor, auth0_id, system_id):
+    items = [
+        {"system_id": system_id, "dataset": "a"},
+        {"system_id": system_id, "dataset": "complete"},
+    ]
+    dictcursor.execute(
+        "call create_system_data_many(%s, %s)", (auth0_id, json.dumps(items))
+    )
+    dictcursor.execute(
+        "select dataset, timeseries, statistics, error from system_data"
+        " where system_id = uuid_to_bin(%s, 1) and dataset in ('a', 'complete')"
+        " order by dataset",
+        system_id,
+    )
+    out = dictcursor.fetchall()
+    assert [r["dataset"] for r in out] == ["a", "complete"]
+    for row in out:
+        assert row["timeseries"] is None
+        assert row["statistics"] is None
+        assert row["error"] == "[]"
+
+
+def test_create_system_data_many_empty(cursor, auth0_id):
+    cursor.execute("call create_system_data_many(%s, %s)", (auth0_id, "[]"))
+
+
+def test_create_system_data_many_bad_id(cursor, auth0_id, system_id):
+    items = [
+        {"system_id": system_id, "dataset": "a"},
+        {"system_id": str(uuid1()), "dataset": "a"},
+    ]
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call create_system_data_many(%s, %s)", (auth0_id, json.dumps(items))
+        )
+    assert err.value.args[0] == 1142
+
+
+def test_create_system_data_many_bad_user(cursor, bad_user, system_id):
+    items = [{"system_id": system_id, "dataset": "a"}]
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call create_system_data_many(%s, %s)", (bad_user, json.dumps(items))
+        )
+    assert err.value.args[0] == 1142
+
+
 @pytest.mark.parametrize("err", ["[]", '{"message": "fail"}'])
 def test_update_system_data(auth0_id, dictcursor, system_id, err):
     dictcursor.execute(
@@ -77,7 +125,13 @@ def test_update_system_data(auth0_id, dictcursor, system_id, err):
         (system_id, "prepared"),
     )
     before = dictcursor.fetchone()
-    for k in ("timeseries", "statistics", "version", "system_hash"):
+    for k in (
+        "timeseries",
+        "statistics",
+        "version",
+        "system_hash",
+        "system_definition",
+    ):
         assert before[k] is None
 
     new = {
@@ -86,10 +140,11 @@ def test_update_system_data(auth0_id, dictcursor, system_id, err):
         "error": err,
         "version": "v1.0",
         "un_system_hash": "A" * 32,
+        "system_definition": '{"name": "sys"}',
     }
 
     dictcursor.execute(
-        "call update_system_data(%s, %s, %s, %s, %s, %s, %s, %s)",
+        "call update_system_data(%s, %s, %s, %s, %s, %s, %s, %s, %s)",
         (
             auth0_id,
             system_id,
@@ -115,12 +170,13 @@ def test_update_system_data_bad_dataset(cursor, auth0_id, system_id):
         "error": "[]",
         "version": "v1.0",
         "un_system_hash": "A" * 32,
+        "system_definition": '{"name": "sys"}',
     }
 
     with pytest.raises(OperationalError) as err:
         cursor.execute(
             f'call update_system_data("{auth0_id}", "{system_id}"'
-            ', "a", %s, %s, %s, %s, %s)',
+            ', "a", %s, %s, %s, %s, %s, %s)',
             list(new.values()),
         )
     assert err.value.args[0] == 1142
@@ -133,12 +189,13 @@ def test_update_system_data_bad_id(cursor, auth0_id):
         "error": "[]",
         "version": "v1.0",
         "un_system_hash": "A" * 32,
+        "system_definition": '{"name": "sys"}',
     }
 
     with pytest.raises(OperationalError) as err:
         cursor.execute(
             f'call update_system_data("{auth0_id}", "{str(uuid1())}"'
-            ', "a", %s, %s, %s, %s, %s)',
+            ', "a", %s, %s, %s, %s, %s, %s)',
             list(new.values()),
         )
     assert err.value.args[0] == 1142
@@ -151,12 +208,13 @@ def test_update_system_data_bad_user(cursor, bad_user, system_id):
         "error": "[]",
         "version": "v1.0",
         "un_system_hash": "A" * 32,
+        "system_definition": '{"name": "sys"}',
     }
 
     with pytest.raises(OperationalError) as err:
         cursor.execute(
             f'call update_system_data("{bad_user}", "{system_id}",'
-            '"a", %s, %s, %s, %s, %s)',
+            '"a", %s, %s, %s, %s, %s, %s)',
             list(new.values()),
         )
     assert err.value.args[0] == 1142
@@ -287,3 +345,166 @@ def test_get_system_meta_bad_id(cursor, system_id, auth0_id, otherid):
             f'call get_system_data_meta("{auth0_id}", "{otherid}", "prepared")'
         )
     assert err.value.args[0] == 1142
+
+
+def test_get_system_data_definition(system_id, dictcursor, auth0_id):
+    dictcursor.execute(
+        "call update_system_data(%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        (
+            auth0_id,
+            system_id,
+            "prepared",
+            b"timeseries",
+            b"stats",
+            "[]",
+            "v1.0",
+            "A" * 32,
+            '{"name": "sys"}',
+        ),
+    )
+    dictcursor.execute(
+        f'call get_system_data_definition("{auth0_id}", "{system_id}", "prepared")'
+    )
+    res = dictcursor.fetchone()
+    assert res["system_id"] == system_id
+    assert res["dataset"] == "prepared"
+    assert res["version"] == "v1.0"
+    assert res["status"] == "complete"
+    assert res["system_definition"] == '{"name": "sys"}'
+
+
+def test_get_system_data_definition_empty(system_id, dictcursor, auth0_id):
+    dictcursor.execute(
+        f'call get_system_data_definition("{auth0_id}", "{system_id}", "prepared")'
+    )
+    res = dictcursor.fetchone()
+    assert res["status"] == "prepared"
+    assert res["system_definition"] is None
+
+
+def test_get_system_data_definition_missing(cursor, auth0_id, system_id):
+    cursor.execute(
+        f'call get_system_data_definition("{auth0_id}", "{system_id}", "nope")'
+    )
+    assert len(cursor.fetchall()) == 0
+
+
+def test_get_system_data_definition_bad_id(cursor, auth0_id, otherid):
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            f'call get_system_data_definition("{auth0_id}", "{otherid}", "prepared")'
+        )
+    assert err.value.args[0] == 1142
+
+
+def test_get_system_data_definition_bad_user(cursor, system_id, bad_user):
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            f'call get_system_data_definition("{bad_user}", "{system_id}", "prepared")'
+        )
+    assert err.value.args[0] == 1142
+
+
+def test_get_system_data_definitions(system_id, dictcursor, auth0_id, system_def):
+    dictcursor.execute(
+        "call update_system_data(%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        (
+            auth0_id,
+            system_id,
+            "prepared",
+            b"timeseries",
+            b"stats",
+            "[]",
+            "v1.0",
+            "A" * 32,
+            '{"name": "sys"}',
+        ),
+    )
+    items = [
+        {"system_id": system_id, "dataset": "prepared"},
+        {"system_id": system_id, "dataset": "nope"},
+    ]
+    dictcursor.execute(
+        "call get_system_data_definitions(%s, %s)", (auth0_id, json.dumps(items))
+    )
+    res = {r["dataset"]: r for r in dictcursor.fetchall()}
+    assert res["prepared"]["system_id"] == system_id
+    assert res["prepared"]["version"] == "v1.0"
+    assert res["prepared"]["status"] == "complete"
+    assert res["prepared"]["system_definition"] == '{"name": "sys"}'
+    assert json.loads(res["prepared"]["definition"]) == json.loads(system_def[1])
+    assert res["nope"]["system_definition"] is None
+    assert res["nope"]["version"] is None
+
+
+def test_get_system_data_definitions_bad_user(cursor, bad_user, system_id):
+    items = [{"system_id": system_id, "dataset": "prepared"}]
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call get_system_data_definitions(%s, %s)", (bad_user, json.dumps(items))
+        )
+    assert err.value.args[0] == 1142
+
+
+def test_queue_system_data_many(system_id, dictcursor, auth0_id):
+    items = [{"system_id": system_id, "dataset": "complete"}]
+    dictcursor.execute(
+        "call queue_system_data_many(%s, %s)", (auth0_id, json.dumps(items))
+    )
+    dictcursor.execute(
+        f'call get_system_data_meta("{auth0_id}", "{system_id}", "complete")'
+    )
+    assert dictcursor.fetchone()["status"] == "prepared"
+    # the stored results can still be reused by the queued job
+    dictcursor.execute(
+        "call get_system_data_definitions(%s, %s)", (auth0_id, json.dumps(items))
+    )
+    assert dictcursor.fetchone()["status"] == "complete"
+    dictcursor.execute(
+        f'call get_system_timeseries("{auth0_id}", "{system_id}", "complete")'
+    )
+    assert dictcursor.fetchone()["timeseries"] is not None
+
+    dictcursor.execute(
+        "call update_system_data(%s, %s, %s, %s, %s, %s, %s, %s, %s)",
+        (
+            auth0_id,
+            system_id,
+            "complete",
+            b"timeseries",
+            b"stats",
+            "[]",
+            "v1.0",
+            "A" * 32,
+            '{"name": "sys"}',
+        ),
+    )
+    dictcursor.execute(
+        f'call get_system_data_meta("{auth0_id}", "{system_id}", "complete")'
+    )
+    assert dictcursor.fetchone()["status"] == "complete"
+
+
+def test_queue_system_data_many_empty(cursor, auth0_id):
+    cursor.execute("call queue_system_data_many(%s, %s)", (auth0_id, "[]"))
+
+
+def test_queue_system_data_many_bad_id(cursor, auth0_id, system_id):
+    items = [
+        {"system_id": system_id, "dataset": "complete"},
+        {"system_id": str(uuid1()), "dataset": "complete"},
+    ]
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call queue_system_data_many(%s, %s)", (auth0_id, json.dumps(items))
+        )
+    assert err.value.args[0] == 1142
+
+
+def test_queue_system_data_many_bad_user(cursor, bad_user, system_id):
+    items = [{"system_id": system_id, "dataset": "complete"}]
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call queue_system_data_many(%s, %s)", (bad_user, json.dumps(items))
+        )
+    assert err.value.args[0] == 1142
@@ -304,3 +304,239 @@ def test_get_group_systems_group_dne(cursor, auth0_id):
     with pytest.raises(OperationalError) as err:
         cursor.execute("call get_group_systems(%s, %s)", (auth0_id, str(uuid1())))
         assert err.value.args[0] == 1142
+
+
+def test_get_system_group_data(dictcursor, auth0_id, group_id):
+    dictcursor.execute(
+        "call get_system_group_data(%s, %s, %s, %s)",
+        (auth0_id, group_id, "dataset", "timeseries"),
+    )
+    res = dictcursor.fetchone()
+    assert len(res["data_key"]) == 32
+    assert res["stored_data_key"] is None
+    assert res["data"] is None
+
+
+def test_update_system_group_data(dictcursor, auth0_id, group_id):
+    dictcursor.execute(
+        "call get_system_group_data(%s, %s, %s, %s)",
+        (auth0_id, group_id, "dataset", "statistics"),
+    )
+    key = dictcursor.fetchone()["data_key"]
+    for data in (b"stats", b"new stats"):
+        dictcursor.execute(
+            "call update_system_group_data(%s, %s, %s, %s, %s, %s, %s)",
+            (auth0_id, group_id, "dataset", "statistics", key, "v1.0", data),
+        )
+        dictcursor.execute(
+            "call get_system_group_data(%s, %s, %s, %s)",
+            (auth0_id, group_id, "dataset", "statistics"),
+        )
+        res = dictcursor.fetchone()
+        assert res["stored_data_key"].lower() == key
+        assert res["data_key"] == key
+        assert res["version"] == "v1.0"
+        assert res["data"] == data
+    dictcursor.execute(
+        "call get_system_group_data(%s, %s, %s, %s)",
+        (auth0_id, group_id, "dataset", "timeseries"),
+    )
+    assert dictcursor.fetchone()["data"] is None
+
+
+def test_system_group_data_key_membership(dictcursor, auth0_id, group_id, system_id):
+    dictcursor.execute(
+        "call get_system_group_data(%s, %s, %s, %s)",
+        (auth0_id, group_id, "dataset", "timeseries"),
+    )
+    key = dictcursor.fetchone()["data_key"]
+    dictcursor.execute(
+        "call remove_system_from_group(%s, %s, %s)", (auth0_id, system_id, group_id)
+    )
+    dictcursor.execute(
+        "call get_system_group_data(%s, %s, %s, %s)",
+        (auth0_id, group_id, "dataset", "timeseries"),
+    )
+    assert dictcursor.fetchone()["data_key"] != key
+
+
+def test_system_group_data_key_system_data(dictcursor, auth0_id, group_id, system_id):
+    dictcursor.execute(
+        "call get_system_group_data(%s, %s, %s, %s)",
+        (auth0_id, group_id, "prepared", "timeseries"),
+    )
+    key = dictcursor.fetchone()["data_key"]
+    dictcursor.execute(
+        "update system_data set system_hash = unhex(%s) where "
+        "system_id = uuid_to_bin(%s, 1) and dataset = %s",
+        ("A" * 32, system_id, "prepared"),
+    )
+    dictcursor.execute(
+        "call get_system_group_data(%s, %s, %s, %s)",
+        (auth0_id, group_id, "prepared", "timeseries"),
+    )
+    assert dictcursor.fetchone()["data_key"] != key
+
+
+def test_system_group_data_key_many_members(
+    dictcursor, auth0_id, user_id, group_id, system_def
+):
+    # more members than fit in the default group_concat_max_len
+    sysids = [str(uuid1()) for _ in range(12)]
+    for i, sysid in enumerate(sysids):
+        dictcursor.execute(
+            "insert into systems (id, user_id, name, definition) values "
+            "(uuid_to_bin(%s, 1), uuid_to_bin(%s, 1), %s, %s)",
+            (sysid, user_id, f"member {i}", system_def[1]),
+        )
+        dictcursor.execute(
+            "call add_system_to_group(%s, %s, %s)", (auth0_id, sysid, group_id)
+        )
+    dictcursor.execute(
+        "call get_group_data_key(%s, %s, %s)", (auth0_id, group_id, "complete")
+    )
+    key = dictcursor.fetchone()["data_key"]
+    dictcursor.execute(
+        "update systems set definition = %s where id = uuid_to_bin(%s, 1)",
+        (json.dumps({"version": "2", "other_parameters": []}), sysids[-1]),
+    )
+    dictcursor.execute(
+        "call get_group_data_key(%s, %s, %s)", (auth0_id, group_id, "complete")
+    )
+    newkey = dictcursor.fetchone()["data_key"]
+    assert newkey != key
+    dictcursor.execute(
+        "call remove_system_from_group(%s, %s, %s)", (auth0_id, sysids[-1], group_id)
+    )
+    dictcursor.execute(
+        "call get_group_data_key(%s, %s, %s)", (auth0_id, group_id, "complete")
+    )
+    assert dictcursor.fetchone()["data_key"] not in (key, newkey)
+
+
+def test_get_system_group_data_bad_user(cursor, bad_user, group_id):
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call get_system_group_data(%s, %s, %s, %s)",
+            (bad_user, group_id, "dataset", "timeseries"),
+        )
+    assert err.value.args[0] == 1142
+
+
+def test_update_system_group_data_bad_user(cursor, bad_user, group_id):
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call update_system_group_data(%s, %s, %s, %s, %s, %s, %s)",
+            (bad_user, group_id, "dataset", "timeseries", "A" * 32, "v1", b"data"),
+        )
+    assert err.value.args[0] == 1142
+
+
+def test_get_group_system_timeseries(dictcursor, auth0_id, group_id, system_id):
+    dictcursor.execute(
+        "call get_group_system_timeseries(%s, %s, %s)",
+        (auth0_id, group_id, "complete"),
+    )
+    res = dictcursor.fetchall()
+    assert len(res) == 1
+    assert res[0]["system_id"] == system_id
+    assert res[0]["timeseries"] == b"timeseries"
+
+
+def test_get_group_system_timeseries_missing(dictcursor, auth0_id, group_id, system_id):
+    dictcursor.execute(
+        "call get_group_system_timeseries(%s, %s, %s)",
+        (auth0_id, group_id, "no data"),
+    )
+    res = dictcursor.fetchall()
+    assert len(res) == 1
+    assert res[0]["system_id"] == system_id
+    assert res[0]["timeseries"] is None
+
+
+def test_get_group_system_timeseries_of(dictcursor, auth0_id, group_id, system_id):
+    dictcursor.execute(
+        "call get_group_system_timeseries_of(%s, %s, %s, %s)",
+        (auth0_id, group_id, "complete", json.dumps([system_id, str(uuid1())])),
+    )
+    res = dictcursor.fetchall()
+    assert len(res) == 1
+    assert res[0]["system_id"] == system_id
+    assert res[0]["timeseries"] == b"timeseries"
+    dictcursor.execute(
+        "call get_group_system_timeseries_of(%s, %s, %s, %s)",
+        (auth0_id, group_id, "complete", "[]"),
+    )
+    assert len(dictcursor.fetchall()) == 0
+
+
+def test_get_group_system_timeseries_of_bad_user(cursor, bad_user, group_id):
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call get_group_system_timeseries_of(%s, %s, %s, %s)",
+            (bad_user, group_id, "complete", "[]"),
+        )
+    assert err.value.args[0] == 1142
+
+
+def test_get_group_system_timeseries_bad_user(cursor, bad_user, group_id):
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call get_group_system_timeseries(%s, %s, %s)",
+            (bad_user, group_id, "complete"),
+        )
+    assert err.value.args[0] == 1142
+
+
+@pytest.mark.parametrize(
+    "dataset",
+    ["prepared", "complete", "statistics missing", "timeseries missing", "error"],
+)
+def test_get_group_system_data_meta(dictcursor, auth0_id, group_id, system_id, dataset):
+    dictcursor.execute(
+        "call get_group_system_data_meta(%s, %s, %s)",
+        (auth0_id, group_id, dataset),
+    )
+    res = dictcursor.fetchall()
+    assert len(res) == 1
+    assert res[0]["system_id"] == system_id
+    assert res[0]["dataset"] == dataset
+    assert res[0]["status"] == dataset
+    assert len(res[0]["current_system_hash"]) == 32
+
+
+def test_get_group_system_data_meta_no_data(dictcursor, auth0_id, group_id):
+    dictcursor.execute(
+        "call get_group_system_data_meta(%s, %s, %s)",
+        (auth0_id, group_id, "no data"),
+    )
+    assert len(dictcursor.fetchall()) == 0
+
+
+def test_get_group_system_data_meta_bad_user(cursor, bad_user, group_id):
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call get_group_system_data_meta(%s, %s, %s)",
+            (bad_user, group_id, "complete"),
+        )
+    assert err.value.args[0] == 1142
+
+
+def test_get_group_data_key(dictcursor, auth0_id, group_id):
+    dictcursor.execute(
+        "call get_system_group_data(%s, %s, %s, %s)",
+        (auth0_id, group_id, "complete", "timeseries"),
+    )
+    key = dictcursor.fetchone()["data_key"]
+    dictcursor.execute(
+        "call get_group_data_key(%s, %s, %s)", (auth0_id, group_id, "complete")
+    )
+    assert dictcursor.fetchone()["data_key"] == key
+
+
+def test_get_group_data_key_bad_user(cursor, bad_user, group_id):
+    with pytest.raises(OperationalError) as err:
+        cursor.execute(
+            "call get_group_data_key(%s, %s, %s)", (bad_user, group_id, "complete")
+        )
+    assert err.value.args[0] == 1142
@@ -9,6 +9,9 @@ import xarray as xr
 import zarr
 
 
+from esprr_api.data.nsrdb import NSRDBDataset
+
+
 # restrict data to this lat, lon range
 # nsrdb had no data over the ocean, so not a regular grid
 BOUNDARIES = ((31.0, 38.0), (-118.01, -103.01))
@@ -117,6 +120,7 @@ def main():
         data, coords={"lat": lat, "lon": lon, "elevation": elevation_da, "times": times}
     )
     ds.to_zarr(output_path, consolidated=True)
+    NSRDBDataset(output_path).build_grid()
     weather_file.close()
     irradiance_file.close()
 